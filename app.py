@@ -1,12 +1,27 @@
-from flask import Flask, render_template, request, jsonify, g
+from flask import Flask, render_template, request, jsonify, g, make_response
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 from datetime import datetime
-from utilities.db_access import get_db_connection, pool, get_channel_name_from_id
+from utilities.db_access import (
+    get_pooled_connection, release_connection, get_pool_stats,
+    invalidate_channel_directory,
+    get_data_version, bump_data_generation, refresh_search_view
+)
+from utilities.search_query import execute_search, execute_facet_counts, validate_sort
+from utilities.memory_search import memory_search_engine, get_search_backend, SEARCH_BACKEND_MEMORY
+from utilities.result_cache import SearchResultCache, make_search_cache_key
+from utilities.filter_options import filter_options_store, build_filter_options_from_db
+from utilities.title_index import restamp_title_index
+from utilities.jobs import JobConflictError, create_jobs_table, get_job, list_jobs, submit_job
+from utilities.http_cache import (
+    make_etag, is_not_modified, CACHE_CONTROL_OPTIONS, CACHE_CONTROL_SEARCH
+)
+from functools import wraps
 from contextlib import closing
 import os
 import sqlite3
 import unicodedata
 import logging
+import time
 import psycopg2
 from typing import Optional, Any
 from dotenv import load_dotenv
@@ -36,87 +51,139 @@ app.config['WTF_CSRF_HEADERS'] = ['X-CSRFToken', 'X-CSRF-Token']
 # CSRF保護を有効化
 csrf = CSRFProtect(app)
 
-
-def convert_to_embed_url(video_url: str) -> str:
-    """YouTubeの通常リンクからVIDEO_IDを抽出し、埋め込みリンクを生成する"""
-    if "watch?v=" in video_url:
-        video_id = video_url.split("watch?v=")[-1]
-        return f"https://www.youtube.com/embed/{video_id}"
-    return video_url  # 他のリンク形式の場合そのまま返す
+# /search の結果キャッシュ（データ世代が変わると破棄される）
+search_cache = SearchResultCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 512)),
+    max_bytes=int(os.getenv('SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+)
+# このプロセスが最後に確認したデータ世代
+_seen_data_generation = None
 
 
 def convert_activities(activities: list) -> list:
-    """アクティビティリストのデータを変換する"""
+    """アクティビティリストのデータを変換する
+
+    表示用の日付・埋め込みURL・チャンネル名は検索クエリで取得済みのため、
+    ここでは辞書への射影のみを行う。
+    """
     logger.info("Converting activities")
     result = []
 
     column_names = [
         "id", "title", "upload_date", "video_url", "view_count", 
-        "like_count", "duration", "channel_category"
-    ]  # カラム名を明示的に定義
+        "like_count", "duration", "channel_category", "channel_name"
+    ]  # カラム名を明示的に定義（upload_date / video_url は表示用に変換済みの値）
 
     for activity in activities:
         # zip() を使ってタプルを辞書に変換
         activity_dict = dict(zip(column_names, activity))
+        activity_dict["channel_category"] = activity_dict.pop("channel_name") or "Unknown Channel"
+        result.append(activity_dict)
 
-        dt = activity_dict["upload_date"].rstrip("Z")
-        try:
-            # 日本語形式（例: "2023年11月22日11時00分"）の場合
-            date_obj = datetime.strptime(dt, "%Y-%m-%dT%H:%M:%S")
-        except ValueError:
-            try:
-                date_obj = datetime.strptime(dt, "%Y年%m月%d日%H時%M分")
-            except ValueError:
-                logger.error(f"Unsupported date format: {dt}")
-                continue
-
-        # 必要に応じてフォーマットを変換して保存
-        activity_dict["upload_date"] = date_obj.strftime("%Y年%m月%d日%H時%M分")
-        activity_dict["video_url"] = convert_to_embed_url(activity_dict["video_url"])
-        # チャンネルIDを数値に変換してからチャンネル名を取得
+    return result
+
+
+def get_db() -> Optional[psycopg2.extensions.connection]:
+    """リクエスト単位の接続を取得する（プールから1本借りて g に保持し、teardownで返却）"""
+    if 'db' not in g:
         try:
-            channel_id = int(activity_dict["channel_category"]) if activity_dict["channel_category"] else None
-            if channel_id:
-                activity_dict["channel_category"] = get_channel_name_from_id(channel_id)
-            else:
-                activity_dict["channel_category"] = "Unknown Channel"
-        except (ValueError, TypeError):
-            activity_dict["channel_category"] = "Unknown Channel"
+            g.db = get_pooled_connection()
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {e}")
+            return None
+    return g.db
 
-        result.append(activity_dict)
 
-    return result
+def require_db() -> psycopg2.extensions.connection:
+    """get_db() と同じだが、接続できなければ psycopg2.OperationalError を送出する"""
+    conn = get_db()
+    if conn is None:
+        raise psycopg2.OperationalError("Failed to connect to database")
+    return conn
 
 
-def build_query_with_filters(base_query: str, filters: dict, params: list) -> tuple[str, list]:
-    """フィルタに基づいてクエリを構築する補助関数"""
-    if filters.get('type_filter'):
-        base_query += " AND cat.category_title = %s"
-        params.append(filters['type_filter'])
+def current_data_version() -> tuple:
+    """現在のデータ世代 (世代番号, 更新日時) を返す
 
-    if filters.get('players_filter'):
-        base_query += " AND cat.players = %s"
-        params.append(filters['players_filter'])
+    別プロセス（main.py など）の取り込みで世代が進んでいたら、
+    プロセス内のチャンネル一覧キャッシュを破棄し、インメモリ検索エンジンに読み直しを指示する
+    （読み直しの間は古いスナップショットで答える）。
+    """
+    global _seen_data_generation
+    try:
+        generation, updated_at = get_data_version()
+    except Exception as e:
+        logger.error(f"Failed to read data generation: {e}")
+        return _seen_data_generation or 0, None
+    if _seen_data_generation is not None and generation != _seen_data_generation:
+        logger.info(f"Data generation changed: {_seen_data_generation} -> {generation}")
+        invalidate_channel_directory()
+        memory_search_engine.mark_stale()
+    _seen_data_generation = generation
+    return generation, updated_at
 
-    if filters.get('level_filter'):
-        base_query += " AND cat.level = %s"
-        params.append(filters['level_filter'])
 
-    if filters.get('channel_filter'):
-        # チャンネルIDで検索
-        base_query += " AND cat.channel_brand_category = %s"
-        params.append(filters['channel_filter'])
+def current_data_generation() -> int:
+    """現在のデータ世代番号を返す"""
+    return current_data_version()[0]
 
-    return base_query, params
 
+def conditional_get(cache_control: str):
+    """読み取り系エンドポイントに ETag / Last-Modified / Cache-Control を付け、304 を返すデコレータ
 
-def get_db() -> Optional[psycopg2.extensions.connection]:
-    """データベース接続を取得する"""
+    ETag はデータ世代とリクエストパラメータだけで決まるため、
+    一致した場合はビュー関数を呼ばずに（DBに触れずに）304 を返す。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            generation, updated_at = current_data_version()
+            params = list(request.args.items(multi=True)) + [(k, str(v)) for k, v in kwargs.items()]
+            etag = make_etag(request.endpoint, generation, params)
+
+            if is_not_modified(etag, updated_at, request.if_none_match, request.if_modified_since):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # エラー応答はキャッシュさせない
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if updated_at is not None:
+                response.last_modified = updated_at
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def mark_data_updated() -> None:
+    """取り込み・更新の完了を記録し、各キャッシュを無効化する
+
+    search_view と絞り込みの選択肢はここで作り直してから世代を進める（各ワーカーは世代の変化を見て読み直す）。
+    """
     try:
-        return get_db_connection()
+        refresh_search_view()
     except Exception as e:
-        logger.error(f"Failed to connect to database: {e}")
-        return None
+        logger.error(f"Failed to refresh search view: {e}")
+    try:
+        build_filter_options_from_db()
+    except Exception as e:
+        logger.error(f"Failed to build filter options: {e}")
+        filter_options_store.invalidate()
+    try:
+        generation = bump_data_generation()
+    except Exception as e:
+        logger.error(f"Failed to bump data generation: {e}")
+        search_cache.clear()
+    else:
+        # チャンネル名の更新ではタイトルは変わらないため、タイトル検索インデックスは世代だけ付け替える
+        try:
+            restamp_title_index(generation - 1, generation)
+        except Exception as e:
+            logger.error(f"Failed to restamp title index: {e}")
+    invalidate_channel_directory()
 
 
 def execute_query(query: str, params: list = None) -> list:
@@ -138,107 +205,8 @@ def execute_query(query: str, params: list = None) -> list:
         pass
 
 
-def get_total_data_by_id(q: str, ids: list) -> int:
-    """IDリストに基づいて総データ数を取得"""
-    if not ids:
-        return 0
-
-    # プレースホルダを作成
-    placeholders = ', '.join(['%s'] * len(ids))
-    q_like = f"%{q}%" if q else None
-
-    # クエリの作成
-    query = f'''
-        SELECT count(*) FROM contents
-        WHERE ID IN ({placeholders})
-    '''
-
-    # パラメータをidsとして設定
-    params = ids
-
-    # qが指定されている場合、LIKE句を追加
-    if q:
-        query += " AND title LIKE %s"
-        params.append(q_like)
-
-    try:
-        result = execute_query(query, params)
-        return result[0][0] if result else 0
-    except Exception as e:
-        logger.error(f"Error getting total data: {e}")
-        return 0
-
-
-def get_data_by_id(q: str, ids: list, sort: str, offset: int, limit: int = None) -> list:
-    """IDリストに基づいてデータを取得"""
-    if not ids:
-        return []
-
-    # セキュリティ: sortパラメータのホワイトリスト検証
-    allowed_sort_columns = ['upload_date', 'view_count', 'like_count']
-    if sort not in allowed_sort_columns:
-        sort = 'upload_date'  # デフォルト値にフォールバック
-
-    # PostgreSQL では %s を使う
-    placeholders = ', '.join(['%s'] * len(ids))
-    q_like = f"%{q}%" if q else None
-
-    # クエリ構築
-    query = f'''
-        SELECT * FROM contents
-        WHERE ID IN ({placeholders})
-    '''
-    params = ids
-
-    if q:
-        query += " AND title LIKE %s"
-        params.append(q_like)
-
-    # セキュリティ: ホワイトリスト検証済みのsortカラムのみ使用
-    query += f" ORDER BY {sort} DESC LIMIT %s OFFSET %s"
-    params.extend([limit, offset])
-
-    # クエリ実行
-    return execute_query(query, params)
-
-
-def multi_search_total(q: str, filters: dict) -> int:
-    """複数のフィルタ条件に基づいて総データ数を取得"""
-    # JOINを使用してより適切な検索を実現
-    base_query = """
-        SELECT DISTINCT c.ID 
-        FROM contents c
-        JOIN category cat ON c.ID = cat.ID
-        JOIN cid ch ON cat.channel_brand_category = ch.id
-        WHERE 1=1
-    """
-    params = []
-    base_query, params = build_query_with_filters(base_query, filters, params)
-
-    rows = execute_query(base_query, params)
-    ids = [row[0] for row in rows]
-    return get_total_data_by_id(q, ids)
-
-
-def multi_search(q: str, filters: dict, sort: str, offset: int, limit: int) -> list:
-    """複数のフィルタ条件に基づいてデータを取得"""
-    # JOINを使用してより適切な検索を実現
-    base_query = """
-        SELECT DISTINCT c.ID 
-        FROM contents c
-        JOIN category cat ON c.ID = cat.ID
-        JOIN cid ch ON cat.channel_brand_category = ch.id
-        WHERE 1=1
-    """
-    params = []
-    base_query, params = build_query_with_filters(base_query, filters, params)
-
-    rows = execute_query(base_query, params)
-    ids = [row[0] for row in rows]
-    return get_data_by_id(q, ids, sort, offset, limit)
-
-
 @app.route('/search')
+@conditional_get(CACHE_CONTROL_SEARCH)
 def search_activities():
     
     query = request.args.get('q', '')
@@ -246,12 +214,8 @@ def search_activities():
     players_filter = request.args.get('players', '')
     level_filter = request.args.get('level', '')
     channel_filter = request.args.get('channel', '')
-    sort = request.args.get('sort', 'upload_date')
-    
     # セキュリティ: sortパラメータのホワイトリスト検証
-    allowed_sort_columns = ['upload_date', 'view_count', 'like_count']
-    if sort not in allowed_sort_columns:
-        sort = 'upload_date'  # デフォルト値にフォールバック
+    sort = validate_sort(request.args.get('sort', 'upload_date'))
     
     # セキュリティ: limitとoffsetの値検証
     try:
@@ -266,6 +230,11 @@ def search_activities():
     except (ValueError, TypeError):
         offset = 0
 
+    # キーセットページング用のカーソル（指定時はoffsetをSQLに使わず、表示件数の計算にのみ使う）
+    cursor = request.args.get('cursor') or None
+    # facets=1 のときはファセットごとの件数も返す
+    include_facets = request.args.get('facets') in ('1', 'true')
+
     filters = {
         'type_filter': type_filter,
         'players_filter': players_filter,
@@ -273,49 +242,59 @@ def search_activities():
         'channel_filter': channel_filter
     }
 
-    conn = get_db()
-    with closing(conn.cursor()) as c:  # ✅ カーソルのみ `closing` を使用
-        try:
-            if query:
-                if not any([type_filter, players_filter, level_filter, channel_filter]):
-                    query = unicodedata.normalize('NFKC', query.strip())
-
-                    c.execute('''
-                        SELECT count(*) FROM contents
-                        WHERE title ILIKE %s
-                    ''', ('%' + query + '%',))  # ✅ `?` → `%s` に修正 (PostgreSQL 用)
-
-                    total = c.fetchone()[0]
-
-                    # セキュリティ: sortパラメータは既にホワイトリスト検証済み
-                    c.execute(f'''
-                        SELECT * FROM contents
-                        WHERE title ILIKE %s
-                        ORDER BY {sort} DESC
-                        LIMIT %s OFFSET %s
-                    ''', ('%' + query + '%', limit, offset))
-
-                    activities = c.fetchall()
-                else:
-                    total = multi_search_total(query, filters)
-                    activities = multi_search(query, filters, sort, offset, limit)
-            else:
-                total = multi_search_total(query, filters)
-                activities = multi_search(query, filters, sort, offset, limit)
+    backend = get_search_backend()
+    cache_key = make_search_cache_key(
+        query, filters, sort, limit, offset, cursor, include_facets, backend
+    )
+    generation = current_data_generation()
+    cached = search_cache.get(cache_key, generation)
+    if cached is not None:
+        response = jsonify(cached)
+        response.headers['X-Cache'] = 'HIT'
+        return response
 
-        except psycopg2.Error as e:
-            logger.error("Error while executing search query: %s", e)
-            return jsonify({"error": "Database error"}), 500  # HTTP 500 を返す
+    try:
+        facets = None
+        if backend == SEARCH_BACKEND_MEMORY and memory_search_engine.available:
+            # インメモリエンジン（接続を借りるのは未読み込みのときだけ）
+            total, activities, next_cursor = memory_search_engine.search(
+                require_db, query, filters, sort, limit, offset, cursor
+            )
+            if include_facets:
+                facets = memory_search_engine.facet_counts(require_db, query, filters)
+        else:
+            conn = get_db()
+            if conn is None:
+                return jsonify({"error": "Database error"}), 500
+            # 件数とページを1回のクエリで取得
+            total, activities, next_cursor = execute_search(
+                conn, query, filters, sort, limit, offset, cursor
+            )
+            if include_facets:
+                # 全ファセットの件数を GROUPING SETS の1クエリで取得
+                facets = execute_facet_counts(conn, query, filters)
+    except ValueError as e:
+        logger.warning("Invalid search cursor: %s", e)
+        return jsonify({"error": "Invalid cursor"}), 400
+    except psycopg2.Error as e:
+        logger.error("Error while executing search query: %s", e)
+        return jsonify({"error": "Database error"}), 500  # HTTP 500 を返す
 
     current_display_count = len(activities) + offset
 
-    #conn.close()
-
-    return jsonify({
+    response = {
         "activities": convert_activities(activities),
         "total": total,
-        "current_display_count": current_display_count
-    })
+        "current_display_count": current_display_count,
+        "next_cursor": next_cursor
+    }
+    if facets is not None:
+        response["facets"] = facets
+    search_cache.put(cache_key, generation, response)
+
+    response = jsonify(response)
+    response.headers['X-Cache'] = 'MISS'
+    return response
 
 
 def save_feedback_to_db(feedback):
@@ -331,11 +310,15 @@ def save_feedback_to_db(feedback):
             conn.commit()
     except Exception as e:
         logger.error(f"Error saving feedback: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+
 
+def get_filter_options() -> dict:
+    """絞り込みの選択肢（取り込み時に事前計算したもの）を取得する"""
+    return filter_options_store.get(current_data_generation())
 
-# DBからユニークな値を取得する関数
+
+# 事前計算した選択肢からユニークな値を取得する関数
 def get_unique_values(column_name):
     try:
         # セキュリティ: カラム名のホワイトリスト検証
@@ -343,23 +326,8 @@ def get_unique_values(column_name):
         if column_name not in allowed_columns:
             logger.error(f"Invalid column name: {column_name}")
             return []
-        
-        conn = get_db()
-        if conn is None:
-            logger.error("Database connection failed")
-            return []
-        
-        cursor = conn.cursor()
-        # セキュリティ: ホワイトリスト検証済みのカラム名のみ使用
-        query = f"""
-            SELECT DISTINCT {column_name} 
-            FROM category 
-            WHERE {column_name} IS NOT NULL AND {column_name} != ''
-            ORDER BY {column_name} ASC
-        """
-        cursor.execute(query)
-        values = [row[0] for row in cursor.fetchall()]
-        cursor.close()
+
+        values = get_filter_options()[column_name]
         logger.info(f"Retrieved {len(values)} unique values for column {column_name}")
         return values
     except Exception as e:
@@ -367,39 +335,35 @@ def get_unique_values(column_name):
         return []
 
 
+def filter_options_response(key: str):
+    """選択肢の JSON 応答
+
+    読み込めない場合は空のリストではなく 500 を返す（conditional_get はエラー応答に ETag を付けないため、
+    ブラウザが空の選択肢をキャッシュして同じ世代の間ずっと使い続けることがない）。
+    """
+    try:
+        values = get_filter_options()[key]
+    except Exception as e:
+        logger.error(f"Error loading filter options ({key}): {e}")
+        return jsonify({"error": "Failed to load filter options"}), 500
+    return jsonify(values)
+
+
 # APIエンドポイント
 @app.route("/get_unique_values/<column>")
+@conditional_get(CACHE_CONTROL_OPTIONS)
 def get_unique_values_api(column):
     if column in ["category_title", "players"]:  # 安全のため制限
-        return jsonify(get_unique_values(column))
+        return filter_options_response(column)
     return jsonify({"error": "Invalid column"}), 400
 
 
 def get_levels():
     try:
-        conn = get_db()
-        if conn is None:
-            logger.error("Database connection failed")
-            return []
-        
-        with conn.cursor() as cursor:
-            # より厳密な重複排除とソート
-            cursor.execute("""
-                SELECT DISTINCT level,
-                    CASE 
-                        WHEN level = '小学生以上' THEN 1
-                        WHEN level = '中学生' THEN 2
-                        WHEN level = '高校生' THEN 3
-                        WHEN level = 'ユース' THEN 4
-                        ELSE 5
-                    END as sort_order
-                FROM category 
-                WHERE level IS NOT NULL AND level != '' 
-                ORDER BY sort_order, level
-            """)
-            levels = [{"level": row[0]} for row in cursor.fetchall()]
-            logger.info(f"Retrieved {len(levels)} unique levels")
-            return levels
+        # 表示順（小学生以上 → 中学生 → 高校生 → ユース → その他）は事前計算時に並べ替え済み
+        levels = get_filter_options()['levels']
+        logger.info(f"Retrieved {len(levels)} unique levels")
+        return levels
     except Exception as e:
         logger.error(f"Error loading level option: {e}")
         return []
@@ -407,28 +371,16 @@ def get_levels():
 
 # APIエンドポイント（JSONでチャネル一覧を返す）
 @app.route("/get_levels")
+@conditional_get(CACHE_CONTROL_OPTIONS)
 def get_levels_api():
-    return jsonify(get_levels())
+    return filter_options_response('levels')
 
 
 def get_channels():
     try:
-        conn = get_db()
-        if conn is None:
-            logger.error("Database connection failed")
-            return []
-        
-        with conn.cursor() as cursor:
-            # より厳密な重複排除とソート
-            cursor.execute("""
-                SELECT DISTINCT id, cname, clink 
-                FROM cid 
-                WHERE cname IS NOT NULL AND cname != '' 
-                ORDER BY id
-            """)
-            channels = [{"id": row[0], "channel_name": row[1], "channel_link": row[2]} for row in cursor.fetchall()]
-            logger.info(f"Retrieved {len(channels)} unique channels")
-            return channels
+        channels = get_filter_options()['channels']
+        logger.info(f"Retrieved {len(channels)} unique channels")
+        return channels
     except Exception as e:
         logger.error(f"Error loading channel option: {e}")
         return []
@@ -436,8 +388,33 @@ def get_channels():
 
 # APIエンドポイント（JSONでチャネル一覧を返す）
 @app.route("/get_channels")
+@conditional_get(CACHE_CONTROL_OPTIONS)
 def get_channels_api():
-    return jsonify(get_channels())
+    return filter_options_response('channels')
+
+
+@app.route("/bootstrap")
+def bootstrap():
+    """ページ表示に必要なデータ（CSRFトークンと全ての絞り込みの選択肢）を1回で返す
+
+    選択肢は事前計算済みのものをメモリから返すため、DBには問い合わせない。
+    CSRFトークンはリクエストごとに発行するため、レスポンスは共有キャッシュさせない。
+    """
+    try:
+        options = get_filter_options()
+    except Exception as e:
+        logger.error(f"Error loading filter options: {e}")
+        return jsonify({"error": "Failed to load filter options"}), 500
+
+    response = jsonify({
+        "csrf_token": generate_csrf(),
+        "category_title": options['category_title'],
+        "players": options['players'],
+        "levels": options['levels'],
+        "channels": options['channels'],
+    })
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
 
 @app.route("/debug/database-status")
 def debug_database_status():
@@ -490,6 +467,38 @@ def debug_database_status():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/debug/pool-stats")
+def debug_pool_stats():
+    """接続プールの統計情報を返すデバッグエンドポイント"""
+    return jsonify(get_pool_stats())
+
+
+@app.route('/reload-search-engine', methods=['POST'])
+def reload_search_engine():
+    """インメモリ検索エンジンをDBから再読み込みするエンドポイント（取り込み後に使用）"""
+    try:
+        conn = get_db()
+        if conn is None:
+            return jsonify({"error": "Database connection failed"}), 500
+        memory_search_engine.load(conn)
+        return jsonify({"message": "Search engine reloaded", **memory_search_engine.stats()})
+    except Exception as e:
+        logger.error(f"Error reloading search engine: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/debug/search-cache")
+def debug_search_cache():
+    """検索結果キャッシュのヒット/ミス数を返すデバッグエンドポイント"""
+    return jsonify(search_cache.stats())
+
+
+@app.route("/debug/search-engine")
+def debug_search_engine():
+    """検索バックエンドの状態を返すデバッグエンドポイント"""
+    return jsonify({"backend": get_search_backend(), "memory": memory_search_engine.stats()})
+
+
 @app.route('/get-csrf-token', methods=['GET'])
 def get_csrf_token():
     """CSRFトークンを取得するエンドポイント"""
@@ -539,14 +548,10 @@ def submit_feedback():
 
 
 def close_db(e: Optional[Any] = None) -> None:
-    """データベース接続を閉じる"""
+    """リクエストで借りた接続をプールに返す"""
     db = g.pop('db', None)
     if db is not None:
-        try:
-            pool.putconn(db)
-            logger.info("Database connection returned to pool")
-        except Exception as e:
-            logger.error(f"Error while closing database connection: {e}")
+        release_connection(db)
 
 
 @app.route('/')
@@ -672,13 +677,57 @@ def drop_soccer_tables():
         return jsonify({"error": str(e)}), 500
 
 
+def start_background_job(kind: str, params: Optional[dict] = None):
+    """時間のかかる処理を別プロセスのジョブとして開始し、ジョブIDを返す（202）
+
+    同じロックのジョブが実行中なら 409 と実行中のジョブIDを返す。進捗は /jobs/<job_id> で確認する。
+    """
+    try:
+        job_id = submit_job(kind, params)
+    except JobConflictError as e:
+        return jsonify({"error": str(e), "job_id": e.job_id,
+                        "status_url": f"/jobs/{e.job_id}" if e.job_id else None}), 409
+    except Exception as e:
+        logger.error(f"Error starting {kind} job: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"job_id": job_id, "kind": kind, "status_url": f"/jobs/{job_id}"}), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def jobs_endpoint():
+    """最近のジョブの一覧"""
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        return jsonify({"jobs": list_jobs(limit)})
+    except Exception as e:
+        logger.error(f"Error listing jobs: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """ジョブの状態（status・stage・rows_processed・elapsed_seconds、完了後は result / error）"""
+    try:
+        job = get_job(job_id)
+    except Exception as e:
+        logger.error(f"Error reading job {job_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
 @app.route('/init-database', methods=['POST'])
 def init_database():
     """データベースを初期化し、テーブルを作成するエンドポイント"""
     try:
         from utilities.db_access import (
             create_cid_table, create_contents_table, 
-            create_category_table, create_feedback_table
+            create_category_table, create_feedback_table, migrate_contents_table,
+            migrate_category_table, create_data_generation_table, create_search_view
         )
         
         # テーブルを作成
@@ -686,6 +735,13 @@ def init_database():
         create_contents_table()
         create_category_table()
         create_feedback_table()
+        create_data_generation_table()
+        create_jobs_table()
+        # 既存テーブルを現行スキーマに移行
+        migrate_contents_table()
+        migrate_category_table()
+        # 検索用の非正規化ビュー（移行後のカラムを参照する）
+        create_search_view()
         
         return jsonify({"message": "Database initialized successfully"})
         
@@ -696,42 +752,8 @@ def init_database():
 
 @app.route('/create-indexes', methods=['POST'])
 def create_indexes_endpoint():
-    """検索パフォーマンス向上のためのインデックスを作成するエンドポイント"""
-    try:
-        from utilities.create_indexes import (
-            check_pg_trgm_extension, check_existing_indexes, create_indexes
-        )
-        
-        conn = get_db()
-        if conn is None:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        # 既存インデックスの確認
-        existing_indexes = check_existing_indexes(conn)
-        
-        # pg_trgm拡張機能の確認・作成
-        pg_trgm_available = check_pg_trgm_extension(conn)
-        
-        # インデックスの作成
-        created, skipped, errors = create_indexes(conn)
-        
-        # 作成後のインデックス確認
-        final_indexes = check_existing_indexes(conn)
-        
-        return jsonify({
-            "message": "Index creation completed",
-            "pg_trgm_available": pg_trgm_available,
-            "created": created,
-            "skipped": skipped,
-            "errors": errors,
-            "existing_indexes_count": len(existing_indexes),
-            "final_indexes_count": len(final_indexes)
-        })
-        
-    except Exception as e:
-        logger.error(f"Error creating indexes: {e}")
-        import traceback
-        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+    """検索パフォーマンス向上のためのインデックスを作成するジョブを開始するエンドポイント"""
+    return start_background_job('create_indexes')
 
 
 @app.route('/test-simple', methods=['GET'])
@@ -771,120 +793,9 @@ def test_db_connection():
 
 @app.route('/fetch-youtube-data', methods=['POST'])
 def fetch_youtube_data():
-    """YouTubeデータを取得してデータベースに挿入するエンドポイント"""
-    try:
-        logger.info("Starting fetch-youtube-data endpoint")
-        
-        # インポート
-        try:
-            from utilities.get_videos import get_youtube_video_data
-            from utilities.db_access import insert_cid_data, insert_contents_data, insert_category_data
-            logger.info("Successfully imported required modules")
-        except ImportError as e:
-            logger.error(f"Import error: {e}")
-            return jsonify({"error": f"Import error: {e}"}), 500
-        
-        # チャンネルIDを取得（複数対応）
-        channel_ids_str = os.getenv('CHANNEL_ID')
-        logger.info(f"CHANNEL_ID from env: {channel_ids_str}")
-        
-        if not channel_ids_str:
-            logger.error("CHANNEL_ID not set")
-            return jsonify({"error": "CHANNEL_ID not set"}), 500
-            
-        # カンマ区切りのチャンネルIDを分割
-        channel_ids = [cid.strip() for cid in channel_ids_str.split(',')]
-        logger.info(f"Parsed channel IDs: {channel_ids}")
-        
-        # YouTubeデータを取得
-        api_keys = os.getenv('API_KEYS', '').split(',')  # カンマ区切りで複数のAPIキー
-        if not api_keys or api_keys[0] == '':
-            api_key = os.getenv('API_KEY')  # 単一のAPIキー（後方互換性）
-            api_keys = [api_key] if api_key else []
-        
-        if not api_keys:
-            logger.error("No API keys available")
-            return jsonify({"error": "No API keys available"}), 500
-            
-        logger.info(f"Available API keys: {len(api_keys)}")
-            
-        all_videos = []
-        total_videos = 0
-        processed_channels = 0
-        current_api_key_index = 0
-        
-        for i, channel_id in enumerate(channel_ids):
-            logger.info(f"Processing channel {i+1}/{len(channel_ids)}: {channel_id}")
-                
-            try:
-                # 各チャンネルからデータを取得
-                videos = get_youtube_video_data(channel_id, api_keys[current_api_key_index])
-                logger.info(f"Retrieved {len(videos) if videos else 0} videos from channel {channel_id}")
-            except Exception as e:
-                logger.error(f"Error getting videos from channel {channel_id}: {e}")
-                continue
-            
-            if videos:
-                all_videos.extend(videos)
-                total_videos += len(videos)
-                
-                try:
-                    # チャンネル情報を挿入（実際のチャンネル名を取得）
-                    from utilities.get_channel_id import get_channel_details
-                    channel_name = get_channel_details(channel_id, api_keys[current_api_key_index])
-                    if channel_name == "N/A":
-                        channel_name = f"サッカーチャンネル{i+1}"  # フォールバック
-                    channel_link = f"https://www.youtube.com/channel/{channel_id}"
-                    insert_cid_data(channel_id, channel_name, channel_link)
-                    logger.info(f"Inserted channel data for {channel_id} with name: {channel_name}")
-                    
-                    # 動画データを挿入
-                    insert_contents_data(videos, i+1)  # channel_category = i+1
-                    logger.info(f"Inserted {len(videos)} videos to contents table")
-                    
-                                                # カテゴリデータを挿入（main.pyと同じ処理）
-                    from utilities.update_category_db import update_category
-                    from utilities.db_access import search_content_table, create_category_table
-                    
-                    # カテゴリテーブルを作成
-                    create_category_table()
-                    
-                    # contentsテーブルからデータを取得
-                    contents = search_content_table()
-                    
-                    # update_category関数でカテゴリを自動判定
-                    contents_data = update_category(contents)
-                    
-                    # カテゴリデータを挿入
-                    insert_category_data(contents_data, i+1)
-                    logger.info(f"Inserted category data for {len(videos)} videos")
-                    
-                    processed_channels += 1
-                    logger.info(f"Successfully processed channel {channel_id} with {len(videos)} videos")
-                except Exception as e:
-                    logger.error(f"Error inserting data for channel {channel_id}: {e}")
-                    continue
-            else:
-                logger.warning(f"No videos found for channel {channel_id}")
-        
-        videos = all_videos  # 後続の処理のために設定
-        
-        if not videos:
-            return jsonify({"error": "No videos found"}), 500
-        
-        logger.info(f"Processing completed. Processed {processed_channels} channels with {len(videos)} total videos")
-        
-        return jsonify({
-            "message": f"Successfully processed {processed_channels} channels with {len(videos)} videos",
-            "count": len(videos),
-            "channels_processed": processed_channels
-        })
-        
-    except Exception as e:
-        logger.error(f"Error fetching YouTube data: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+    """YouTubeデータを取得してデータベースに挿入するジョブを開始するエンドポイント（?mode=incremental で差分のみ）"""
+    mode = 'incremental' if request.args.get('mode') == 'incremental' else 'full'
+    return start_background_job('fetch_youtube_data', {"mode": mode})
 
 
 @app.route('/debug-youtube', methods=['GET'])
@@ -892,6 +803,7 @@ def debug_youtube():
     """YouTube API接続をテストするデバッグエンドポイント"""
     try:
         from utilities.get_videos import fetch_videos_from_channel, fetch_video_details
+        from utilities.youtube_client import YouTubeAPIError, get_youtube_client
         
         # 環境変数を取得
         api_key = os.getenv('API_KEY')
@@ -908,7 +820,16 @@ def debug_youtube():
         
         # 最初のチャンネルでテスト
         test_channel_id = channel_ids[0]
-        channel_data = fetch_videos_from_channel(test_channel_id, api_key)
+        try:
+            channel_data = fetch_videos_from_channel(test_channel_id, api_key)
+        except YouTubeAPIError as e:
+            return jsonify({
+                "error": str(e),
+                "status_code": e.status_code,
+                "reason": e.reason,
+                "test_channel_id": test_channel_id,
+                "api_metrics": get_youtube_client().stats()
+            }), 502
         
         if not channel_data:
                     return jsonify({
@@ -937,7 +858,8 @@ def debug_youtube():
                     "title": items[0]['snippet']['title'],
                     "details": details[0] if details else None
                 },
-                "channel_data_keys": list(channel_data.keys())
+                "channel_data_keys": list(channel_data.keys()),
+                "api_metrics": get_youtube_client().stats()
             })
         else:
                     return jsonify({
@@ -956,9 +878,9 @@ def debug_youtube():
 def get_table_structure(table_name):
     """テーブルの構造を確認"""
     try:
-        from utilities.db_access import get_db_connection
-        
-        conn = get_db_connection()
+        conn = get_db()
+        if conn is None:
+            return jsonify({"error": "Database connection failed"}), 500
         cursor = conn.cursor()
         
         # テーブルの構造を取得
@@ -972,7 +894,6 @@ def get_table_structure(table_name):
         columns = cursor.fetchall()
         
         cursor.close()
-        conn.close()
         
         return jsonify({
             "table_name": table_name,
@@ -985,66 +906,14 @@ def get_table_structure(table_name):
 
 @app.route('/update-channel-names', methods=['POST'])
 def update_channel_names():
-    """既存のチャンネル名を実際のYouTubeチャンネル名で更新"""
-    try:
-        from utilities.get_channel_id import get_channel_details
-        from utilities.db_access import get_db_connection
-        
-        api_key = os.getenv('API_KEY')
-        if not api_key:
-            return jsonify({"error": "API key not set"}), 500
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 現在のチャンネル情報を取得
-        cursor.execute("SELECT cid FROM cid")
-        channels = cursor.fetchall()
-        
-        updated_count = 0
-        errors = []
-        
-        for (channel_id,) in channels:
-            try:
-                # 実際のチャンネル名を取得
-                channel_name = get_channel_details(channel_id, api_key)
-                
-                if channel_name != "N/A":
-                    # チャンネル名を更新（cnameカラムを使用）
-                    cursor.execute(
-                        "UPDATE cid SET cname = %s WHERE cid = %s",
-                        (channel_name, channel_id)
-                    )
-                    updated_count += 1
-                    logger.info(f"Updated channel {channel_id} to: {channel_name}")
-                else:
-                    errors.append(f"Could not get name for channel {channel_id}")
-                    
-            except Exception as e:
-                errors.append(f"Error updating {channel_id}: {str(e)}")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            "success": True,
-            "updated_count": updated_count,
-            "errors": errors
-        })
-        
-    except Exception as e:
-        logger.error(f"Error updating channel names: {e}")
-        import traceback
-        return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
+    """既存のチャンネル名を実際のYouTubeチャンネル名で更新するジョブを開始するエンドポイント"""
+    return start_background_job('update_channel_names')
 
 
 @app.route('/update-channel-names-manual', methods=['POST'])
 def update_channel_names_manual():
     """手動でチャンネル名を更新（.envファイルの情報を使用）"""
     try:
-        from utilities.db_access import get_db_connection
-        
         # .envファイルの情報に基づくチャンネル名マッピング
         channel_names = {
             'UCbOAexGZEFnMfgQZAomSrHQ': '雑誌『サッカークリニック』, web版 (『サックリ』)',
@@ -1058,7 +927,9 @@ def update_channel_names_manual():
             'UCq3OMmpMGUFCgTm0UFCtAFQ': 'イースリーショップ'
         }
         
-        conn = get_db_connection()
+        conn = get_db()
+        if conn is None:
+            return jsonify({"error": "Database connection failed"}), 500
         cursor = conn.cursor()
         
         updated_count = 0
@@ -1082,7 +953,7 @@ def update_channel_names_manual():
         
         conn.commit()
         cursor.close()
-        conn.close()
+        mark_data_updated()
         
         return jsonify({
             "success": True,
@@ -1096,7 +967,7 @@ def update_channel_names_manual():
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
 
-# アプリケーションコンテキストが終了したときに接続を閉じる
+# アプリケーションコンテキストが終了したときに接続をプールへ返す
 app.teardown_appcontext(close_db)
 
 
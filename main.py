@@ -1,12 +1,17 @@
-from utilities.get_videos import get_youtube_video_data
-from utilities.get_channel_id import get_channel_id, get_channel_details
-from utilities.db_access import create_cid_table, get_db_connection, insert_cid_data, create_contents_table, insert_contents_data, create_category_table, search_content_table, insert_category_data, create_feedback_table, delete_table
-from utilities.update_category_db import update_category
+from utilities.ingest import SearchPublisher, ingest_channels, log_channel_timings
+from utilities.response_store import get_response_mode, MODE_REPLAY
+from utilities.db_access import create_cid_table, get_db_connection, create_contents_table, create_category_table, migrate_category_table, create_feedback_table, create_data_generation_table, bump_data_generation, refresh_search_view, create_crawl_state_table, get_crawl_state, save_crawl_state, get_known_video_ids, use_write_schema, prepare_shadow_tables, build_shadow_indexes, swap_shadow_tables, drop_shadow_tables, SHADOW_SCHEMA
+from utilities.update_category_db import classify_contents
+from utilities.bulk_loader import BulkLoader
+from utilities.jobs import try_job_lock, INGEST_LOCK
+from utilities.title_index import build_title_index_from_db
+from utilities.filter_options import build_filter_options_from_db
 from flask import Flask
 import os
 import sys
 from dotenv import load_dotenv
 import logging
+import time
 
 app = Flask(__name__)
 
@@ -43,9 +48,20 @@ if __name__ == '__main__':
             
             api_key = os.getenv('API_KEY')
             
+            # 記録済みレスポンスの再生（YOUTUBE_RESPONSE_MODE=replay）では API キーを使わない
+            if get_response_mode() == MODE_REPLAY:
+                logger.info("Replaying recorded YouTube responses (offline ingest)")
+                api_key = api_key or 'replay'
+            
             # データベース接続は環境変数読み込み後に実行
             get_db_connection()
             
+            # /fetch-youtube-data のジョブと同時に取り込まないよう、終了までロックを持つ（接続を閉じると解放）
+            ingest_lock_conn = try_job_lock(INGEST_LOCK)
+            if ingest_lock_conn is None:
+                logger.error("Another ingest is running (lock is held). Try again later.")
+                sys.exit(1)
+            
             if not api_key:
                 logger.error("API key is missing. Please set it in the .env file.")
                 sys.exit(1)
@@ -55,71 +71,127 @@ if __name__ == '__main__':
             channels = channel_id.split(",")
             channel_links = channel_link.split(",")
             
-            # 既存のテーブルを削除してクリーンな状態から開始
-            logger.info("Cleaning existing tables...")
-            delete_table('feedback')
-            delete_table('category')
-            delete_table('contents')
-            delete_table('cid')
+            # 取り込みモード: full（既定）はシャドウテーブルに全件を取り込んでから入れ替え、
+            # incremental は前回の位置より新しい動画だけを取得して既存のテーブルに追加する
+            incremental = '--incremental' in sys.argv or os.getenv('INGEST_MODE') == 'incremental'
+            logger.info("Ingest mode: %s", "incremental" if incremental else "full (shadow rebuild)")
             
-            # テーブルを一度だけ作成
+            # テーブルを一度だけ作成（既にあれば何もしない。feedback などは作り直さない）
             logger.info("Creating tables...")
             create_cid_table()
             create_contents_table()
             create_category_table()
+            migrate_category_table()
             create_feedback_table()
+            create_data_generation_table()
+            create_crawl_state_table()
+            
+            if incremental:
+                crawl_states = {cid: get_crawl_state(cid) for cid in channels}
+                known_ids = get_known_video_ids()
+                logger.info("Loaded crawl state for %d channels, %d stored videos", len(channels), len(known_ids))
+            else:
+                # 公開中のテーブルには触れず、空のシャドウテーブルに書き込む
+                prepare_shadow_tables()
+                crawl_states, known_ids = {}, set()
+            
+            with use_write_schema(None if incremental else SHADOW_SCHEMA):
+                #########################################################
+                ## チャンネルデータ処理
+                #########################################################
+                # 取得はチャンネル・ページ単位で並行に行い（レートリミッターで制御）、
+                # 取得できたページから順に分類して書き込む（書き込みはチャンネル順）
+                fetch_started = time.perf_counter()
+                loader = BulkLoader()
+                # 差分取り込みは公開中のテーブルに書き込むため、途中までの結果も一定間隔で検索に出す
+                # （再構築はシャドウテーブルに書き込み、入れ替えるまで読み手に見せない）
+                fetch_results = ingest_channels(channels, api_key, loader, crawl_states=crawl_states,
+                                                known_ids=known_ids, channel_links=channel_links,
+                                                on_channel=SearchPublisher() if incremental else None)
+                new_videos = sum(result["written"] for result in fetch_results)  # 今回書き込んだ動画数
+                # 書き込みが終わってから保存するクロール状態
+                crawled = [(result["channel_id"], result["crawl_state"], result["video_count"])
+                           for result in fetch_results if not result["error"]]
+                log_channel_timings(fetch_results, time.perf_counter() - fetch_started)
+                
+                # 全チャンネルを取り込めなかった場合は入れ替えない（読み手に欠けたデータを見せない）
+                if not incremental and (loader.failed_batches or len(crawled) < len(channels)):
+                    logger.error("Rebuild incomplete (%d/%d channels, %d failed batches); keeping current tables",
+                                 len(crawled), len(channels), loader.failed_batches)
+                    drop_shadow_tables()
+                    sys.exit(1)
+                
+                #########################################################
+                ## カテゴリ分類処理
+                #########################################################
+                logger.info("Starting category classification...")
+                # 未分類の動画と、判定ルールが変わった動画だけを、サーバーサイドカーソルで少しずつ読んで分類する
+                classified = 0
+                try:
+                    classified = classify_contents(loader)
+                    logger.info("Category classification completed successfully")
+                except Exception as e:
+                    logger.error(f"Error during category classification: {e}")
+                    if not incremental:
+                        # 途中までしか分類していないテーブルは入れ替えない
+                        drop_shadow_tables()
+                        sys.exit(1)
+                if incremental and not new_videos and not classified:
+                    logger.info("No new videos; skipping rebuilds")
+                    for cid, state, videos_added in crawled:
+                        save_crawl_state(cid, state, videos_added)
+                    sys.exit(0)
+                logger.info("Bulk load: %s", loader.stats())
             
             #########################################################
-            ## チャンネルデータ処理
+            ## 検索用ビュー（search_view）の更新 / シャドウテーブルの入れ替え
             #########################################################
-            for c_num, cid in enumerate(channels, start=1):
+            if incremental:
                 try:
-                    logger.info(f"Processing channel {c_num}/{len(channels)}: {cid}")
-                    
-                    channel_name = get_channel_details(cid, api_key)
-                    if channel_name == "N/A":
-                        logger.error(f"Failed to retrieve channel name for {cid}")
-                        continue  # エラーが発生しても次のチャンネルを処理
-                    
-                    # チャンネル情報を挿入
-                    insert_cid_data(cid, channel_name, channel_links[c_num-1])
-                    
-                    # 動画データを取得
-                    video_data = get_youtube_video_data(cid, api_key)
-                    if video_data:
-                        insert_contents_data(video_data, c_num)
-                        logger.info(f"Inserted {len(video_data)} videos for channel {c_num}")
-                        
-
-                    else:
-                        logger.warning(f"No video data found for channel {c_num}")
-                        
+                    refresh_search_view()
                 except Exception as e:
-                    logger.error(f"Error processing channel {c_num} ({cid}): {e}")
-                    continue  # エラーが発生しても次のチャンネルを処理
+                    logger.error(f"Error refreshing search view: {e}")
+            else:
+                if loader.failed_batches:
+                    logger.error("Category load failed; keeping current tables")
+                    drop_shadow_tables()
+                    sys.exit(1)
+                # インデックス・統計情報・search_view を作ってから1トランザクションで入れ替える
+                build_shadow_indexes()
+                swap_shadow_tables()
+            
+            # 取り込んだ動画をコミットした後に位置を保存（書き込みに失敗したバッチがあれば次回取り直す）
+            if loader.failed_batches:
+                logger.error("Some batches failed to load; crawl state is not updated")
+            else:
+                for cid, state, videos_added in crawled:
+                    save_crawl_state(cid, state, videos_added)
             
             #########################################################
-            ## カテゴリ分類処理
+            ## 絞り込みの選択肢を事前計算（/bootstrap で配信）
             #########################################################
-            logger.info("Starting category classification...")
             try:
-                contents = search_content_table()
-                if contents:
-                    contents_data = update_category(contents)
-                    
-                    # 各動画に正しいチャンネルIDを割り当て
-                    for content in contents_data:
-                        if content.get("channel_id"):
-                            # 個別にカテゴリデータを挿入
-                            insert_category_data([content], content["channel_id"])
-                        else:
-                            logger.warning(f"No channel_id found for content {content['id']}")
-                    
-                    logger.info("Category classification completed successfully")
-                else:
-                    logger.warning("No contents found for category classification")
+                build_filter_options_from_db()
+            except Exception as e:
+                logger.error(f"Error building filter options: {e}")
+            
+            #########################################################
+            ## データ世代を進める（Webアプリの検索キャッシュを無効化）
+            #########################################################
+            generation = None
+            try:
+                generation = bump_data_generation()
             except Exception as e:
-                logger.error(f"Error during category classification: {e}")
+                logger.error(f"Error bumping data generation: {e}")
+            
+            #########################################################
+            ## タイトル検索インデックスの作成（公開した世代を記録。作り終えるまで検索は ILIKE）
+            #########################################################
+            if generation is not None:
+                try:
+                    build_title_index_from_db(generation=generation)
+                except Exception as e:
+                    logger.error(f"Error building title index: {e}")
             
             logger.info("All processes finished successfully")
             
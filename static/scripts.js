@@ -70,8 +70,8 @@ function setupFocusManagement() {
 document.addEventListener('DOMContentLoaded', async () => {
     console.log("DOM Content Loaded - Starting initialization");
     
-    // セキュリティ: CSRFトークンを事前に取得
-    await getCsrfToken();
+    // CSRFトークンと絞り込みの選択肢を1回のリクエストで取得
+    await loadBootstrap();
     
     displayCards([]); // 初期状態で「検索してください」を表示
     updatePaginationButtons(); // 初期化時にボタンを更新
@@ -80,26 +80,32 @@ document.addEventListener('DOMContentLoaded', async () => {
     setupKeyboardShortcuts(); // キーボードショートカットの設定
     setupFocusManagement(); // フォーカス管理の設定
     
-    // ドロップダウンの選択肢を設定（少し遅延させて確実に実行）
-    setTimeout(() => {
-        console.log("Populating dropdowns...");
-        populateChannelSelect(); // チャネル選択肢を設定
-        populateLevelSelect();
-        populateSelect("type-input", "category_title");  // カテゴリの選択肢を設定
-        populateSelect("players-input", "players");  // プレイヤー数の選択肢を設定
-    }, 100);
-    
     disableTabFocus(); // タブボタンのフォーカス無効化
-    
-    // 5秒後に再度実行（フォールバック）
-    setTimeout(() => {
-        console.log("Fallback: Re-populating dropdowns...");
+});
+
+// ページ表示に必要なデータを /bootstrap から取得して選択肢を設定する
+async function loadBootstrap() {
+    try {
+        const response = await fetch('/bootstrap');
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const data = await response.json();
+        csrfToken = data.csrf_token;
+        renderChannelSelect(data.channels);
+        renderLevelSelect(data.levels);
+        renderSelect("type-input", "category_title", data.category_title);
+        renderSelect("players-input", "players", data.players);
+    } catch (error) {
+        // フォールバック: 個別のエンドポイントから取得
+        console.error('初期データの取得に失敗しました:', error);
+        await getCsrfToken();
         populateChannelSelect();
         populateLevelSelect();
         populateSelect("type-input", "category_title");
         populateSelect("players-input", "players");
-    }, 5000);
-});
+    }
+}
 
 // ユニークな選択肢を取得・設定する関数
 function populateSelect(selectId, columnName) {
@@ -112,111 +118,94 @@ function populateSelect(selectId, columnName) {
             }
             return response.json();
         })
-        .then(data => {
-            console.log(`Received data for ${columnName}:`, data);
-            const select = document.getElementById(selectId);
-            if (!select) {
-                console.error(`Select element with id '${selectId}' not found`);
-                return;
-            }
-            
-            // 既存のoptionを完全にクリアしてから初期値をセット
-            select.innerHTML = '';
-            const defaultOption = document.createElement("option");
-            defaultOption.value = "";
-            defaultOption.textContent = selectId === "type-input" ? "カテゴリを選択" : "プレイヤー数を選択";
-            select.appendChild(defaultOption);
-
-            if (!Array.isArray(data) || data.length === 0) {
-                console.warn(`No data received for ${columnName}, using default options`);
-                // データが空の場合はデフォルト値を表示
-                if (selectId === "type-input") {
-                    const defaultOptions = ["対人", "その他"];
-                    defaultOptions.forEach(value => {
-                        const option = document.createElement("option");
-                        option.value = value;
-                        option.textContent = value;
-                        select.appendChild(option);
-                    });
-                }
-                return;
-            }
-
-            // 重複を除去したユニークな値のみを処理
-            const uniqueData = [...new Set(data)];
-            console.log(`Unique data for ${columnName}:`, uniqueData);
-
-            const n_vs_n = [];
-            const n_people = [];
-            const others = [];
-
-            uniqueData.forEach(value => {
-                let match;
-                if ((match = value.match(/^(\d+)対(\d+)$/))) {
-                    // "n対n" の形式を解析
-                    const num1 = parseInt(match[1], 10);
-                    const num2 = parseInt(match[2], 10);
-                    n_vs_n.push({ value, num1, num2 });
-                } else if ((match = value.match(/^(\d+)人$/))) {
-                    // "n人" の形式を解析
-                    const num = parseInt(match[1], 10);
-                    n_people.push({ value, num });
-                } else {
-                    // その他の値（例: "人数指定なし" など）
-                    others.push(value);
-                }
-            });
-
-            // 数値順にソート
-            n_vs_n.sort((a, b) => a.num1 - b.num1 || a.num2 - b.num2);
-            n_people.sort((a, b) => a.num - b.num);
-            
-            // カテゴリーの場合、「その他」を一番下に表示
-            let sortedOthers;
-            if (selectId === "type-input") {
-                const nonSonota = others.filter(value => value !== "その他").sort();
-                const sonota = others.filter(value => value === "その他");
-                sortedOthers = [...nonSonota, ...sonota];
-            } else {
-                sortedOthers = others.sort(); // プレイヤー数の場合は通常の文字列ソート
-            }
+        .then(data => renderSelect(selectId, columnName, data))
+        .catch(error => {
+            console.error(`${columnName} データ取得エラー:`, error);
+            // エラー時はデフォルトの選択肢を表示
+            renderSelect(selectId, columnName, []);
+        });
+}
 
-            // 並び替えたリストを `<select>` に追加
-            [...n_vs_n.map(obj => obj.value), ...n_people.map(obj => obj.value), ...sortedOthers].forEach(value => {
+// ユニークな選択肢を <select> に設定する関数
+function renderSelect(selectId, columnName, data) {
+    console.log(`Received data for ${columnName}:`, data);
+    const select = document.getElementById(selectId);
+    if (!select) {
+        console.error(`Select element with id '${selectId}' not found`);
+        return;
+    }
+    
+    // 既存のoptionを完全にクリアしてから初期値をセット
+    select.innerHTML = '';
+    const defaultOption = document.createElement("option");
+    defaultOption.value = "";
+    defaultOption.textContent = selectId === "type-input" ? "カテゴリを選択" : "プレイヤー数を選択";
+    select.appendChild(defaultOption);
+
+    if (!Array.isArray(data) || data.length === 0) {
+        console.warn(`No data received for ${columnName}, using default options`);
+        // データが空の場合はデフォルト値を表示
+        if (selectId === "type-input") {
+            const defaultOptions = ["対人", "その他"];
+            defaultOptions.forEach(value => {
                 const option = document.createElement("option");
                 option.value = value;
                 option.textContent = value;
                 select.appendChild(option);
             });
-            
-            console.log(`Successfully populated ${selectId} with ${data.length} options`);
-        })
-        .catch(error => {
-            console.error(`${columnName} データ取得エラー:`, error);
-            // エラー時にデフォルトの選択肢を追加
-            const select = document.getElementById(selectId);
-            if (select) {
-                select.innerHTML = '';
-                const defaultOption = document.createElement("option");
-                defaultOption.value = "";
-                defaultOption.textContent = selectId === "type-input" ? "カテゴリを選択" : "プレイヤー数を選択";
-                select.appendChild(defaultOption);
-                
-                if (selectId === "type-input") {
-                    const defaultOptions = ["対人", "その他"];
-                    defaultOptions.forEach(value => {
-                        const option = document.createElement("option");
-                        option.value = value;
-                        option.textContent = value;
-                        select.appendChild(option);
-                    });
-                }
-            }
-        });
-}
+        }
+        return;
+    }
 
+    // 重複を除去したユニークな値のみを処理
+    const uniqueData = [...new Set(data)];
+    console.log(`Unique data for ${columnName}:`, uniqueData);
+
+    const n_vs_n = [];
+    const n_people = [];
+    const others = [];
+
+    uniqueData.forEach(value => {
+        let match;
+        if ((match = value.match(/^(\d+)対(\d+)$/))) {
+            // "n対n" の形式を解析
+            const num1 = parseInt(match[1], 10);
+            const num2 = parseInt(match[2], 10);
+            n_vs_n.push({ value, num1, num2 });
+        } else if ((match = value.match(/^(\d+)人$/))) {
+            // "n人" の形式を解析
+            const num = parseInt(match[1], 10);
+            n_people.push({ value, num });
+        } else {
+            // その他の値（例: "人数指定なし" など）
+            others.push(value);
+        }
+    });
 
+    // 数値順にソート
+    n_vs_n.sort((a, b) => a.num1 - b.num1 || a.num2 - b.num2);
+    n_people.sort((a, b) => a.num - b.num);
+    
+    // カテゴリーの場合、「その他」を一番下に表示
+    let sortedOthers;
+    if (selectId === "type-input") {
+        const nonSonota = others.filter(value => value !== "その他").sort();
+        const sonota = others.filter(value => value === "その他");
+        sortedOthers = [...nonSonota, ...sonota];
+    } else {
+        sortedOthers = others.sort(); // プレイヤー数の場合は通常の文字列ソート
+    }
 
+    // 並び替えたリストを `<select>` に追加
+    [...n_vs_n.map(obj => obj.value), ...n_people.map(obj => obj.value), ...sortedOthers].forEach(value => {
+        const option = document.createElement("option");
+        option.value = value;
+        option.textContent = value;
+        select.appendChild(option);
+    });
+    
+    console.log(`Successfully populated ${selectId} with ${data.length} options`);
+}
 
 function populateLevelSelect() {
     console.log("Fetching levels...");
@@ -228,66 +217,54 @@ function populateLevelSelect() {
             }
             return response.json();
         })
-        .then(data => {
-            console.log("Received levels data:", data);
-            const select = document.getElementById("level-input");
-            if (!select) {
-                console.error("Level select element not found");
-                return;
-            }
-            
-            // 既存のoptionを完全にクリアしてから初期値をセット
-            select.innerHTML = '';
-            const defaultOption = document.createElement("option");
-            defaultOption.value = "";
-            defaultOption.textContent = "レベルを選択";
-            select.appendChild(defaultOption);
-            
-            if (!Array.isArray(data) || data.length === 0) {
-                console.warn("No levels data received, using default levels");
-                // データが空の場合はデフォルト値を表示
-                const defaultLevels = ["小学生以上", "中学生", "高校生", "ユース"];
-                defaultLevels.forEach(level => {
-                    const option = document.createElement("option");
-                    option.value = level;
-                    option.textContent = level;
-                    select.appendChild(option);
-                });
-                return;
-            }
-            
-            // 重複を除去したユニークなレベルのみを処理
-            const uniqueLevels = [...new Set(data.map(level => level.level))];
-            console.log("Unique levels:", uniqueLevels);
-            
-            uniqueLevels.forEach(level => {
-                const option = document.createElement("option");
-                option.value = level;
-                option.textContent = level;
-                select.appendChild(option);
-            });
-            console.log(`Successfully populated levels with ${uniqueLevels.length} unique options`);
-        })
+        .then(data => renderLevelSelect(data))
         .catch(error => {
             console.error("レベルデータ取得エラー:", error);
-            // エラー時にデフォルトの選択肢を追加
-            const select = document.getElementById("level-input");
-            if (select) {
-                select.innerHTML = '';
-                const defaultOption = document.createElement("option");
-                defaultOption.value = "";
-                defaultOption.textContent = "レベルを選択";
-                select.appendChild(defaultOption);
-                
-                const defaultLevels = ["小学生以上", "中学生", "高校生", "ユース"];
-                defaultLevels.forEach(level => {
-                    const option = document.createElement("option");
-                    option.value = level;
-                    option.textContent = level;
-                    select.appendChild(option);
-                });
-            }
+            // エラー時はデフォルトの選択肢を表示
+            renderLevelSelect([]);
+        });
+}
+
+// レベルの選択肢を <select> に設定する関数
+function renderLevelSelect(data) {
+    console.log("Received levels data:", data);
+    const select = document.getElementById("level-input");
+    if (!select) {
+        console.error("Level select element not found");
+        return;
+    }
+    
+    // 既存のoptionを完全にクリアしてから初期値をセット
+    select.innerHTML = '';
+    const defaultOption = document.createElement("option");
+    defaultOption.value = "";
+    defaultOption.textContent = "レベルを選択";
+    select.appendChild(defaultOption);
+    
+    if (!Array.isArray(data) || data.length === 0) {
+        console.warn("No levels data received, using default levels");
+        // データが空の場合はデフォルト値を表示
+        const defaultLevels = ["小学生以上", "中学生", "高校生", "ユース"];
+        defaultLevels.forEach(level => {
+            const option = document.createElement("option");
+            option.value = level;
+            option.textContent = level;
+            select.appendChild(option);
         });
+        return;
+    }
+    
+    // 重複を除去したユニークなレベルのみを処理
+    const uniqueLevels = [...new Set(data.map(level => level.level))];
+    console.log("Unique levels:", uniqueLevels);
+    
+    uniqueLevels.forEach(level => {
+        const option = document.createElement("option");
+        option.value = level;
+        option.textContent = level;
+        select.appendChild(option);
+    });
+    console.log(`Successfully populated levels with ${uniqueLevels.length} unique options`);
 }
 
 function populateChannelSelect() {
@@ -300,63 +277,7 @@ function populateChannelSelect() {
             }
             return response.json();
         })
-        .then(data => {
-            console.log("Received channels data:", data);
-            const select = document.getElementById("channel-input");
-            if (!select) {
-                console.error("Channel select element not found");
-                return;
-            }
-            
-            // 既存のoptionを完全にクリアしてから初期値をセット
-            select.innerHTML = '';
-            const defaultOption = document.createElement("option");
-            defaultOption.value = "";
-            defaultOption.textContent = "チャンネルを選択";
-            select.appendChild(defaultOption);
-            
-            if (!Array.isArray(data) || data.length === 0) {
-                console.warn("No channels data received");
-                return;
-            }
-            
-            // 重複を除去したユニークなチャンネルのみを処理
-            const uniqueChannels = data.filter((channel, index, self) => 
-                index === self.findIndex(c => c.id === channel.id)
-            );
-            console.log("Unique channels:", uniqueChannels);
-            
-            uniqueChannels.forEach(channel => {
-                const option = document.createElement("option");
-                option.value = channel.id;
-                option.textContent = channel.channel_name;
-                select.appendChild(option);
-            });
-            
-            const ul = document.querySelector(".right-half ul");
-            if (ul) {
-                // セキュリティ: innerHTML = "" は空文字列なので安全
-                ul.innerHTML = ""; // リストをクリア
-                data.forEach(channel => {
-                    const li = document.createElement("li");
-                    const a = document.createElement("a");
-                    a.textContent = channel.channel_name || '';
-                    // セキュリティ: URLの検証（http/httpsのみ許可）
-                    const channelLink = channel.channel_link || '';
-                    if (channelLink.startsWith('http://') || channelLink.startsWith('https://')) {
-                        a.href = channelLink;
-                    } else {
-                        a.href = '#'; // 無効なURLの場合は#に設定
-                    }
-                    a.target = "_blank"; // 新しいタブで開く
-                    a.rel = "noopener noreferrer"; // セキュリティ対策
-                    li.appendChild(a);
-                    ul.appendChild(li);
-                });
-            }
-            
-            console.log(`Successfully populated channels with ${data.length} options`);
-        })
+        .then(data => renderChannelSelect(data))
         .catch(error => {
             console.error("チャンネルデータ取得エラー:", error);
             // エラー時にデフォルトの選択肢を追加
@@ -379,6 +300,65 @@ function populateChannelSelect() {
         });
 }
 
+// チャンネルの選択肢とチャンネル一覧を設定する関数
+function renderChannelSelect(data) {
+    console.log("Received channels data:", data);
+    const select = document.getElementById("channel-input");
+    if (!select) {
+        console.error("Channel select element not found");
+        return;
+    }
+    
+    // 既存のoptionを完全にクリアしてから初期値をセット
+    select.innerHTML = '';
+    const defaultOption = document.createElement("option");
+    defaultOption.value = "";
+    defaultOption.textContent = "チャンネルを選択";
+    select.appendChild(defaultOption);
+    
+    if (!Array.isArray(data) || data.length === 0) {
+        console.warn("No channels data received");
+        return;
+    }
+    
+    // 重複を除去したユニークなチャンネルのみを処理
+    const uniqueChannels = data.filter((channel, index, self) => 
+        index === self.findIndex(c => c.id === channel.id)
+    );
+    console.log("Unique channels:", uniqueChannels);
+    
+    uniqueChannels.forEach(channel => {
+        const option = document.createElement("option");
+        option.value = channel.id;
+        option.textContent = channel.channel_name;
+        select.appendChild(option);
+    });
+    
+    const ul = document.querySelector(".right-half ul");
+    if (ul) {
+        // セキュリティ: innerHTML = "" は空文字列なので安全
+        ul.innerHTML = ""; // リストをクリア
+        data.forEach(channel => {
+            const li = document.createElement("li");
+            const a = document.createElement("a");
+            a.textContent = channel.channel_name || '';
+            // セキュリティ: URLの検証（http/httpsのみ許可）
+            const channelLink = channel.channel_link || '';
+            if (channelLink.startsWith('http://') || channelLink.startsWith('https://')) {
+                a.href = channelLink;
+            } else {
+                a.href = '#'; // 無効なURLの場合は#に設定
+            }
+            a.target = "_blank"; // 新しいタブで開く
+            a.rel = "noopener noreferrer"; // セキュリティ対策
+            li.appendChild(a);
+            ul.appendChild(li);
+        });
+    }
+    
+    console.log(`Successfully populated channels with ${data.length} options`);
+}
+
 // 数値フォーマット関数（例: 1000 → 1,000）
 function formatNumber(num) {
     if (!num && num !== 0) return '0';
@@ -515,7 +495,7 @@ function updateVideoCount(currentCount, totalCount) {
 }
 
 // データ取得処理
-function fetchData(endpoint, queryParams, limit) {
+function fetchData(endpoint, queryParams, limit, onSuccess) {
     showLoading();
     
     return fetch(`${endpoint}?${queryParams}`)
@@ -538,6 +518,9 @@ function fetchData(endpoint, queryParams, limit) {
                 throw new Error(data.error);
             }
             
+            if (onSuccess) {
+                onSuccess(data);
+            }
             displayCards(data.activities, limit);
             totalPages = Math.ceil(data.total / limit); // 総ページ数を計算
             updatePaginationButtons(); // ボタンの状態を更新
@@ -579,7 +562,10 @@ function togglePaginationVisibility(totalResults) {
 
 // 検索処理
 function search(resetPage = true) {
-    if (resetPage) currentPage = 1;
+    if (resetPage) {
+        currentPage = 1;
+        pageCursors = {};
+    }
 
     // 検索ボタンを無効化（重複リクエスト防止）
     const searchButton = document.getElementById('search-button');
@@ -603,10 +589,10 @@ function search(resetPage = true) {
     const channel = (channelInput.value || '').trim().substring(0, 100);
     
     // セキュリティ: sortパラメータのホワイトリスト検証（クライアント側）
-    const allowedSorts = ['upload_date', 'view_count', 'like_count'];
+    const allowedSorts = ['upload_date', 'view_count', 'like_count', 'relevance'];
     const sort = allowedSorts.includes(sortInput.value) ? sortInput.value : 'upload_date';
 
-    const queryParams = new URLSearchParams({
+    const params = new URLSearchParams({
         q: query,
         type: type,
         players: players,
@@ -615,9 +601,30 @@ function search(resetPage = true) {
         sort: sort,
         limit: getLimit(),
         offset: (currentPage - 1) * getLimit(),
-    }).toString();
+    });
+    // 検索条件が変わっていたら、以前の条件で受け取ったカーソルは使わない
+    const conditionKey = JSON.stringify([query, type, players, level, channel, sort, getLimit()]);
+    if (conditionKey !== pageCursorsKey) {
+        pageCursors = {};
+        pageCursorsKey = conditionKey;
+    }
+    // 前のページで受け取ったカーソルがあればキーセット方式で次ページを取得
+    if (pageCursors[currentPage]) {
+        params.set('cursor', pageCursors[currentPage]);
+    }
+    // 新しい検索のときだけファセット件数を取得（ページ移動では変わらない）
+    if (resetPage) {
+        params.set('facets', '1');
+    }
+    const queryParams = params.toString();
+    const requestedPage = currentPage;
 
-    fetchData('/search', queryParams, getLimit())
+    fetchData('/search', queryParams, getLimit(), (data) => {
+        pageCursors[requestedPage + 1] = data.next_cursor || null;
+        if (data.facets) {
+            updateFacetCounts(data.facets);
+        }
+    })
         .finally(() => {
             // 検索完了後にボタンを再有効化
             searchButton.disabled = false;
@@ -625,6 +632,33 @@ function search(resetPage = true) {
         });
 }
 
+// セレクトボックス ID -> /search の facets のキー
+const FACET_SELECTS = {
+    'type-input': 'category_title',
+    'players-input': 'players',
+    'level-input': 'level',
+    'channel-input': 'channel',
+};
+
+// 各選択肢に現在の検索条件での件数を表示（0件の組み合わせを選ばずに済むように）
+function updateFacetCounts(facets) {
+    Object.entries(FACET_SELECTS).forEach(([selectId, facetName]) => {
+        const select = document.getElementById(selectId);
+        const values = facets[facetName];
+        if (!select || !Array.isArray(values)) return;
+
+        const counts = new Map(values.map(item => [String(item.value), item.count]));
+        Array.from(select.options).forEach(option => {
+            if (!option.value) return;
+            if (option.dataset.label === undefined) {
+                option.dataset.label = option.textContent;
+            }
+            const count = counts.get(option.value) || 0;
+            option.textContent = `${option.dataset.label} (${count})`;
+        });
+    });
+}
+
 // 入力されたリミットを取得
 function getLimit() {
     const limitInput = parseInt(document.getElementById('limit-input').value, 10);
@@ -633,6 +667,9 @@ function getLimit() {
 
 let currentPage = 1;
 let totalPages = 1;
+// ページ番号 -> そのページを取得するためのカーソル（/search の next_cursor）
+let pageCursors = {};
+let pageCursorsKey = null;
 
 // ページ変更処理
 function goToPage(page) {
@@ -0,0 +1,43 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(mocker):
+    mocker.patch.object(app_module, 'current_data_version', return_value=(3, None))
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/get_levels', '/get_channels', '/get_unique_values/players'])
+def test_filter_option_errors_are_not_cached(mocker, client, path):
+    mocker.patch.object(app_module.filter_options_store, 'get', side_effect=RuntimeError('db down'))
+
+    response = client.get(path)
+
+    assert response.status_code == 500
+    assert 'ETag' not in response.headers
+    assert 'Cache-Control' not in response.headers
+
+
+def test_filter_options_are_served_with_etag(mocker, client):
+    mocker.patch.object(app_module.filter_options_store, 'get', return_value={'levels': [{'level': 'ユース'}]})
+
+    response = client.get('/get_levels')
+
+    assert response.status_code == 200
+    assert response.get_json() == [{'level': 'ユース'}]
+    assert response.headers['ETag']
+
+
+def test_memory_search_does_not_check_out_connection(mocker, client):
+    mocker.patch.object(app_module, 'get_search_backend', return_value=app_module.SEARCH_BACKEND_MEMORY)
+    get_db = mocker.patch.object(app_module, 'get_db', return_value=None)
+    search = mocker.patch.object(app_module.memory_search_engine, 'search', return_value=(0, [], None))
+
+    response = client.get('/search?q=pool-down-memory')
+
+    assert response.status_code == 200
+    assert response.get_json()['total'] == 0
+    assert search.call_args.args[0] is app_module.require_db
+    get_db.assert_not_called()
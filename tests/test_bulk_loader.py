@@ -0,0 +1,69 @@
+import psycopg2
+import pytest
+
+from utilities import bulk_loader, db_access
+from utilities.bulk_loader import BulkLoader, copy_value, load_batch
+
+
+def video(video_id, title='t'):
+    return {'id': video_id, 'title': title, 'upload_date': '2025-03-01T00:00:00Z',
+            'url': f'https://www.youtube.com/watch?v={video_id}', 'view_count': '12',
+            'like_count': 'N/A', 'duration': '0:01:00'}
+
+
+def make_conn(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    copied = {}
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.setdefault(sql, buffer.read())
+    return conn, cursor, copied
+
+
+def test_copy_value_escapes_text_format():
+    assert copy_value(None) == '\\N'
+    assert copy_value('a\tb\nc\\d') == 'a\\tb\\nc\\\\d'
+    assert copy_value(3) == '3'
+
+
+def test_load_batch_stages_with_copy_and_upserts_in_one_transaction(mocker):
+    conn, cursor, copied = make_conn(mocker)
+    contents = [bulk_loader.contents_record(video('v1', 'パス\t練習'), 2)]
+    categories = [bulk_loader.category_record({'id': 'v1', 'category': 'パス', 'nop': '2人', 'level': '中学生',
+                                               'channel_id': None, 'classifier_version': 'v1'}, 2)]
+
+    load_batch(conn, contents, categories)
+
+    contents_copy = copied['COPY contents_stage (' + ', '.join(bulk_loader.CONTENTS_COLUMNS) + ') FROM STDIN']
+    assert contents_copy == ('v1\tパス\\t練習\t2025-03-01T00:00:00Z\t2025年03月01日00時00分\t'
+                             'https://www.youtube.com/watch?v=v1\thttps://www.youtube.com/embed/v1\t12\t\\N\t0:01:00\t2\n')
+    assert copied['COPY category_stage (' + ', '.join(bulk_loader.CATEGORY_COLUMNS) + ') FROM STDIN'] == \
+        'v1\tパス\t2人\t中学生\t2\tv1\n'
+    executed = [call.args[0] for call in cursor.execute.call_args_list]
+    assert executed[1] == bulk_loader.CONTENTS_UPSERT and executed[3] == bulk_loader.CATEGORY_UPSERT
+    assert all('ON COMMIT DROP' in sql for sql in (executed[0], executed[2]))
+    conn.commit.assert_called_once()
+
+
+def test_load_batch_rolls_back_and_raises(mocker):
+    conn, cursor, _ = make_conn(mocker)
+    cursor.execute.side_effect = psycopg2.Error('boom')
+    with pytest.raises(psycopg2.Error):
+        load_batch(conn, [('v1',)], [])
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+
+
+def test_bulk_loader_flushes_per_batch(mocker):
+    batches = []
+    mocker.patch.object(bulk_loader, 'load_batch',
+                        side_effect=lambda conn, contents, categories: batches.append((len(contents), len(categories))))
+    mocker.patch.object(db_access, 'use_db_connection')
+
+    with BulkLoader(batch_size=3) as loader:
+        loader.add_contents([video('v1'), video('v2')], 1)
+        loader.add_categories([{'id': 'v1', 'category': 'c', 'nop': '', 'level': 'l', 'channel_id': 1}])
+        loader.add_contents([video('v3')], 1)
+
+    assert batches == [(2, 1), (1, 0)]
+    stats = loader.stats()
+    assert (stats['contents_rows'], stats['category_rows'], stats['batches']) == (3, 1, 2)
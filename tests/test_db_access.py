@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+
+import psycopg2
+import pytest
+from utilities import db_access
+
+
+@pytest.fixture
+def fake_pool(mocker):
+    conn_pool = mocker.Mock()
+    conn_pool._used = {}
+    conn_pool._pool = []
+    mocker.patch.object(db_access, 'pool', conn_pool)
+    mocker.patch.object(db_access, '_pool_pid', os.getpid())
+    mocker.patch.object(db_access, '_pool_slots', threading.BoundedSemaphore(2))
+    db_access._last_used.clear()
+    return conn_pool
+
+
+def make_conn(mocker, closed=0):
+    conn = mocker.Mock()
+    conn.closed = closed
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+def test_release_connection_rolls_back_open_transaction(mocker, fake_pool):
+    conn = make_conn(mocker)
+    conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    db_access.release_connection(conn)
+    conn.rollback.assert_called_once()
+    fake_pool.putconn.assert_called_once_with(conn)
+
+
+def test_get_pooled_connection_replaces_stale_connection(mocker, fake_pool):
+    stale = make_conn(mocker)
+    stale.cursor.return_value.__enter__ = mocker.Mock(side_effect=psycopg2.OperationalError("gone"))
+    stale.cursor.return_value.__exit__ = mocker.Mock(return_value=False)
+    fresh = make_conn(mocker)
+    fake_pool.getconn.side_effect = [stale, fresh]
+    # 長時間アイドルだった扱いにする
+    db_access._last_used[id(stale)] = -1e9
+
+    conn = db_access.get_pooled_connection()
+
+    assert conn is fresh
+    fake_pool.putconn.assert_called_once_with(stale, close=True)
+
+
+def test_get_pooled_connection_validates_replacement_from_pool(mocker, fake_pool):
+    def dead_conn():
+        conn = make_conn(mocker)
+        conn.cursor.return_value.__enter__ = mocker.Mock(side_effect=psycopg2.OperationalError("gone"))
+        conn.cursor.return_value.__exit__ = mocker.Mock(return_value=False)
+        return conn
+
+    stale, also_stale, fresh = dead_conn(), dead_conn(), make_conn(mocker)
+    fake_pool.getconn.side_effect = [stale, also_stale, fresh]
+    db_access._last_used[id(stale)] = -1e9
+    # 2本目は最近返却されたが、1本目が切れていたので確認する
+    db_access._last_used[id(also_stale)] = time.monotonic()
+
+    assert db_access.get_pooled_connection() is fresh
+    assert fake_pool.putconn.call_args_list == [mocker.call(stale, close=True),
+                                                mocker.call(also_stale, close=True)]
+
+
+def test_healthcheck_runs_without_holding_pool_lock(mocker, fake_pool):
+    conn = make_conn(mocker)
+    fake_pool.getconn.return_value = conn
+    db_access._last_used[id(conn)] = -1e9
+    lock_held = []
+    mocker.patch.object(db_access, '_is_connection_alive',
+                        side_effect=lambda c: lock_held.append(db_access._pool_lock.locked()) or True)
+
+    assert db_access.get_pooled_connection() is conn
+    assert lock_held == [False]
+
+
+def test_get_pooled_connection_waits_for_a_returned_connection(mocker, fake_pool):
+    mocker.patch.object(db_access, 'POOL_WAIT_SECONDS', 5)
+    fake_pool.getconn.side_effect = lambda: make_conn(mocker)
+    first = db_access.get_pooled_connection()
+    db_access.get_pooled_connection()
+
+    threading.Timer(0.05, db_access.release_connection, args=(first,)).start()
+    assert db_access.get_pooled_connection() is not None
+    assert fake_pool.getconn.call_count == 3
+
+
+def test_get_pooled_connection_times_out_when_pool_stays_exhausted(mocker, fake_pool):
+    mocker.patch.object(db_access, 'POOL_WAIT_SECONDS', 0.01)
+    fake_pool.getconn.side_effect = lambda: make_conn(mocker)
+    db_access.get_pooled_connection()
+    db_access.get_pooled_connection()
+
+    with pytest.raises(db_access.PoolError):
+        db_access.get_pooled_connection()
+    assert fake_pool.getconn.call_count == 2
+
+
+def test_get_pooled_connection_skips_check_for_recent_connection(mocker, fake_pool):
+    conn = make_conn(mocker)
+    fake_pool.getconn.return_value = conn
+    assert db_access.get_pooled_connection() is conn
+    conn.cursor.assert_not_called()
+
+
+def test_channel_directory_is_cached_until_invalidated(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [(1, 'Channel A', 'https://example.com/a')]
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+    db_access.invalidate_channel_directory()
+
+    assert db_access.get_channel_name_from_id(1) == 'Channel A'
+    assert db_access.get_channel_name_from_id(2) == 'Unknown Channel'
+    assert use_conn.call_count == 1
+
+    db_access.invalidate_channel_directory()
+    db_access.get_channel_name_from_id(1)
+    assert use_conn.call_count == 2
+
+
+def test_refresh_search_view_creates_missing_view_then_refreshes_concurrently(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    cursor.fetchone.side_effect = [(None, False), (1,)]
+    db_access.refresh_search_view()
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert any('CREATE MATERIALIZED VIEW IF NOT EXISTS search_view' in s for s in statements)
+    assert any('idx_search_view_id' in s for s in statements)
+    assert not any('REFRESH' in s for s in statements)
+
+    cursor.execute.reset_mock()
+    cursor.fetchone.side_effect = [(db_access.SEARCH_VIEW_VERSION, True)]
+    db_access.refresh_search_view()
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "REFRESH MATERIALIZED VIEW CONCURRENTLY search_view" in statements
+
+
+def test_refresh_search_view_recreates_outdated_definition(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    cursor.fetchone.side_effect = [('search_view v1', True), (1,)]
+    db_access.refresh_search_view()
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "DROP MATERIALIZED VIEW search_view" in statements
+    assert any('CREATE MATERIALIZED VIEW IF NOT EXISTS search_view' in s for s in statements)
+
+
+def test_write_schema_sets_and_resets_search_path(mocker, fake_pool):
+    conn = make_conn(mocker)
+    conn.cursor.return_value = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    fake_pool.getconn.return_value = conn
+
+    with db_access.use_write_schema(db_access.SHADOW_SCHEMA):
+        with db_access.use_db_connection():
+            pass
+    with db_access.use_db_connection():
+        pass
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert 'ingest_shadow' in repr(statements[0])
+    assert statements[1:] == ["RESET search_path"]
+    # SET はコミットしておき、呼び出し側のロールバックで元に戻らないようにする
+    assert conn.commit.call_count == 2
+
+
+def test_swap_shadow_tables_moves_everything_in_one_transaction(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = ('crawl_state',)
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    db_access.swap_shadow_tables()
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    retire = statements.index("ALTER TABLE IF EXISTS public.contents SET SCHEMA ingest_retired")
+    promote = statements.index("ALTER TABLE ingest_shadow.contents SET SCHEMA public")
+    assert retire < promote
+    assert "ALTER MATERIALIZED VIEW ingest_shadow.search_view SET SCHEMA public" in statements
+    assert "DELETE FROM public.crawl_state" in statements
+    assert not any('feedback' in s for s in statements)
+    assert statements[-1] == "DROP SCHEMA ingest_shadow"
+    conn.commit.assert_called_once()
+
+
+def test_swap_shadow_tables_rolls_back_on_error(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = [None, None, None, psycopg2.errors.LockNotAvailable()]
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    with pytest.raises(psycopg2.Error):
+        db_access.swap_shadow_tables()
+    conn.rollback.assert_called_once()
+    conn.commit.assert_not_called()
+
+
+def test_bulk_inserts_report_failed_writes(mocker):
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = mocker.MagicMock()
+    mocker.patch.object(db_access, 'load_batch', side_effect=psycopg2.OperationalError('gone'))
+    video = {'id': 'v1', 'title': 't', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}
+
+    with pytest.raises(psycopg2.Error):
+        db_access.insert_contents_data([video], 1)
+    with pytest.raises(psycopg2.Error):
+        db_access.insert_category_data([{'id': 'v1', 'category': 'パス', 'nop': '人数指定なし',
+                                         'level': '小学生以上'}], 1)
+
+
+def test_insert_cid_data_rolls_back_and_raises(mocker):
+    conn = mocker.MagicMock()
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError('gone')
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    with pytest.raises(psycopg2.Error):
+        db_access.insert_cid_data('UC1', 'name', 'link')
+    conn.rollback.assert_called_once()
@@ -0,0 +1,38 @@
+from utilities import filter_options
+from utilities.filter_options import (
+    FilterOptionsStore, load_filter_options, save_filter_options,
+    sort_category_titles, sort_levels, sort_players
+)
+
+
+def test_option_ordering():
+    assert sort_players(['人数指定なし', '10人', '2対1', '3人', '11対11', '1対1']) == \
+        ['1対1', '2対1', '11対11', '3人', '10人', '人数指定なし']
+    assert sort_category_titles(['その他', 'パス', 'シュート']) == ['シュート', 'パス', 'その他']
+    assert sort_levels(['ユース', 'プロ', '中学生', '小学生以上']) == ['小学生以上', '中学生', 'ユース', 'プロ']
+
+
+def test_store_reloads_file_only_when_generation_changes(mocker, tmp_path):
+    path = str(tmp_path / 'filter_options.json')
+    mocker.patch.dict('os.environ', {'FILTER_OPTIONS_PATH': path})
+    save_filter_options({'players': ['1対1']})
+    assert load_filter_options() == {'players': ['1対1']}
+
+    build = mocker.patch.object(filter_options, 'build_filter_options_from_db')
+    load = mocker.spy(filter_options, 'load_filter_options')
+    store = FilterOptionsStore()
+    assert store.get(1) == {'players': ['1対1']}
+    assert store.get(1) == {'players': ['1対1']}
+    assert load.call_count == 1
+
+    save_filter_options({'players': ['2対2']})
+    assert store.get(2) == {'players': ['2対2']}
+    build.assert_not_called()
+
+
+def test_store_builds_from_db_when_file_is_missing(mocker, tmp_path):
+    mocker.patch.dict('os.environ', {'FILTER_OPTIONS_PATH': str(tmp_path / 'missing.json')})
+    build = mocker.patch.object(filter_options, 'build_filter_options_from_db',
+                                return_value={'players': []})
+    assert FilterOptionsStore().get(1) == {'players': []}
+    build.assert_called_once()
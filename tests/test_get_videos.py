@@ -1,6 +1,24 @@
 import pytest
 import requests
-from utilities.get_videos import convert_duration, fetch_video_details, fetch_videos_from_channel
+from utilities import get_videos
+from utilities.get_videos import (
+    convert_duration, convert_to_embed_url, fetch_video_details, fetch_videos_from_channel,
+    format_upload_date, parse_count
+)
+from utilities.youtube_client import YouTubeAPIError, YouTubeClient
+
+
+def use_fake_session(mocker, *responses):
+    """共有クライアントを、指定したレスポンスを順に返すセッションのクライアントに差し替える"""
+    session = mocker.Mock()
+    session.get.side_effect = list(responses)
+    client = YouTubeClient(session=session, max_retries=1, sleep=lambda seconds: None)
+    mocker.patch.object(get_videos, 'get_youtube_client', return_value=client)
+    return session
+
+
+def json_response(mocker, data, status_code=200):
+    return mocker.Mock(status_code=status_code, headers={}, json=mocker.Mock(return_value=data))
 
 def test_convert_duration():
     assert convert_duration('PT1H2M3S') == '1:02:03'
@@ -8,21 +26,27 @@ def test_convert_duration():
     assert convert_duration('PT0S') == '0:00:00'
     assert convert_duration('InvalidDuration') == 'N/A'
 
+def test_display_fields_are_precomputed():
+    assert format_upload_date('2023-11-22T11:00:00Z') == '2023年11月22日11時00分'
+    assert format_upload_date('2023年11月22日11時00分') == '2023年11月22日11時00分'
+    assert format_upload_date('invalid') is None
+    assert convert_to_embed_url('https://www.youtube.com/watch?v=abc') == 'https://www.youtube.com/embed/abc'
+    assert parse_count('1200') == 1200
+    assert parse_count('N/A') is None
+
 def test_fetch_video_details(mocker):
-    mock_response = mocker.Mock()
-    mock_response.json.return_value = {'items': [{'id': 'video1', 'statistics': {'viewCount': '1000'}, 'contentDetails': {'duration': 'PT10M'}}]}
-    mocker.patch('requests.get', return_value=mock_response)
+    session = use_fake_session(mocker, json_response(mocker, {'items': [{'id': 'video1', 'statistics': {'viewCount': '1000'}, 'contentDetails': {'duration': 'PT10M'}}]}))
     api_key = 'test_api_key'
     video_ids = ['video1']
     details = fetch_video_details(video_ids, api_key)
     assert len(details) == 1
     assert details[0]['id'] == 'video1'
     assert details[0]['statistics']['viewCount'] == '1000'
+    assert session.get.call_args.kwargs['params']['id'] == 'video1'
+    assert session.get.call_args.kwargs['timeout'] > 0
 
 def test_fetch_videos_from_channel(mocker):
-    mock_response = mocker.Mock()
-    mock_response.json.return_value = {'items': [{'id': {'videoId': 'video1'}, 'snippet': {'title': 'Test Video', 'publishedAt': '2025-03-01T00:00:00Z'}}]}
-    mocker.patch('requests.get', return_value=mock_response)
+    use_fake_session(mocker, json_response(mocker, {'items': [{'id': {'videoId': 'video1'}, 'snippet': {'title': 'Test Video', 'publishedAt': '2025-03-01T00:00:00Z'}}]}))
     api_key = 'test_api_key'
     channel_id = 'test_channel_id'
     data = fetch_videos_from_channel(channel_id, api_key)
@@ -30,3 +54,8 @@ def test_fetch_videos_from_channel(mocker):
     assert len(data['items']) == 1
     assert data['items'][0]['id']['videoId'] == 'video1'
     assert data['items'][0]['snippet']['title'] == 'Test Video'
+
+def test_fetch_video_details_raises_instead_of_returning_empty(mocker):
+    use_fake_session(mocker, json_response(mocker, {}, 503), json_response(mocker, {}, 503))
+    with pytest.raises(YouTubeAPIError):
+        fetch_video_details(['video1'], 'test_api_key')
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.datastructures import ETags
+
+from utilities.http_cache import is_not_modified, make_etag
+
+
+def test_etag_depends_on_generation_and_params_not_order():
+    a = make_etag('search_activities', 3, [('q', 'パス'), ('sort', 'view_count')])
+    b = make_etag('search_activities', 3, [('sort', 'view_count'), ('q', 'パス')])
+    assert a == b
+    assert a.startswith('g3-')
+    assert make_etag('search_activities', 4, [('q', 'パス'), ('sort', 'view_count')]) != a
+    assert make_etag('search_activities', 3, [('q', '守備'), ('sort', 'view_count')]) != a
+
+
+def test_is_not_modified():
+    etag = make_etag('get_levels_api', 1, [])
+    updated_at = datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    since = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    assert is_not_modified(etag, updated_at, ETags([etag]), None)
+    assert not is_not_modified(etag, updated_at, ETags(['other']), since)
+    # If-None-Match がなければ If-Modified-Since で判定（秒未満は切り捨て）
+    assert is_not_modified(etag, updated_at, ETags(), since)
+    assert not is_not_modified(etag, updated_at, ETags(), since - timedelta(seconds=1))
+    assert not is_not_modified(etag, None, ETags(), since)
@@ -0,0 +1,317 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+
+from utilities import db_access, get_videos, ingest
+from utilities.youtube_client import QuotaExceededError, YouTubeClient
+
+
+def search_page(ids, next_token=None):
+    page = {'items': [
+        {'id': {'videoId': video_id},
+         'snippet': {'title': f'title {video_id}', 'channelId': 'ch', 'publishedAt': '2025-03-01T00:00:00Z'}}
+        for video_id in ids
+    ]}
+    if next_token:
+        page['nextPageToken'] = next_token
+    return page
+
+
+def test_video_details_are_fetched_on_executor_and_merged_in_page_order(mocker):
+    pages = {None: search_page(['v1', 'v2'], 'p2'), 'p2': search_page(['v3'])}
+    mocker.patch.object(get_videos, 'fetch_videos_from_channel',
+                        side_effect=lambda channel_id, api_key, token=None: pages[token])
+    detail_threads = set()
+
+    def fake_details(video_ids, api_key):
+        detail_threads.add(threading.current_thread().name)
+        return [{'id': v, 'statistics': {'viewCount': '10'}, 'contentDetails': {'duration': 'PT1M'}}
+                for v in video_ids]
+
+    mocker.patch.object(get_videos, 'fetch_video_details', side_effect=fake_details)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='details') as executor:
+        videos = get_videos.get_youtube_video_data('ch', 'key', executor, source='search')
+
+    assert [v['id'] for v in videos] == ['v1', 'v2', 'v3']
+    assert videos[0]['view_count'] == '10'
+    assert all(name.startswith('details') for name in detail_threads)
+
+
+def test_uploads_source_pages_playlist_and_uses_video_published_at(mocker):
+    mocker.patch.object(get_videos, 'fetch_uploads_playlist_id', return_value='UUch')
+    playlist_pages = {
+        None: {'items': [
+            {'snippet': {'title': 'new', 'publishedAt': '2025-05-01T00:00:00Z'},
+             'contentDetails': {'videoId': 'v2', 'videoPublishedAt': '2025-03-02T00:00:00Z'}},
+            {'snippet': {'title': 'Private video', 'publishedAt': '2025-05-01T00:00:00Z'},
+             'contentDetails': {'videoId': 'gone'}},
+        ], 'nextPageToken': 'p2'},
+        'p2': {'items': [
+            {'snippet': {'title': 'old', 'publishedAt': '2025-05-01T00:00:00Z'},
+             'contentDetails': {'videoId': 'v1', 'videoPublishedAt': '2025-03-01T00:00:00Z'}},
+        ]},
+    }
+    playlist = mocker.patch.object(get_videos, 'fetch_playlist_items',
+                                   side_effect=lambda playlist_id, key, token=None, etag=None: playlist_pages[token])
+    search = mocker.patch.object(get_videos, 'fetch_videos_from_channel')
+    details = mocker.patch.object(get_videos, 'fetch_video_details', return_value=[])
+
+    videos = get_videos.get_youtube_video_data('ch', 'key', source='uploads')
+
+    assert [(v['id'], v['upload_date']) for v in videos] == \
+        [('v2', '2025-03-02T00:00:00Z'), ('v1', '2025-03-01T00:00:00Z')]
+    assert playlist.call_count == 2
+    assert [c.args[0] for c in details.call_args_list] == [['v2'], ['v1']]
+    search.assert_not_called()
+
+
+def test_fetch_channels_yields_results_in_input_order(mocker):
+    mocker.patch.object(ingest, 'get_channel_details', side_effect=lambda cid, key: f'name {cid}')
+    release_first = threading.Event()
+
+    def fake_videos(channel_id, api_key, executor, crawl_state=None, known_ids=None):
+        if channel_id == 'a':
+            # 後ろのチャンネルが先に終わっても順番は変わらない
+            release_first.wait(timeout=5)
+        else:
+            release_first.set()
+        return [{'id': channel_id}]
+
+    mocker.patch.object(ingest, 'get_youtube_video_data', side_effect=fake_videos)
+    results = list(ingest.fetch_channels(['a', 'b'], 'key', channel_workers=2, detail_workers=1))
+    assert [r['channel_id'] for r in results] == ['a', 'b']
+    assert results[0]['channel_name'] == 'name a'
+    timings = ingest.channel_timings(results)
+    assert timings[1] == {'channel_id': 'b', 'videos': 1, 'seconds': results[1]['elapsed'], 'error': None}
+
+
+def test_incremental_fetch_stops_at_known_video_and_records_newest(mocker):
+    mocker.patch.object(get_videos, 'fetch_uploads_playlist_id', return_value='UUch')
+
+    def item(video_id, published_at):
+        return {'snippet': {'title': video_id}, 'contentDetails': {'videoId': video_id, 'videoPublishedAt': published_at}}
+
+    playlist_pages = {
+        None: {'etag': 'e2', 'nextPageToken': 'p2', 'items': [
+            item('new2', '2025-06-02T00:00:00Z'), item('new1', '2025-06-01T00:00:00Z'),
+            item('old', '2025-05-01T00:00:00Z'), item('older', '2025-04-01T00:00:00Z'),
+        ]},
+        'p2': {'items': [item('oldest', '2025-03-01T00:00:00Z')]},
+    }
+    playlist = mocker.patch.object(get_videos, 'fetch_playlist_items',
+                                   side_effect=lambda playlist_id, key, token=None, etag=None: playlist_pages[token])
+    mocker.patch.object(get_videos, 'fetch_video_details', return_value=[])
+    crawl_state = {'etag': 'e1', 'last_video_id': 'old'}
+
+    videos = get_videos.get_youtube_video_data('ch', 'key', source='uploads',
+                                               crawl_state=crawl_state, known_ids={'old'})
+
+    assert [v['id'] for v in videos] == ['new2', 'new1']
+    assert playlist.call_count == 1
+    assert playlist.call_args.args == ('UUch', 'key', None, 'e1')
+    assert crawl_state == {'etag': 'e2', 'uploads_playlist_id': 'UUch',
+                           'last_video_id': 'new2', 'last_published_at': '2025-06-02T00:00:00Z'}
+
+
+def test_incremental_fetch_returns_nothing_when_playlist_not_modified(mocker):
+    session = mocker.Mock()
+    session.get.return_value = mocker.Mock(status_code=304, headers={})
+    mocker.patch.object(get_videos, 'get_youtube_client', return_value=YouTubeClient(session=session))
+    details = mocker.patch.object(get_videos, 'fetch_video_details')
+    crawl_state = {'uploads_playlist_id': 'UUch', 'etag': 'e1', 'last_video_id': 'v1'}
+
+    videos = get_videos.get_youtube_video_data('ch', 'key', source='uploads', crawl_state=crawl_state)
+
+    assert videos == []
+    assert session.get.call_args.kwargs['headers'] == {'If-None-Match': 'e1'}
+    assert crawl_state['etag'] == 'e1' and crawl_state['last_video_id'] == 'v1'
+    details.assert_not_called()
+
+
+def test_quota_exceeded_skips_remaining_channels(mocker):
+    mocker.patch.object(ingest, 'get_channel_details', return_value='name')
+    videos = mocker.patch.object(ingest, 'get_youtube_video_data', side_effect=QuotaExceededError('quota'))
+
+    results = list(ingest.fetch_channels(['a', 'b', 'c'], 'key', channel_workers=1, detail_workers=1))
+
+    assert videos.call_count == 1
+    assert all(r['error'] for r in results)
+    assert results[2]['error'] == 'skipped: API quota exceeded'
+
+
+def playlist_item(video_id, published_at):
+    return {'snippet': {'title': video_id}, 'contentDetails': {'videoId': video_id, 'videoPublishedAt': published_at}}
+
+
+def test_video_pages_are_yielded_one_page_at_a_time(mocker):
+    mocker.patch.object(get_videos, 'fetch_uploads_playlist_id', return_value='UUch')
+    playlist_pages = {
+        None: {'nextPageToken': 'p2', 'items': [playlist_item('v3', '2025-03-03T00:00:00Z')]},
+        'p2': {'items': [playlist_item('v2', '2025-03-02T00:00:00Z'), playlist_item('v1', '2025-03-01T00:00:00Z')]},
+    }
+    mocker.patch.object(get_videos, 'fetch_playlist_items',
+                        side_effect=lambda playlist_id, key, token=None, etag=None: playlist_pages[token])
+    mocker.patch.object(get_videos, 'fetch_video_details', return_value=[])
+
+    pages = list(get_videos.iter_youtube_video_pages('ch', 'key', source='uploads'))
+
+    assert [[v['id'] for v in page] for page in pages] == [['v3'], ['v2', 'v1']]
+
+
+def test_incremental_fetch_ignores_stored_videos_newer_than_last_crawl(mocker):
+    # 前回の取り込みが途中で失敗し、new2 だけ書き込まれていた場合も new1 を取りこぼさない
+    mocker.patch.object(get_videos, 'fetch_uploads_playlist_id', return_value='UUch')
+    mocker.patch.object(get_videos, 'fetch_playlist_items', return_value={'items': [
+        playlist_item('new2', '2025-06-02T00:00:00Z'), playlist_item('new1', '2025-06-01T00:00:00Z'),
+        playlist_item('old', '2025-05-01T00:00:00Z'),
+    ]})
+    mocker.patch.object(get_videos, 'fetch_video_details', return_value=[])
+    crawl_state = {'last_video_id': 'old', 'last_published_at': datetime(2025, 5, 1, tzinfo=timezone.utc)}
+
+    videos = get_videos.get_youtube_video_data('ch', 'key', source='uploads', crawl_state=crawl_state,
+                                               known_ids={'new2', 'old'})
+
+    assert [v['id'] for v in videos] == ['new2', 'new1']
+
+
+def fake_channel_pages(mocker, pages_by_channel, names=None):
+    names = names or {}
+    mocker.patch.object(ingest, 'get_channel_details',
+                        side_effect=lambda cid, key: names.get(cid, f'name {cid}'))
+    mocker.patch.object(ingest, 'iter_youtube_video_pages',
+                        side_effect=lambda cid, key, executor, crawl_state=None, known_ids=None:
+                        iter(pages_by_channel[cid]))
+
+
+def test_stream_channels_yields_pages_in_channel_order(mocker):
+    fake_channel_pages(mocker, {
+        'a': [[{'id': 'a1'}], [{'id': 'a2'}]],
+        'b': [[{'id': 'b1'}], [{'id': 'b2'}], [{'id': 'b3'}]],
+    })
+
+    events = list(ingest.stream_channels(['a', 'b'], 'key', channel_workers=2, detail_workers=1, queue_pages=1))
+
+    assert [(cid, kind) for cid, kind, _ in events] == [
+        ('a', 'channel'), ('a', 'page'), ('a', 'page'), ('a', 'done'),
+        ('b', 'channel'), ('b', 'page'), ('b', 'page'), ('b', 'page'), ('b', 'done'),
+    ]
+    assert events[-1][2]['video_count'] == 3
+
+
+def test_stream_channels_stops_producers_when_reader_stops(mocker):
+    fake_channel_pages(mocker, {'a': [[{'id': f'a{i}'}] for i in range(100)]})
+    events = ingest.stream_channels(['a'], 'key', channel_workers=1, detail_workers=1, queue_pages=1)
+    assert next(events)[1] == 'channel'
+    finished = threading.Event()
+
+    def close():
+        events.close()
+        finished.set()
+
+    threading.Thread(target=close, daemon=True).start()
+    assert finished.wait(timeout=5)
+
+
+def test_ingest_channels_classifies_and_writes_each_page(mocker):
+    fake_channel_pages(mocker, {
+        'a': [[{'id': 'a1', 'title': '2対1', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}],
+              [{'id': 'a2', 'title': 'パス', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}]],
+        'b': [[{'id': 'b1', 'title': 'x', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}]],
+    }, names={'b': 'N/A'})
+    insert_cid = mocker.patch.object(db_access, 'insert_cid_data')
+    mocker.patch.object(db_access, 'get_channel_number', return_value=7)
+    loader = mocker.Mock()
+    on_page = mocker.Mock()
+
+    results = ingest.ingest_channels(['a', 'b'], 'key', loader, on_page=on_page)
+
+    insert_cid.assert_called_once_with('a', 'name a', 'https://www.youtube.com/channel/a')
+    assert [c.args for c in loader.add_contents.call_args_list] == [
+        ([{'id': 'a1', 'title': '2対1', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}], 7),
+        ([{'id': 'a2', 'title': 'パス', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}], 7),
+    ]
+    categories = [c.args[0][0] for c in loader.add_categories.call_args_list]
+    assert [(row['id'], row['category'], row['channel_id']) for row in categories] == \
+        [('a1', '対人', 7), ('a2', 'パス', 7)]
+    assert loader.flush.call_count == 2
+    assert on_page.call_args_list == [mocker.call(1), mocker.call(1)]
+    assert (results[0]['written'], results[0]['error']) == (2, None)
+    assert (results[1]['written'], results[1]['error']) == (0, 'channel name unavailable')
+
+
+def test_ingest_channels_skips_channel_when_registration_fails(mocker):
+    fake_channel_pages(mocker, {'a': [[{'id': 'a1', 'title': 'パス', 'upload_date': '2025-03-01T00:00:00Z',
+                                        'url': 'u'}]]})
+    mocker.patch.object(db_access, 'insert_cid_data', side_effect=psycopg2.OperationalError('gone'))
+    loader = mocker.Mock()
+
+    results = ingest.ingest_channels(['a'], 'key', loader)
+
+    loader.add_contents.assert_not_called()
+    assert results[0]['written'] == 0
+    assert results[0]['error'].startswith('failed to register channel')
+
+
+def test_stream_channels_reads_items_put_just_after_a_poll_timeout(mocker):
+    producer_done = threading.Event()
+
+    def producer(channel_id, api_key, pages, cancelled, *args):
+        pages.put(('channel', 'name'))
+        pages.put(('page', [{'id': 'a1'}]))
+        pages.put(('done', {'channel_id': channel_id, 'video_count': 1, 'error': None}))
+        producer_done.set()
+
+    class LateQueue(queue.Queue):
+        timed_out = False
+
+        def get(self, block=True, timeout=None):
+            if not LateQueue.timed_out:
+                # 取得側が最後の項目を入れて終わる前に、待ち時間が切れたことにする
+                LateQueue.timed_out = True
+                producer_done.wait(5)
+                time.sleep(0.05)  # future が done になるのを待つ
+                raise queue.Empty
+            return super().get(block, timeout)
+
+    mocker.patch.object(ingest, 'stream_channel', side_effect=producer)
+    mocker.patch.object(ingest.queue, 'Queue', LateQueue)
+
+    events = list(ingest.stream_channels(['a'], 'key', channel_workers=1, detail_workers=1, queue_pages=4))
+
+    assert [kind for _, kind, _ in events] == ['channel', 'page', 'done']
+
+
+def test_search_publisher_refreshes_view_at_most_once_per_interval(mocker):
+    refresh = mocker.patch.object(db_access, 'refresh_search_view')
+    bump = mocker.patch.object(db_access, 'bump_data_generation')
+    clock = mocker.patch.object(ingest.time, 'monotonic', return_value=100.0)
+    publisher = ingest.SearchPublisher(min_interval=60)
+
+    publisher({'written': 0})
+    assert refresh.call_count == 0  # 書き込みがなければ更新しない
+    publisher({'written': 5})
+    publisher({'written': 3})  # 間隔内はためておく
+    assert (refresh.call_count, bump.call_count, publisher.pending) == (1, 1, 3)
+
+    clock.return_value = 161.0
+    publisher({'written': 0})
+    assert (refresh.call_count, bump.call_count, publisher.pending) == (2, 2, 0)
+
+
+def test_ingest_channels_reports_each_finished_channel(mocker):
+    fake_channel_pages(mocker, {
+        'a': [[{'id': 'a1', 'title': 'パス', 'upload_date': '2025-03-01T00:00:00Z', 'url': 'u'}]],
+        'b': [],
+    })
+    mocker.patch.object(db_access, 'insert_cid_data')
+    mocker.patch.object(db_access, 'get_channel_number', return_value=1)
+    on_channel = mocker.Mock()
+
+    ingest.ingest_channels(['a', 'b'], 'key', mocker.Mock(), on_channel=on_channel)
+
+    assert [(c.args[0]['channel_id'], c.args[0]['written']) for c in on_channel.call_args_list] == \
+        [('a', 1), ('b', 0)]
@@ -0,0 +1,131 @@
+import psycopg2
+import pytest
+
+from utilities import job_tasks, jobs
+
+
+@pytest.fixture
+def fake_conn(mocker):
+    conn = mocker.MagicMock()
+    use_conn = mocker.patch.object(jobs, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+    return conn
+
+
+def test_create_job_reports_running_job_on_conflict(fake_conn):
+    cursor = fake_conn.cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = [psycopg2.errors.UniqueViolation(), None]
+    cursor.fetchone.return_value = ('running-job',)
+
+    with pytest.raises(jobs.JobConflictError) as excinfo:
+        jobs.create_job('fetch_youtube_data', {})
+
+    assert excinfo.value.job_id == 'running-job'
+    # 2回目の問い合わせは同じロック名の実行中ジョブを探す
+    assert cursor.execute.call_args.args[1] == ('ingest', jobs.ACTIVE_STATUSES)
+
+
+def test_update_job_rejects_unknown_fields(fake_conn):
+    with pytest.raises(ValueError):
+        jobs.update_job('job', lock_name='x')
+
+
+def test_update_job_sets_finished_at_and_serializes_result(fake_conn):
+    cursor = fake_conn.cursor.return_value.__enter__.return_value
+    jobs.update_job('job', status=jobs.STATUS_SUCCEEDED, result={'count': 3})
+    query, values = cursor.execute.call_args.args
+    assert 'finished_at = CURRENT_TIMESTAMP' in query
+    assert values == ('succeeded', '{"count": 3}', 'job')
+
+
+def test_run_job_records_result_and_releases_lock(mocker):
+    lock_conn = mocker.Mock()
+    mocker.patch.object(jobs, 'try_job_lock', return_value=lock_conn)
+    update = mocker.patch.object(jobs, 'update_job')
+
+    def task(params, progress):
+        progress.stage('fetch')
+        progress.add_rows(5)
+        return {'count': params['n']}
+
+    mocker.patch.dict(job_tasks.JOB_TASKS, {'fetch_youtube_data': task})
+    mocker.patch.dict('os.environ', {'JOB_HEARTBEAT_SECONDS': '60'})
+    jobs.run_job('job', 'fetch_youtube_data', {'n': 5})
+
+    assert update.call_args_list[0] == mocker.call('job', status='running', stage='starting')
+    assert update.call_args_list[-1] == mocker.call('job', status='succeeded', stage='done',
+                                                    rows_processed=5, result={'count': 5})
+    lock_conn.close.assert_called_once()
+
+
+def test_run_job_records_failure(mocker):
+    mocker.patch.object(jobs, 'try_job_lock', return_value=mocker.Mock())
+    update = mocker.patch.object(jobs, 'update_job')
+    mocker.patch.dict(job_tasks.JOB_TASKS, {'create_indexes': mocker.Mock(side_effect=RuntimeError('boom'))})
+
+    jobs.run_job('job', 'create_indexes', {})
+
+    update.assert_called_with('job', status='failed', error='boom')
+
+
+def test_run_job_fails_without_running_task_when_lock_is_held(mocker):
+    mocker.patch.object(jobs, 'try_job_lock', return_value=None)
+    update = mocker.patch.object(jobs, 'update_job')
+    task = mocker.Mock()
+    mocker.patch.dict(job_tasks.JOB_TASKS, {'fetch_youtube_data': task})
+
+    jobs.run_job('job', 'fetch_youtube_data', {})
+
+    task.assert_not_called()
+    assert update.call_args.kwargs['status'] == 'failed'
+
+
+def test_submit_job_starts_detached_process(mocker):
+    mocker.patch.object(jobs, 'create_jobs_table')
+    mocker.patch.object(jobs, 'expire_stale_jobs')
+    mocker.patch.object(jobs, 'create_job', return_value='job')
+    popen = mocker.patch.object(jobs.subprocess, 'Popen')
+
+    assert jobs.submit_job('fetch_youtube_data', {'mode': 'incremental'}) == 'job'
+
+    args = popen.call_args.args[0]
+    assert args[1:] == ['-m', 'utilities.jobs', 'job', 'fetch_youtube_data', '{"mode": "incremental"}']
+    # Web ワーカーの終了・シグナルと切り離す
+    assert popen.call_args.kwargs['start_new_session'] is True
+
+
+def test_job_entry_point_runs_job_from_arguments(mocker):
+    run_job = mocker.patch.object(jobs, 'run_job')
+    mocker.patch.object(jobs.sys, 'argv', ['jobs', 'job', 'create_indexes', '{"n": 1}'])
+    jobs.main()
+    run_job.assert_called_once_with('job', 'create_indexes', {'n': 1})
+
+
+def test_submit_job_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        jobs.submit_job('drop_everything')
+
+
+def test_every_job_kind_has_a_task():
+    assert set(jobs.JOB_LOCKS) == set(job_tasks.JOB_TASKS)
+
+
+def test_update_channel_names_commits_each_channel_before_the_next_api_call(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('UC1',), ('UC2',), ('UC3',)]
+    use_conn = mocker.patch('utilities.db_access.use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+    events = []
+    conn.commit.side_effect = lambda: events.append('commit')
+    names = {'UC1': 'One', 'UC2': 'N/A', 'UC3': 'Three'}
+    mocker.patch('utilities.get_channel_id.get_channel_details',
+                 side_effect=lambda cid, key: events.append(cid) or names[cid])
+    mocker.patch.object(job_tasks, 'publish_data_update', return_value=2)
+    mocker.patch('utilities.title_index.restamp_title_index')
+    mocker.patch.dict('os.environ', {'API_KEY': 'key'})
+
+    result = job_tasks.update_channel_names({}, mocker.Mock())
+
+    assert events == ['UC1', 'commit', 'UC2', 'UC3', 'commit']
+    assert result['updated_count'] == 2
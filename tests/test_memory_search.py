@@ -0,0 +1,190 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utilities.memory_search import MemorySearchEngine, SearchSnapshot
+from utilities.search_query import decode_cursor
+
+NO_FILTERS = {'type_filter': '', 'players_filter': '', 'level_filter': '', 'channel_filter': ''}
+
+
+def record(video_id, title, day, views, category, players='人数指定なし', level='小学生以上',
+           channel=1, in_category=True):
+    upload_date = datetime(2025, 1, day, tzinfo=timezone.utc)
+    return (
+        video_id, title, f'2025年01月{day:02d}日00時00分', f'https://www.youtube.com/embed/{video_id}',
+        views, None, '0:05:00', channel, f'Channel {channel}',
+        upload_date, category, players, level, channel, in_category, float(np.log1p(views or 0)),
+    )
+
+
+@pytest.fixture
+def snapshot():
+    return SearchSnapshot([
+        record('a', 'パス練習', 1, 300, 'パス'),
+        record('b', 'ドリブル練習', 2, 100, 'ドリブル', channel=2),
+        record('c', 'ＰＡＳＳ and パス', 3, None, 'パス'),
+        record('d', '2対1 パス', 4, 200, '対人', players='2対1', in_category=False),
+    ])
+
+
+def test_keyword_search_is_normalized_and_sorted(snapshot):
+    total, rows, _ = snapshot.search('パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert total == 3
+    assert [row[0] for row in rows] == ['d', 'c', 'a']
+
+    total, rows, _ = snapshot.search('pass', NO_FILTERS, 'upload_date', 10, 0)
+    assert [row[0] for row in rows] == ['c']
+
+
+def test_filters_use_facet_masks_and_require_category(snapshot):
+    filters = dict(NO_FILTERS, type_filter='パス')
+    total, rows, _ = snapshot.search('', filters, 'view_count', 10, 0)
+    assert total == 2
+    # NULL の再生数は最後
+    assert [row[0] for row in rows] == ['a', 'c']
+
+    total, _, _ = snapshot.search('', NO_FILTERS, 'upload_date', 10, 0)
+    assert total == 3  # category のない 'd' は除外
+
+    total, rows, _ = snapshot.search('', dict(NO_FILTERS, channel_filter='2'), 'upload_date', 10, 0)
+    assert [row[0] for row in rows] == ['b']
+
+    total, rows, _ = snapshot.search('', dict(NO_FILTERS, level_filter='ユース'), 'upload_date', 10, 0)
+    assert (total, rows) == (0, [])
+
+
+def test_cursor_pages_match_offset_pages(snapshot):
+    total, first, next_cursor = snapshot.search('', NO_FILTERS, 'upload_date', 2, 0)
+    assert [row[0] for row in first] == ['c', 'b']
+    assert decode_cursor(next_cursor, 'upload_date')[1] == 'b'
+
+    _, second, _ = snapshot.search('', NO_FILTERS, 'upload_date', 2, 0, next_cursor)
+    _, by_offset, _ = snapshot.search('', NO_FILTERS, 'upload_date', 2, 2)
+    assert second == by_offset == [snapshot.row(0)]
+
+
+def test_facet_counts_exclude_own_filter(snapshot):
+    facets = snapshot.facet_counts('', dict(NO_FILTERS, type_filter='パス'))
+    # category_title は自分のフィルタを無視して数える
+    assert facets['category_title'] == [{'value': 'ドリブル', 'count': 1}, {'value': 'パス', 'count': 2}]
+    # channel は category_title=パス で絞る
+    assert facets['channel'] == [{'value': 1, 'count': 2}, {'value': 2, 'count': 0}]
+
+
+def test_relevance_ranks_category_matches_before_incidental_titles(snapshot):
+    # 'd' は再生数が多いが「対人」に分類されているため、「パス」に分類された動画の後ろ
+    total, rows, next_cursor = snapshot.search('パス', NO_FILTERS, 'relevance', 10, 0)
+    assert total == 3
+    assert [row[0] for row in rows] == ['a', 'c', 'd']
+    assert next_cursor is None
+
+    _, rows, _ = snapshot.search('パス', NO_FILTERS, 'relevance', 1, 1)
+    assert [row[0] for row in rows] == ['c']
+
+
+
+def test_null_upload_dates_sort_last_across_cursor_pages():
+    undated = [record(video_id, 'パス', 1, 1, 'パス') for video_id in ('x', 'y', 'z')]
+    undated = [row[:9] + (None,) + row[10:] for row in undated]
+    snapshot = SearchSnapshot([record('a', 'パス', 1, 1, 'パス'), record('b', 'パス', 2, 1, 'パス')] + undated)
+
+    seen, next_cursor = [], None
+    while True:
+        _, rows, next_cursor = snapshot.search('', NO_FILTERS, 'upload_date', 2, 0, cursor=next_cursor)
+        seen.extend(row[0] for row in rows)
+        if next_cursor is None:
+            break
+    assert seen == ['b', 'a', 'z', 'y', 'x']
+
+
+def test_rows_are_rebuilt_from_columns(snapshot):
+    assert snapshot.row(2) == ('c', 'ＰＡＳＳ and パス', '2025年01月03日00時00分', 'https://www.youtube.com/embed/c',
+                               None, None, '0:05:00', 1, 'Channel 1')
+
+
+def test_concurrent_first_searches_load_once(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+
+    def slow_fetchall():
+        time.sleep(0.05)
+        return [record('a', 'パス', 1, 1, 'パス')]
+
+    cursor.fetchall.side_effect = slow_fetchall
+    connect = mocker.Mock(return_value=conn)
+    engine = MemorySearchEngine()
+
+    threads = [threading.Thread(target=engine.search, args=(connect, '', NO_FILTERS, 'upload_date', 10, 0))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert connect.call_count == 1
+    assert cursor.execute.call_count == 1
+
+
+def test_loaded_snapshot_does_not_connect(mocker, snapshot):
+    engine = MemorySearchEngine()
+    engine._snapshot = snapshot
+    connect = mocker.Mock(side_effect=AssertionError('should not connect'))
+
+    total, _, _ = engine.search(connect, 'パス', NO_FILTERS, 'upload_date', 10, 0)
+    engine.facet_counts(connect, 'パス', NO_FILTERS)
+
+    assert total == 3
+    connect.assert_not_called()
+
+
+def test_search_during_reload_uses_previous_snapshot(mocker, snapshot):
+    reload_started = threading.Event()
+    release_reload = threading.Event()
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+
+    def blocked_fetchall():
+        reload_started.set()
+        release_reload.wait(5)
+        return [record('z', '新しいパス', 5, 1, 'パス')]
+
+    cursor.fetchall.side_effect = blocked_fetchall
+    use_db_connection = mocker.patch('utilities.db_access.use_db_connection')
+    use_db_connection.return_value.__enter__.return_value = conn
+    connect = mocker.Mock(side_effect=AssertionError('should not connect'))
+    engine = MemorySearchEngine()
+    engine._snapshot = snapshot
+
+    engine.mark_stale()
+    assert reload_started.wait(5)
+    assert engine.stale
+    total, rows, _ = engine.search(connect, 'パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert total == 3
+    assert [row[0] for row in rows] == ['d', 'c', 'a']
+
+    release_reload.set()
+    engine._reload_thread.join(5)
+    total, rows, _ = engine.search(connect, 'パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert [row[0] for row in rows] == ['z']
+    assert not engine.stale
+    assert cursor.execute.call_count == 1
+    connect.assert_not_called()
+
+
+def test_failed_reload_keeps_previous_snapshot(mocker, snapshot):
+    use_db_connection = mocker.patch('utilities.db_access.use_db_connection')
+    use_db_connection.return_value.__enter__.side_effect = RuntimeError('pool exhausted')
+    engine = MemorySearchEngine()
+    engine._snapshot = snapshot
+
+    engine.mark_stale()
+    engine._reload_thread.join(5)
+
+    assert engine.stale
+    total, _, _ = engine.search(mocker.Mock(), 'パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert total == 3
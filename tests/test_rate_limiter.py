@@ -0,0 +1,39 @@
+import pytest
+
+from utilities.rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_burst_is_free_then_requests_are_spaced_by_rate():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire() == pytest.approx(0.5)
+    assert limiter.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(1.0)
+    assert limiter.stats()["waits"] == 2
+
+
+def test_tokens_refill_while_idle():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=1, burst=2, clock=clock, sleep=clock.sleep)
+    limiter.acquire(2)
+    clock.now += 10
+    # 容量（2）を超えて貯まらない
+    assert limiter.acquire(2) == 0
+    assert limiter.acquire() == pytest.approx(1.0)
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
@@ -0,0 +1,30 @@
+from utilities import get_videos
+from utilities.response_store import MODE_RECORD, MODE_REPLAY, ResponseStore, make_response_key
+from utilities.youtube_client import YouTubeAPIError, YouTubeClient
+
+import pytest
+
+
+def test_key_ignores_api_key_and_param_order():
+    assert make_response_key('videos', {'key': 'a', 'id': 'v1', 'part': 'statistics'}) == \
+        make_response_key('videos', {'part': 'statistics', 'id': 'v1', 'key': 'b'})
+    assert make_response_key('videos', {'id': 'v1'}) != make_response_key('videos', {'id': 'v2'})
+    assert make_response_key('videos', {'id': 'v1'}) != make_response_key('search', {'id': 'v1'})
+
+
+def test_recorded_responses_replay_without_network(mocker, tmp_path):
+    session = mocker.Mock()
+    session.get.return_value = mocker.Mock(status_code=200, headers={},
+                                           json=mocker.Mock(return_value={'items': [{'id': 'v1'}]}))
+    recorder = YouTubeClient(session=session, store=ResponseStore(str(tmp_path), MODE_RECORD))
+    mocker.patch.object(get_videos, 'get_youtube_client', return_value=recorder)
+    assert get_videos.fetch_video_details(['v1'], 'live-key') == [{'id': 'v1'}]
+
+    offline = mocker.Mock()
+    store = ResponseStore(str(tmp_path), MODE_REPLAY)
+    mocker.patch.object(get_videos, 'get_youtube_client', return_value=YouTubeClient(session=offline, store=store))
+    assert get_videos.fetch_video_details(['v1'], 'other-key') == [{'id': 'v1'}]
+    with pytest.raises(YouTubeAPIError):
+        get_videos.fetch_video_details(['v2'], 'other-key')
+    offline.get.assert_not_called()
+    assert store.stats() == {'mode': MODE_REPLAY, 'hits': 1, 'misses': 1, 'writes': 0}
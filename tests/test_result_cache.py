@@ -0,0 +1,35 @@
+from utilities.result_cache import SearchResultCache, make_search_cache_key
+
+NO_FILTERS = {'type_filter': '', 'players_filter': '', 'level_filter': '', 'channel_filter': ''}
+
+
+def test_cache_key_is_canonicalized():
+    a = make_search_cache_key(' ＧＫ ', NO_FILTERS, 'upload_date', 10, 0)
+    b = make_search_cache_key('gk', dict(NO_FILTERS), 'upload_date', 10, 0)
+    c = make_search_cache_key('gk', NO_FILTERS, 'upload_date', 10, 10)
+    assert a == b
+    assert a != c
+
+
+def test_hits_misses_and_generation_invalidation():
+    cache = SearchResultCache()
+    key = make_search_cache_key('パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert cache.get(key, 1) is None
+    cache.put(key, 1, {"total": 3})
+    assert cache.get(key, 1) == {"total": 3}
+    # 取り込みで世代が進むと丸ごと破棄
+    assert cache.get(key, 2) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 2, 1)
+
+
+def test_lru_eviction_by_entries():
+    cache = SearchResultCache(max_entries=2)
+    for i in range(3):
+        cache.put(('k', i), 1, {"i": i})
+    cache.get(('k', 1), 1)
+    cache.put(('k', 3), 1, {"i": 3})
+    assert cache.get(('k', 0), 1) is None
+    assert cache.get(('k', 2), 1) is None
+    assert cache.get(('k', 1), 1) == {"i": 1}
+    assert cache.stats()["evictions"] == 2
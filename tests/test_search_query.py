@@ -0,0 +1,167 @@
+import pytest
+from utilities.search_query import (
+    build_search_query, decode_cursor, encode_cursor, execute_search, normalize_query, validate_sort
+)
+
+NO_FILTERS = {'type_filter': '', 'players_filter': '', 'level_filter': '', 'channel_filter': ''}
+
+
+def test_validate_sort_falls_back_to_upload_date():
+    assert validate_sort('view_count') == 'view_count'
+    assert validate_sort('title; DROP TABLE contents') == 'upload_date'
+
+
+def test_normalize_query_applies_nfkc():
+    assert normalize_query('  ＰＫ戦 ') == 'PK戦'
+
+
+def test_keyword_only_search_reads_view_without_category_restriction():
+    query, params = build_search_query('パス', NO_FILTERS, 'view_count', 10, 20)
+    assert 'COUNT(*) OVER()' in query
+    assert 'FROM search_view c' in query
+    assert 'JOIN' not in query
+    assert 'c.in_category' not in query
+    assert ' IN (' not in query
+    assert 'ORDER BY COALESCE(c.view_count, -1) DESC, c.id DESC' in query
+    assert params == ['%パス%', 10, 20]
+
+
+def test_filtered_search_restricts_to_categorized_rows_and_binds_filters():
+    filters = dict(NO_FILTERS, type_filter='パス', channel_filter='2')
+    query, params = build_search_query('', filters, 'upload_date', 10, 0)
+    assert 'JOIN' not in query
+    assert 'c.in_category' in query
+    assert 'c.category_title = %s' in query
+    assert 'c.channel_brand_category = %s' in query
+    assert params == ['パス', '2', 10, 0]
+
+
+def test_execute_search_strips_window_total(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        ('id1', 'title', '2025-01-01T00:00:00Z', 'url', 1, 2, '0:01:00', 1, 'ch', '2025-01-01T00:00:00Z', 42)
+    ]
+    total, rows, next_cursor = execute_search(conn, 'パス', NO_FILTERS, 'upload_date', 10, 0)
+    assert total == 42
+    assert rows == [('id1', 'title', '2025-01-01T00:00:00Z', 'url', 1, 2, '0:01:00', 1, 'ch')]
+    assert next_cursor is None
+    assert cursor.execute.call_count == 1
+
+
+def test_execute_search_counts_separately_past_last_page(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = []
+    cursor.fetchone.return_value = (5,)
+    total, rows, next_cursor = execute_search(conn, '', NO_FILTERS, 'upload_date', 10, 100)
+    assert total == 5
+    assert rows == []
+    assert next_cursor is None
+
+
+def test_cursor_round_trip_and_sort_mismatch():
+    token = encode_cursor('view_count', 1200, 'abc')
+    assert decode_cursor(token, 'view_count') == (1200, 'abc')
+    with pytest.raises(ValueError):
+        decode_cursor(token, 'like_count')
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor', 'view_count')
+
+
+def test_cursor_encodes_timestamps_as_iso_strings():
+    from datetime import datetime, timezone
+    token = encode_cursor('upload_date', datetime(2025, 3, 1, tzinfo=timezone.utc), 'abc')
+    assert decode_cursor(token, 'upload_date') == ('2025-03-01T00:00:00+00:00', 'abc')
+
+
+def test_cursor_search_seeks_instead_of_offset():
+    query, params = build_search_query('', NO_FILTERS, 'view_count', 10, 30, after=(1200, 'abc'))
+    assert '(COALESCE(c.view_count, -1), c.id) < (%s, %s)' in query
+    assert 'OFFSET' not in query
+    assert params[-3:] == [1200, 'abc', 10]
+
+
+def test_null_upload_dates_sort_last_and_keep_paginating(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        ('id2', 't', None, 'u', 5, 1, '0:01:00', 1, 'ch', None, 4),
+        ('id1', 't', None, 'u', 3, 1, '0:01:00', 1, 'ch', None, 4),
+    ]
+    _, _, next_cursor = execute_search(conn, '', NO_FILTERS, 'upload_date', 2, 0)
+    query = cursor.execute.call_args.args[0]
+    assert "ORDER BY COALESCE(c.upload_date, '-infinity'::timestamptz) DESC, c.id DESC" in query
+    # 日付が NULL の行で終わったページからも次のページへ進める
+    assert decode_cursor(next_cursor, 'upload_date') == (None, 'id1')
+
+    query, params = build_search_query('', NO_FILTERS, 'upload_date', 2, 0, after=(None, 'id1'))
+    assert ("(COALESCE(c.upload_date, '-infinity'::timestamptz), c.id) < "
+            "(COALESCE(%s::timestamptz, '-infinity'::timestamptz), %s)") in query
+    assert params[-3:] == [None, 'id1', 2]
+
+
+def test_full_page_returns_next_cursor(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        ('id2', 't', 'd', 'u', 5, 1, '0:01:00', 1, 'ch', 5, 2),
+        ('id1', 't', 'd', 'u', 3, 1, '0:01:00', 1, 'ch', 3, 2),
+    ]
+    _, _, next_cursor = execute_search(conn, '', NO_FILTERS, 'view_count', 2, 0)
+    assert decode_cursor(next_cursor, 'view_count') == (3, 'id1')
+
+
+def test_facet_query_uses_grouping_sets_with_per_facet_filters():
+    from utilities.search_query import build_facet_query
+    filters = dict(NO_FILTERS, type_filter='パス', level_filter='中学生')
+    query, params = build_facet_query('練習', filters)
+    assert 'GROUP BY GROUPING SETS ((c.category_title), (c.players), (c.level), ' \
+           '(c.channel_brand_category))' in query
+    assert 'FROM search_view c' in query
+    assert 'c.in_category' in query
+    # 各ファセットは自分以外のフィルタで絞る（category_title は level のみ、level は category_title のみ）
+    assert params == ['中学生', 'パス', '中学生', 'パス', 'パス', '中学生', '%練習%']
+
+
+def test_execute_facet_counts_groups_rows_by_facet(mocker):
+    from utilities.search_query import execute_facet_counts
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        ('パス', 0, None, 1, None, 1, None, 1, 5, 9, 9, 9),
+        ('ドリブル', 0, None, 1, None, 1, None, 1, 3, 9, 9, 9),
+        (None, 1, None, 1, '中学生', 0, None, 1, 9, 9, 2, 9),
+        (None, 1, None, 1, None, 1, 2, 0, 9, 9, 9, 7),
+    ]
+    facets = execute_facet_counts(conn, '', NO_FILTERS)
+    assert facets['category_title'] == [{'value': 'ドリブル', 'count': 3}, {'value': 'パス', 'count': 5}]
+    assert facets['level'] == [{'value': '中学生', 'count': 2}]
+    assert facets['channel'] == [{'value': 2, 'count': 7}]
+    assert facets['players'] == []
+
+
+def test_relevance_query_takes_top_k_per_tier_from_popularity_index():
+    from utilities.search_query import build_relevance_query
+    query, params = build_relevance_query('ドリブル', NO_FILTERS, 10, 20)
+    assert 'UNION ALL' in query
+    assert query.count('ORDER BY c.popularity DESC, c.id DESC') == 2
+    assert 'ORDER BY tier, popularity DESC, id DESC' in query
+    assert params == ['%ドリブル%', 'ドリブル', 30, '%ドリブル%', 'ドリブル', 30, 10, 20]
+
+    # カテゴリを表さないキーワード・キーワードなしは popularity 順の1段のみ
+    query, params = build_relevance_query('', NO_FILTERS, 10, 0)
+    assert 'UNION ALL' not in query
+    assert params == [10, 10, 0]
+
+
+def test_relevance_search_ignores_cursor_and_counts_separately(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('id1', 't', 'd', 'u', 5, 1, '0:01:00', 1, 'ch', 0, 3.2)]
+    cursor.fetchone.return_value = (7,)
+    total, rows, next_cursor = execute_search(conn, 'ドリブル', NO_FILTERS, 'relevance', 1, 0, cursor='x')
+    assert total == 7
+    assert rows == [('id1', 't', 'd', 'u', 5, 1, '0:01:00', 1, 'ch')]
+    assert next_cursor is None
+
@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from utilities import search_query
+from utilities.title_index import TitleIndex, build_title_index, restamp_title_index
+
+DOCUMENTS = [
+    ('a', 'パス練習メニュー'),
+    ('b', '守備の基本'),
+    ('c', 'ＧＫのパスワーク'),
+    ('d', 'ドリブルから守る'),
+    ('e', 'スパスタ'),  # 「パス」を含む
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / 'title_index.bin'
+    assert build_title_index(DOCUMENTS, str(path)) == len(DOCUMENTS)
+    return TitleIndex(str(path))
+
+
+def test_two_character_queries_use_bigram_postings(index):
+    assert index.search('パス') == ['a', 'c', 'e']
+    assert index.search('守備') == ['b']
+    assert index.search('ゴール') == []
+
+
+def test_single_character_and_normalized_queries(index):
+    assert index.search('守') == ['b', 'd']
+    assert index.search('gk') == ['c']  # NFKC + 小文字化
+
+
+def test_longer_queries_are_verified_against_titles(index):
+    # 「パス」「スワ」「ワー」「ーク」はそれぞれ含まれていても連続していない文書は除外される
+    assert index.search('パスワーク') == ['c']
+    assert index.search('練習メニュー') == ['a']
+
+
+def test_rebuild_replaces_file_atomically(tmp_path):
+    path = str(tmp_path / 'title_index.bin')
+    build_title_index(DOCUMENTS, path)
+    old = TitleIndex(path)
+    build_title_index([('z', 'パス')], path)
+    # 古いマップは差し替え後も読める
+    assert old.search('パス') == ['a', 'c', 'e']
+    assert TitleIndex(path).search('パス') == ['z']
+
+
+def test_restamp_only_moves_index_from_previous_generation(tmp_path):
+    path = str(tmp_path / 'title_index.bin')
+    build_title_index(DOCUMENTS, path, generation=4)
+    old = TitleIndex(path)
+
+    assert restamp_title_index(4, 5, path)
+    assert TitleIndex(path).generation == 5
+    assert TitleIndex(path).search('パス') == ['a', 'c', 'e']
+    assert old.generation == 4
+    # 付け替えた後の世代から進んでいないインデックスは古いまま
+    assert not restamp_title_index(7, 8, path)
+    assert TitleIndex(path).generation == 5
+
+
+@pytest.fixture
+def current_index(mocker, tmp_path):
+    path = str(tmp_path / 'title_index.bin')
+    build_title_index(DOCUMENTS, path, generation=3)
+    mocker.patch.object(search_query, 'get_title_index', return_value=TitleIndex(path))
+    return mocker.patch.object(search_query, 'get_data_generation', return_value=3)
+
+
+def test_short_queries_use_index_of_current_generation(current_index):
+    assert search_query.lookup_title_ids('パス') == ['a', 'c', 'e']
+    assert search_query.lookup_title_ids('パス練習') is None  # pg_trgm が使える長さ
+
+
+def test_stale_index_falls_back_to_ilike(current_index):
+    current_index.return_value = 4
+    assert search_query.lookup_title_ids('パス') is None
+
+
+def test_common_terms_fall_back_to_ilike(mocker, current_index):
+    mocker.patch.object(search_query, 'TITLE_INDEX_MAX_IDS', 2)
+    assert search_query.lookup_title_ids('パス') is None
+    assert search_query.lookup_title_ids('守備') == ['b']
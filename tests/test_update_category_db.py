@@ -0,0 +1,95 @@
+from utilities import db_access, update_category_db
+from utilities.update_category_db import CLASSIFIER_VERSION, update_category
+
+
+def test_update_category_tags_rows_with_classifier_version():
+    rows = [('v1', '２対１のパス練習（中学生）', None, 'url', 1, 1, '0:01:00', 3)]
+    assert update_category(rows) == [{
+        'id': 'v1', 'category': '対人', 'nop': '2対1', 'level': '中学生', 'channel_id': 3,
+        'classifier_version': CLASSIFIER_VERSION,
+    }]
+
+
+def test_classifier_version_changes_with_rules(mocker):
+    mocker.patch.object(update_category_db, 'CATEGORY_PATTERNS',
+                        update_category_db.CATEGORY_PATTERNS + [(r"リフティング", "リフティング")])
+    assert update_category_db.classifier_version() != CLASSIFIER_VERSION
+
+
+def test_unclassified_contents_selects_missing_or_outdated_rows(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('v1',)]
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    assert db_access.search_unclassified_contents('abc') == [('v1',)]
+    query, params = cursor.execute.call_args.args
+    assert 'cat.id IS NULL OR cat.classifier_version IS DISTINCT FROM %s' in query
+    assert params == ('abc',)
+
+
+def test_classifier_uses_rule_order_not_position_in_title():
+    classifier = update_category_db.TitleClassifier()
+    assert classifier.category('ドリブルからのパス') == 'パス'
+    assert classifier.category('守備的GKの練習') == 'キーパー'
+    assert classifier.category('リフティング') == 'その他'
+    assert classifier.level('中学から高校へ') == '高校生'
+    assert classifier.level('練習') == update_category_db.DEFAULT_LEVEL
+
+
+def test_classifier_normalizes_numbers_before_matching():
+    classifier = update_category_db.TitleClassifier()
+    assert classifier.number('２対３ と ４人') == '4人'
+    assert classifier.number('1対3') == '3対1'
+    assert classifier.number('3⼈で行う') == '3人'  # ⼈（康熙部首）は NFKC で「人」になる
+    assert classifier.number('ＧＫ練習') == '人数指定なし'
+
+
+def test_number_markers_cover_every_character_normalizing_to_markers():
+    import sys
+    import unicodedata
+    for code in range(sys.maxunicode + 1):
+        normalized = unicodedata.normalize('NFKC', chr(code))
+        if '人' in normalized or '対' in normalized:
+            assert update_category_db.NUMBER_MARKERS.search(chr(code)), hex(code)
+
+
+def test_classifier_matches_per_pattern_search():
+    from utilities.benchmark_classifier import legacy_classify, synthetic_titles
+    titles = synthetic_titles(3000, seed=1)
+    assert update_category_db.TitleClassifier().classify_many(titles) == [legacy_classify(t) for t in titles]
+
+
+def test_stream_rows_reads_named_cursor_in_batches(mocker):
+    conn = mocker.MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchmany.side_effect = [[('v1',), ('v2',)], [('v3',)], []]
+    use_conn = mocker.patch.object(db_access, 'use_db_connection')
+    use_conn.return_value.__enter__.return_value = conn
+
+    batches = list(db_access.iter_unclassified_contents('abc', batch_size=2))
+
+    assert batches == [[('v1',), ('v2',)], [('v3',)]]
+    conn.cursor.assert_called_once_with(name='unclassified_contents')
+    assert cursor.itersize == 2
+    cursor.fetchmany.assert_called_with(2)
+    conn.rollback.assert_called_once()
+
+
+def test_classify_contents_writes_each_batch_through_loader(mocker):
+    batches = [
+        [('v1', 'パス練習', None, 'url', 1, 1, '0:01:00', 2)],
+        [('v2', '3人で守備', None, 'url', 1, 1, '0:01:00', 2), ('v3', 'GK', None, 'url', 1, 1, '0:01:00', 4)],
+    ]
+    mocker.patch.object(db_access, 'iter_unclassified_contents', return_value=iter(batches))
+    loader = mocker.Mock()
+    on_batch = mocker.Mock()
+
+    assert update_category_db.classify_contents(loader, on_batch=on_batch) == 3
+
+    written = [call.args[0] for call in loader.add_categories.call_args_list]
+    assert [[row['id'] for row in batch] for batch in written] == [['v1'], ['v2', 'v3']]
+    assert written[1][0]['nop'] == '3人'
+    assert on_batch.call_args_list == [mocker.call(1), mocker.call(2)]
+    loader.flush.assert_called_once()
@@ -0,0 +1,77 @@
+import pytest
+import requests
+
+from utilities.youtube_client import QuotaExceededError, YouTubeAPIError, YouTubeClient
+
+
+def response(mocker, status_code=200, data=None, headers=None):
+    return mocker.Mock(status_code=status_code, headers=headers or {},
+                       json=mocker.Mock(return_value=data if data is not None else {}))
+
+
+def error_response(mocker, status_code, reason, headers=None):
+    return response(mocker, status_code, {'error': {'errors': [{'reason': reason}]}}, headers)
+
+
+def make_client(mocker, *responses, max_retries=3):
+    session = mocker.Mock()
+    session.get.side_effect = list(responses)
+    sleeps = []
+    client = YouTubeClient(session=session, max_retries=max_retries, backoff_base=1.0, sleep=sleeps.append)
+    return client, session, sleeps
+
+
+def test_retries_server_errors_with_exponential_backoff(mocker):
+    client, session, sleeps = make_client(
+        mocker, response(mocker, 503), response(mocker, 500), response(mocker, 200, {'items': [1]}))
+
+    assert client.get('videos', {'id': 'v1'}) == {'items': [1]}
+    assert session.get.call_count == 3
+    assert 1.0 <= sleeps[0] <= 1.5 and 2.0 <= sleeps[1] <= 3.0
+    stats = client.stats()['videos']
+    assert (stats['requests'], stats['errors'], stats['retries']) == (3, 2, 2)
+
+
+def test_retry_after_header_and_connection_errors_are_retried(mocker):
+    client, session, sleeps = make_client(
+        mocker, error_response(mocker, 429, 'rateLimitExceeded', {'Retry-After': '7'}),
+        requests.exceptions.ConnectionError('reset'), response(mocker, 200, {'items': []}))
+
+    assert client.get('search', {}) == {'items': []}
+    assert sleeps[0] == 7.0
+    assert len(sleeps) == 2
+
+
+def test_quota_exceeded_is_not_retried(mocker):
+    client, session, sleeps = make_client(mocker, error_response(mocker, 403, 'quotaExceeded'))
+
+    with pytest.raises(QuotaExceededError) as excinfo:
+        client.get('videos', {})
+    assert excinfo.value.reason == 'quotaExceeded'
+    assert session.get.call_count == 1 and sleeps == []
+
+
+def test_client_errors_and_exhausted_retries_raise(mocker):
+    client, _, _ = make_client(mocker, error_response(mocker, 400, 'badRequest'))
+    with pytest.raises(YouTubeAPIError) as excinfo:
+        client.get('videos', {})
+    assert excinfo.value.status_code == 400
+
+    client, session, _ = make_client(mocker, *[response(mocker, 502)] * 3, max_retries=2)
+    with pytest.raises(YouTubeAPIError):
+        client.get('videos', {})
+    assert session.get.call_count == 3
+
+
+def test_conditional_request_returns_none_when_not_modified(mocker):
+    client, session, _ = make_client(mocker, response(mocker, 304))
+
+    assert client.get('playlistItems', {'playlistId': 'UU'}, etag='"abc"') is None
+    assert session.get.call_args.kwargs['headers'] == {'If-None-Match': '"abc"'}
+    assert session.get.call_args.args[0] == 'https://www.googleapis.com/youtube/v3/playlistItems'
+
+
+def test_default_session_pools_connections():
+    client = YouTubeClient(pool_size=8)
+    adapter = client.session.get_adapter('https://www.googleapis.com/youtube/v3/videos')
+    assert adapter._pool_maxsize == 8
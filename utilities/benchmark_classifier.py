@@ -0,0 +1,121 @@
+"""
+タイトル分類ベンチマーク: コンパイル済みの TitleClassifier vs パターンごとの re.search
+
+使い方:
+    python utilities/benchmark_classifier.py [--titles 200000] [--repeat 3] [--seed 0]
+
+合成したタイトル（練習メニュー名・人数・学年・英字や全角数字などを組み合わせたもの）を
+- 以前の実装（ルールを上から順に re.search、人数判定の前に毎回 NFKC + 全角数字の置換。ログは出さない）
+- TitleClassifier.classify_many
+で分類し、タイトル/秒を比較します。両者の結果が1件でも違えば終了コード 1 で終わります。
+DB や API は使いません。
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import logging
+from utilities.update_category_db import (
+    CATEGORY_PATTERNS, DEFAULT_LEVEL, LEVEL_PATTERNS, NUMBER_PATTERNS, TitleClassifier
+)
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+FRAGMENTS = [
+    'パス練習', 'ドリブル突破', 'シュート', 'インサイドキック', 'ビルドアップ', 'GKトレーニング', 'キーパー',
+    '守備の基本', 'ディフェンス', 'アジリティ', 'ラダー', 'ストレッチ', '指導のコンセプト', '考え方',
+    'リフティング', 'トラップ', 'ポゼッション', '鳥かご', 'ウォーミングアップ', 'ゲーム形式',
+    '高校', '高等部', '中学', '中等部', 'ユース', '小学生', 'ジュニア', 'U-12',
+    'Soccer Drill', 'training', '【解説】', '｜', '!!', '#shorts', 'ﾊﾟｽ', '①', '\n',
+]
+NUMBERS = ['{}人', '{}対{}', '{}vs{}', '{}名', '{}']
+DIGITS = '0123456789０１２３４５６７８９'
+
+
+def synthetic_titles(count: int, seed: int = 0) -> list:
+    """分類の分岐をひととおり通る合成タイトルを count 件作る"""
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(count):
+        parts = rng.sample(FRAGMENTS, rng.randint(1, 5))
+        if rng.random() < 0.6:
+            template = rng.choice(NUMBERS)
+            numbers = [''.join(rng.choice(DIGITS) for _ in range(rng.randint(1, 2))) for _ in range(2)]
+            parts.insert(rng.randrange(len(parts) + 1), template.format(*numbers))
+        titles.append(rng.choice(['', ' ', '　']).join(parts))
+    return titles
+
+
+def legacy_classify(title: str) -> tuple:
+    """以前の update_category と同じ判定（ログを除く）"""
+    category = next((label for pattern, label in CATEGORY_PATTERNS if re.search(pattern, title)), "その他")
+
+    text = unicodedata.normalize("NFKC", title)
+    text = re.sub(r"[０-９]", lambda x: chr(ord(x.group(0)) - 0xFEE0), text).strip()
+    if match := re.search(NUMBER_PATTERNS[0], text):
+        number = f"{match.group(1)}人"
+    elif match := re.search(NUMBER_PATTERNS[1], text):
+        num1, num2 = int(match.group(1)), int(match.group(2))
+        number = f"{max(num1, num2)}対{min(num1, num2)}"
+    else:
+        number = "人数指定なし"
+
+    level = next((label for pattern, label in LEVEL_PATTERNS if re.search(pattern, title)), DEFAULT_LEVEL)
+    return category, number, level
+
+
+def best_seconds(func, repeat: int) -> float:
+    """func を repeat 回実行し、最速の秒数を返す"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="Compiled title classifier vs per-pattern re.search")
+    parser.add_argument('--titles', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    titles = synthetic_titles(args.titles, args.seed)
+    classifier = TitleClassifier()
+
+    legacy = [legacy_classify(title) for title in titles]
+    compiled = classifier.classify_many(titles)
+    mismatches = [(t, a, b) for t, a, b in zip(titles, legacy, compiled) if a != b]
+    for title, expected, actual in mismatches[:10]:
+        logger.error("Mismatch for %r: legacy %s, compiled %s", title, expected, actual)
+
+    legacy_seconds = best_seconds(lambda: [legacy_classify(title) for title in titles], args.repeat)
+    compiled_seconds = best_seconds(lambda: classifier.classify_many(titles), args.repeat)
+
+    logger.info("%-10s %10s %14s", "method", "seconds", "titles/s")
+    logger.info("%-10s %10.3f %14.0f", "legacy", legacy_seconds, len(titles) / legacy_seconds)
+    logger.info("%-10s %10.3f %14.0f", "compiled", compiled_seconds, len(titles) / compiled_seconds)
+    logger.info("speedup: %.2fx, mismatches: %d / %d", legacy_seconds / compiled_seconds,
+                len(mismatches), len(titles))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+取り込みベンチマーク: 記録済みの YouTube レスポンスを再生して fetch → classify → insert を計測
+
+使い方:
+    # 1回だけ本番 API から記録する（通常の取り込みと同じ。レスポンスが保存される）
+    YOUTUBE_RESPONSE_MODE=record python main.py
+
+    # 記録を再生して計測する（API は呼ばない）
+    python utilities/benchmark_ingest.py [--store ./data/youtube_responses] [--channel UC... ...]
+                                         [--repeat 3] [--insert] [--pipeline]
+
+チャンネルは --channel（省略時は CHANNEL_ID 環境変数）。各段階の秒数と 動画数/秒 を表示します。
+--insert を付けると cid / contents / category テーブルに一括書き込み（utilities.bulk_loader）し、
+行/秒も表示します（既存行は ON CONFLICT で値が変わったものだけ更新されるため、2回目以降は
+重複の検出が中心になる）。開発用のデータベースで実行してください。
+--pipeline を付けると、取得・分類・書き込みをページ単位で重ねて行う utilities.ingest.ingest_channels
+（main.py と /fetch-youtube-data が使うもの）の全体の秒数を計測します（--insert と同じく DB に書き込む）。
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import logging
+from utilities.db_access import load_environment
+from utilities.response_store import DEFAULT_RESPONSE_STORE_PATH, MODE_REPLAY
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+
+def run_pipeline(channels, insert: bool) -> dict:
+    """1回分の取り込みを実行し、段階ごとの秒数と件数を返す"""
+    from utilities.bulk_loader import BulkLoader
+    from utilities.db_access import insert_cid_data
+    from utilities.ingest import contents_rows, fetch_channels
+    from utilities.update_category_db import update_category
+
+    timings = {"fetch": 0.0, "classify": 0.0, "insert": 0.0}
+    videos = 0
+    loader = BulkLoader()
+
+    started = time.perf_counter()
+    results = list(fetch_channels(channels, 'replay'))
+    timings["fetch"] = time.perf_counter() - started
+    failed = [r["channel_id"] for r in results if r["error"]]
+    if failed:
+        logger.warning("Channels not fully recorded (skipped): %s", failed)
+
+    for channel_number, result in enumerate(results, start=1):
+        if result["error"]:
+            continue
+        videos += len(result["videos"])
+
+        started = time.perf_counter()
+        categories = update_category(contents_rows(result["videos"], channel_number))
+        timings["classify"] += time.perf_counter() - started
+
+        if insert:
+            started = time.perf_counter()
+            insert_cid_data(result["channel_id"], result["channel_name"],
+                            f"https://www.youtube.com/channel/{result['channel_id']}")
+            loader.add_contents(result["videos"], channel_number)
+            loader.add_categories(categories, channel_number)
+            timings["insert"] += time.perf_counter() - started
+
+    if insert:
+        started = time.perf_counter()
+        loader.flush()
+        timings["insert"] += time.perf_counter() - started
+        logger.info("Bulk load: %s", loader.stats())
+
+    return {"videos": videos, "rows": loader.contents_rows + loader.category_rows, **timings}
+
+
+def run_streaming_pipeline(channels) -> dict:
+    """ingest_channels（ページ単位で取得・分類・書き込みを重ねる）を1回実行し、全体の秒数を返す"""
+    from utilities.bulk_loader import BulkLoader
+    from utilities.ingest import ingest_channels
+
+    loader = BulkLoader()
+    started = time.perf_counter()
+    results = ingest_channels(channels, 'replay', loader)
+    total = time.perf_counter() - started
+    failed = [r["channel_id"] for r in results if r["error"]]
+    if failed:
+        logger.warning("Channels not fully recorded or written: %s", failed)
+    logger.info("Bulk load: %s", loader.stats())
+    return {"videos": sum(r["written"] for r in results), "rows": loader.contents_rows + loader.category_rows,
+            "total": total}
+
+
+def rate(videos: int, seconds: float) -> str:
+    return f"{videos / seconds:10.1f}" if seconds > 0 else f"{'-':>10}"
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="Replay recorded YouTube responses and time ingestion")
+    parser.add_argument('--store', default=None, help=f"recorded responses (default {DEFAULT_RESPONSE_STORE_PATH})")
+    parser.add_argument('--channel', action='append', dest='channels')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--insert', action='store_true', help="also write to the database")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="time the page-by-page fetch/classify/write pipeline (writes to the database)")
+    args = parser.parse_args()
+
+    load_environment()
+    # 共有クライアントは初回利用時に作られるので、その前に再生モードにする
+    os.environ['YOUTUBE_RESPONSE_MODE'] = MODE_REPLAY
+    if args.store:
+        os.environ['YOUTUBE_RESPONSE_STORE'] = args.store
+
+    channels = args.channels or [c.strip() for c in os.getenv('CHANNEL_ID', '').split(',') if c.strip()]
+    if not channels:
+        logger.error("No channels: pass --channel or set CHANNEL_ID")
+        sys.exit(1)
+
+    if args.pipeline:
+        runs = [run_streaming_pipeline(channels) for _ in range(args.repeat)]
+        logger.info("%-4s %8s %10s %10s %10s", "run", "videos", "rows", "total/s", "total(s)")
+        for number, run in enumerate(runs, start=1):
+            logger.info("%-4d %8d %10d %s %10.3f", number, run["videos"], run["rows"],
+                        rate(run["videos"], run["total"]), run["total"])
+        return
+
+    runs = [run_pipeline(channels, args.insert) for _ in range(args.repeat)]
+
+    logger.info("%-4s %8s %10s %10s %10s %10s %10s", "run", "videos", "fetch/s", "classify/s",
+                "insert/s", "total/s", "total(s)")
+    for number, run in enumerate(runs, start=1):
+        total = run["fetch"] + run["classify"] + run["insert"]
+        logger.info("%-4d %8d %s %s %s %s %10.3f", number, run["videos"], rate(run["videos"], run["fetch"]),
+                    rate(run["videos"], run["classify"]),
+                    rate(run["videos"], run["insert"]) if args.insert else f"{'-':>10}",
+                    rate(run["videos"], total), total)
+        if args.insert:
+            logger.info("     %d rows written at %s rows/s", run["rows"], rate(run["rows"], run["insert"]).strip())
+
+    from utilities.youtube_client import get_youtube_client
+    logger.info("Recorded responses: %s", get_youtube_client().store.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+タイトル検索ベンチマーク: n-gram インデックス vs ILIKE
+
+使い方:
+    python utilities/benchmark_title_index.py [--iterations 50] [--query パス --query 守備 ...]
+
+contents テーブルから一時的にインデックスを作成し、同じクエリを
+- TitleIndex.search（メモリマップした転置インデックス）
+- SELECT id FROM contents WHERE title ILIKE '%q%'
+で実行して、1クエリあたりの平均時間と件数を比較します。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import logging
+from utilities.db_access import get_db_connection, load_environment
+from utilities.title_index import TitleIndex, build_title_index
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = ['パス', '守備', 'シュート', 'GK', '1対1', 'ドリブル', 'ビルドアップ']
+
+
+def time_per_call(func, iterations: int) -> float:
+    """func を iterations 回実行し、1回あたりのミリ秒を返す"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) * 1000 / iterations
+
+
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="Title index vs ILIKE benchmark")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--query', action='append', dest='queries')
+    args = parser.parse_args()
+    queries = args.queries or DEFAULT_QUERIES
+
+    load_environment()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, title FROM contents ORDER BY id")
+            documents = cursor.fetchall()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'title_index.bin')
+            started = time.perf_counter()
+            build_title_index(documents, path)
+            logger.info("インデックス作成: %d件 %.1fms (%d bytes)", len(documents),
+                        (time.perf_counter() - started) * 1000, os.path.getsize(path))
+            index = TitleIndex(path)
+
+            logger.info("%-12s %10s %10s %8s %8s", "query", "index(ms)", "ilike(ms)", "index#", "ilike#")
+            for query in queries:
+                def run_ilike():
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT id FROM contents WHERE title ILIKE %s", (f"%{query}%",))
+                        return cursor.fetchall()
+
+                index_ms = time_per_call(lambda: index.search(query), args.iterations)
+                ilike_ms = time_per_call(run_ilike, args.iterations)
+                logger.info("%-12s %10.3f %10.3f %8d %8d", query, index_ms, ilike_ms,
+                            len(index.search(query)), len(run_ilike()))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+contents / category テーブルへの一括書き込み
+
+1件ずつ INSERT してコミットする代わりに、行をためておき、バッチごとに1トランザクションで
+
+1. 一時テーブル（ON COMMIT DROP）を作る
+2. COPY ... FROM STDIN で一時テーブルに流し込む
+3. INSERT ... SELECT ... ON CONFLICT で本テーブルにまとめて反映する（集合演算の upsert）
+
+を行います。既存の動画は再生数・高評価数などを更新し、値が変わっていない行は書き換えません。
+
+- BULK_LOAD_BATCH_SIZE: 1トランザクションで書き込む行数（contents + category、既定 5000）
+
+スループット（行/秒）は BulkLoader.stats() とログで確認できます。
+"""
+import io
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import psycopg2
+
+from utilities.get_videos import convert_to_embed_url, format_upload_date, parse_count
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+CONTENTS_COLUMNS = ('id', 'title', 'upload_date', 'upload_date_display', 'video_url', 'embed_url',
+                    'view_count', 'like_count', 'duration', 'channel_category')
+CATEGORY_COLUMNS = ('id', 'category_title', 'players', 'level', 'channel_brand_category', 'classifier_version')
+
+# セキュリティ: テーブル名・カラム名は固定値のみ
+# 同じIDが1バッチに2回あると ON CONFLICT DO UPDATE が失敗するため DISTINCT ON で1行にする
+CONTENTS_UPSERT = f'''
+    INSERT INTO contents ({', '.join(CONTENTS_COLUMNS)})
+    SELECT DISTINCT ON (id) {', '.join(CONTENTS_COLUMNS)}
+    FROM contents_stage
+    ORDER BY id
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title,
+        view_count = EXCLUDED.view_count,
+        like_count = EXCLUDED.like_count,
+        duration = EXCLUDED.duration
+    WHERE (contents.title, contents.view_count, contents.like_count, contents.duration)
+        IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.view_count, EXCLUDED.like_count, EXCLUDED.duration)
+'''
+
+CATEGORY_UPSERT = f'''
+    INSERT INTO category ({', '.join(CATEGORY_COLUMNS)})
+    SELECT DISTINCT ON (id) {', '.join(CATEGORY_COLUMNS)}
+    FROM category_stage
+    ORDER BY id
+    ON CONFLICT (id) DO UPDATE SET
+        category_title = EXCLUDED.category_title,
+        players = EXCLUDED.players,
+        level = EXCLUDED.level,
+        channel_brand_category = EXCLUDED.channel_brand_category,
+        classifier_version = EXCLUDED.classifier_version
+    WHERE (category.category_title, category.players, category.level, category.channel_brand_category,
+           category.classifier_version)
+        IS DISTINCT FROM (EXCLUDED.category_title, EXCLUDED.players, EXCLUDED.level,
+                          EXCLUDED.channel_brand_category, EXCLUDED.classifier_version)
+'''
+
+
+def contents_record(data: Dict[str, Any], channel_category: int) -> tuple:
+    """取得した動画1件を contents テーブルの1行にする（表示用の値もここで一度だけ計算する）"""
+    return (
+        data['id'], data['title'], data['upload_date'], format_upload_date(data['upload_date']),
+        data['url'], convert_to_embed_url(data['url']), parse_count(data.get('view_count')),
+        parse_count(data.get('like_count')), data.get('duration'), channel_category,
+    )
+
+
+def category_record(data: Dict[str, Any], channel_category: Optional[int] = None) -> tuple:
+    """update_category の結果1件を category テーブルの1行にする（チャンネル番号は行の値を優先）"""
+    channel = data.get('channel_id') or channel_category
+    return (data['id'], data['category'], data['nop'], data['level'], channel, data.get('classifier_version'))
+
+
+def copy_value(value: Any) -> str:
+    """COPY の text 形式の1値（NULL は \\N、区切り文字・改行・バックスラッシュはエスケープ）"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+    """行を COPY FROM STDIN で table に流し込む"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def load_batch(conn: psycopg2.extensions.connection, contents: List[tuple], categories: List[tuple]) -> None:
+    """contents / category の行を1トランザクションで書き込む（失敗したらロールバックして例外を投げる）"""
+    try:
+        with conn.cursor() as c:
+            if contents:
+                c.execute("CREATE TEMP TABLE contents_stage (LIKE contents INCLUDING DEFAULTS) ON COMMIT DROP")
+                copy_rows(c, 'contents_stage', CONTENTS_COLUMNS, contents)
+                c.execute(CONTENTS_UPSERT)
+            if categories:
+                c.execute("CREATE TEMP TABLE category_stage (LIKE category INCLUDING DEFAULTS) ON COMMIT DROP")
+                copy_rows(c, 'category_stage', CATEGORY_COLUMNS, categories)
+                c.execute(CATEGORY_UPSERT)
+        conn.commit()
+    except psycopg2.Error as e:
+        logger.error("Error while bulk loading %d contents / %d category rows: %s",
+                     len(contents), len(categories), e)
+        conn.rollback()
+        raise
+
+
+class BulkLoader:
+    """contents / category の行をためて、batch_size 行ごとに1トランザクションで書き込む
+
+    with 文で使うと、ブロックを抜けるときに残りを書き込む（例外で抜けた場合は書き込まない）。
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or int(os.getenv('BULK_LOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self._contents: List[tuple] = []
+        self._categories: List[tuple] = []
+        self.contents_rows = 0
+        self.category_rows = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.seconds = 0.0
+
+    def __enter__(self) -> 'BulkLoader':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._contents) + len(self._categories)
+
+    def add_contents(self, video_data: List[Dict[str, Any]], channel_category: int) -> None:
+        self._contents.extend(contents_record(data, channel_category) for data in video_data)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def add_categories(self, contents_data: List[Dict[str, Any]], channel_category: Optional[int] = None) -> None:
+        self._categories.extend(category_record(data, channel_category) for data in contents_data)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """たまっている行を書き込む（失敗した場合、そのバッチの行は破棄して例外を投げる）"""
+        if not self.pending:
+            return
+        from utilities.db_access import use_db_connection
+
+        contents, categories = self._contents, self._categories
+        self._contents, self._categories = [], []
+        started = time.perf_counter()
+        try:
+            with use_db_connection() as conn:
+                load_batch(conn, contents, categories)
+        except Exception:
+            self.failed_batches += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self.contents_rows += len(contents)
+        self.category_rows += len(categories)
+        self.batches += 1
+        self.seconds += elapsed
+        rows = len(contents) + len(categories)
+        logger.info("Bulk loaded %d contents / %d category rows in %.3fs (%.0f rows/s)",
+                    len(contents), len(categories), elapsed, rows / elapsed if elapsed > 0 else 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self.contents_rows + self.category_rows
+        return {
+            "contents_rows": self.contents_rows,
+            "category_rows": self.category_rows,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(rows / self.seconds, 1) if self.seconds > 0 else None,
+        }
@@ -78,8 +78,11 @@ def check_existing_indexes(conn):
         return []
 
 
-def create_indexes(conn):
-    """検索パフォーマンス向上のためのインデックスを作成"""
+def create_indexes(conn, schema='public'):
+    """検索パフォーマンス向上のためのインデックスを作成
+
+    schema には接続の search_path で先頭になっているスキーマを渡す（シャドウテーブルの再構築用）。
+    """
     indexes_to_create = [
         # 1. contents.title の ILIKE検索用（pg_trgm GINインデックス）
         {
@@ -162,6 +165,35 @@ def create_indexes(conn):
             """,
             "description": "category の複数フィルタ同時使用時の高速化"
         },
+        # 9-11. キーセットページング用: (ソート式 DESC, id DESC)
+        # utilities/search_query.py の SORT_EXPRESSIONS と一致させること
+        {
+            "name": "idx_contents_upload_date_key_id",
+            "table": "contents",
+            "query": """
+                CREATE INDEX IF NOT EXISTS idx_contents_upload_date_key_id 
+                ON contents ((COALESCE(upload_date, '-infinity'::timestamptz)) DESC, id DESC)
+            """,
+            "description": "upload_date順のキーセットページング高速化"
+        },
+        {
+            "name": "idx_contents_view_count_id",
+            "table": "contents",
+            "query": """
+                CREATE INDEX IF NOT EXISTS idx_contents_view_count_id 
+                ON contents ((COALESCE(view_count, -1)) DESC, id DESC)
+            """,
+            "description": "view_count順のキーセットページング高速化"
+        },
+        {
+            "name": "idx_contents_like_count_id",
+            "table": "contents",
+            "query": """
+                CREATE INDEX IF NOT EXISTS idx_contents_like_count_id 
+                ON contents ((COALESCE(like_count, -1)) DESC, id DESC)
+            """,
+            "description": "like_count順のキーセットページング高速化"
+        },
     ]
     
     created_count = 0
@@ -177,10 +209,10 @@ def create_indexes(conn):
                 cursor.execute("""
                     SELECT EXISTS(
                         SELECT 1 FROM pg_indexes 
-                        WHERE schemaname = 'public' 
+                        WHERE schemaname = %s 
                         AND indexname = %s
                     )
-                """, (idx_info["name"],))
+                """, (schema, idx_info["name"]))
                 exists = cursor.fetchone()[0]
                 
                 if exists:
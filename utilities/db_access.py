@@ -2,7 +2,8 @@ from contextlib import closing
 from collections import defaultdict
 from dotenv import load_dotenv
 from flask import g
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2 import sql
+from psycopg2.pool import PoolError, SimpleConnectionPool
 from contextlib import contextmanager
 from typing import Optional, List, Dict, Any, Generator, Union
 
@@ -11,6 +12,10 @@ import psycopg2
 import logging
 import pandas as pd
 import os
+import threading
+import time
+
+from utilities.bulk_loader import category_record, contents_record, load_batch
 
 # データベースに接続し、コンテキストマネージャを使って自動で接続を閉じる
 #DATABASE_PATH = './soccer_content.db'
@@ -75,18 +80,180 @@ logger = logging.getLogger(__name__)
 
 # プールは遅延初期化
 pool = None
+# プールを作成したプロセスID（fork後の子プロセスで親の接続を共有しないため）
+_pool_pid = None
+# SimpleConnectionPool自体はスレッドセーフではないため、getconn/putconnをロックで保護
+_pool_lock = threading.Lock()
+# 接続ごとの最終返却時刻（id(conn) -> time.monotonic()）
+_last_used: Dict[int, float] = {}
+# 貸し出し中の接続数を maxconn までに抑えるセマフォ（get_pool() でプールと一緒に作る）
+_pool_slots: Optional[threading.BoundedSemaphore] = None
+
+# プール設定（get_pool() の初回呼び出し時に環境変数 DB_POOL_MIN / DB_POOL_MAX /
+# DB_POOL_HEALTHCHECK_IDLE / DB_POOL_WAIT で上書きされる）
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+# プールが満杯のとき、接続の返却を待つ最大秒数
+POOL_WAIT_SECONDS = 10.0
+# この秒数以上アイドルだった接続は、貸し出し前に SELECT 1 で生存確認する
+# （Flyのマシンが停止→再開した後は、プール内の接続が切れていることがある）
+POOL_HEALTHCHECK_IDLE_SECONDS = 30.0
+
+_pool_stats = {
+    "checkouts": 0,
+    "returns": 0,
+    "healthchecks": 0,
+    "reconnects": 0,
+    "errors": 0,
+    "wait_timeouts": 0,
+}
+
 
-def get_pool():
+def get_pool() -> SimpleConnectionPool:
     """接続プールを取得（遅延初期化）"""
-    global pool
+    global pool, _pool_pid, _pool_slots, POOL_MIN_CONN, POOL_MAX_CONN, POOL_HEALTHCHECK_IDLE_SECONDS
+    global POOL_WAIT_SECONDS
+    if pool is not None and _pool_pid != os.getpid():
+        # fork後の子プロセスでは親の接続を使わず、新しいプールを作る
+        logger.info("Process changed, discarding inherited connection pool")
+        pool = None
+        _last_used.clear()
     if pool is None:
         database_url = get_database_url()
-        pool = SimpleConnectionPool(1, 10, dsn=database_url)
+        POOL_MIN_CONN = int(os.getenv('DB_POOL_MIN', POOL_MIN_CONN))
+        POOL_MAX_CONN = int(os.getenv('DB_POOL_MAX', POOL_MAX_CONN))
+        POOL_HEALTHCHECK_IDLE_SECONDS = float(
+            os.getenv('DB_POOL_HEALTHCHECK_IDLE', POOL_HEALTHCHECK_IDLE_SECONDS)
+        )
+        POOL_WAIT_SECONDS = float(os.getenv('DB_POOL_WAIT', POOL_WAIT_SECONDS))
+        pool = SimpleConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, dsn=database_url)
+        _pool_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+        _pool_pid = os.getpid()
+        logger.info("Connection pool created (min=%d, max=%d)", POOL_MIN_CONN, POOL_MAX_CONN)
     return pool
 
 
+def _is_connection_alive(conn: psycopg2.extensions.connection) -> bool:
+    """接続が利用可能か確認する"""
+    if conn.closed:
+        return False
+    _pool_stats["healthchecks"] += 1
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        logger.warning("Stale pooled connection detected: %s", e)
+        return False
+
+
+def _acquire_pool_slot() -> threading.BoundedSemaphore:
+    """接続の貸し出し枠を1つ確保する（プールが満杯なら POOL_WAIT_SECONDS まで空きを待つ）
+
+    SimpleConnectionPool.getconn は満杯だとすぐ PoolError を投げるため、同時に借りられる数を
+    セマフォで maxconn までに抑え、負荷が高いときは 500 を返さずに返却を待つ。
+    """
+    with _pool_lock:
+        get_pool()
+        slots = _pool_slots
+    if not slots.acquire(timeout=POOL_WAIT_SECONDS):
+        _pool_stats["wait_timeouts"] += 1
+        raise PoolError(f"connection pool exhausted (waited {POOL_WAIT_SECONDS:.0f}s)")
+    return slots
+
+
+def get_pooled_connection() -> psycopg2.extensions.connection:
+    """プールから接続を借りる（長時間アイドルだった接続は生存確認してから返す）
+
+    生存確認（SELECT 1）はネットワーク越しのため _pool_lock の外で行い、1本の遅い接続が
+    他のリクエストの貸し出しを止めないようにする。確認に失敗した後は、プールから出てくる
+    アイドル接続を（代わりの接続も含めて）すべて確認する。
+    """
+    slots = _acquire_pool_slot()
+    try:
+        check_all_idle = False
+        for _ in range(POOL_MAX_CONN + 1):
+            with _pool_lock:
+                conn_pool = get_pool()
+                conn = conn_pool.getconn()
+                _pool_stats["checkouts"] += 1
+                idle_since = _last_used.pop(id(conn), None)
+            needs_check = conn.closed or (idle_since is not None and (
+                check_all_idle or time.monotonic() - idle_since >= POOL_HEALTHCHECK_IDLE_SECONDS
+            ))
+            if not needs_check or _is_connection_alive(conn):
+                return conn
+            # 切断済みの接続は破棄して、新しい接続に置き換える
+            with _pool_lock:
+                conn_pool.putconn(conn, close=True)
+                _pool_stats["reconnects"] += 1
+            logger.info("Replaced stale pooled connection")
+            check_all_idle = True
+        raise psycopg2.OperationalError("no live pooled connection available")
+    except Exception:
+        slots.release()
+        raise
+
+
+def release_connection(conn: psycopg2.extensions.connection) -> None:
+    """借りた接続をプールに返す（未完了のトランザクションはロールバック）"""
+    close = bool(conn.closed)
+    try:
+        # ロールバックもネットワーク越しのため、ロックの外で行う
+        if not close and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except Exception as e:
+        _pool_stats["errors"] += 1
+        logger.error("Error rolling back returned connection: %s", e)
+        close = True
+    with _pool_lock:
+        conn_pool = get_pool()
+        slots = _pool_slots
+        try:
+            if close:
+                conn_pool.putconn(conn, close=True)
+            else:
+                conn_pool.putconn(conn)
+                _last_used[id(conn)] = time.monotonic()
+            _pool_stats["returns"] += 1
+        except Exception as e:
+            _pool_stats["errors"] += 1
+            logger.error("Error returning connection to pool: %s", e)
+            try:
+                conn_pool.putconn(conn, close=True)
+            except Exception:
+                pass
+    try:
+        slots.release()
+    except ValueError:
+        # fork 後などでプールを作り直した後に、古いプールの接続が返ってきた
+        pass
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """接続プールの統計情報を取得"""
+    stats: Dict[str, Any] = dict(_pool_stats)
+    stats["min_connections"] = POOL_MIN_CONN
+    stats["max_connections"] = POOL_MAX_CONN
+    if pool is None:
+        stats.update({"initialized": False, "in_use": 0, "idle": 0})
+        return stats
+    with _pool_lock:
+        stats.update({
+            "initialized": True,
+            "in_use": len(pool._used),
+            "idle": len(pool._pool),
+        })
+    return stats
+
+
 def get_db_connection() -> psycopg2.extensions.connection:
-    """新しい接続を毎回作成（プールを使わない）"""
+    """新しい接続を毎回作成（プールを使わない）
+
+    スクリプトなど、呼び出し側で close() する単発の処理向け。
+    リクエスト処理やユーティリティ関数では use_db_connection() / get_pooled_connection() を使う。
+    """
     database_url = get_database_url()
     conn = psycopg2.connect(database_url)
     logger.info("New database connection created")
@@ -96,16 +263,60 @@ def get_db_connection() -> psycopg2.extensions.connection:
 
 @contextmanager
 def use_db_connection() -> Generator[psycopg2.extensions.connection, None, None]:
-    """接続の管理を安全に行うコンテキストマネージャ"""
-    conn = get_db_connection()
+    """接続の管理を安全に行うコンテキストマネージャ（プールから借りて返す）
+
+    use_write_schema() の中では、接続の search_path を書き込み先のスキーマ優先にしてから渡す。
+    """
+    conn = get_pooled_connection()
+    schema = _write_schema
     try:
+        if schema:
+            _set_search_path(conn, schema)
         yield conn
     finally:
-        try:
-            conn.close()
-            logger.info("Database connection closed")
-        except Exception as e:
-            logger.error(f"Error closing connection: {e}")
+        if schema:
+            _reset_search_path(conn)
+        release_connection(conn)
+
+
+# 書き込み先のスキーマ（None は public のみ）。取り込みスクリプト用で、プロセス全体に効く
+_write_schema: Optional[str] = None
+
+
+@contextmanager
+def use_write_schema(schema: Optional[str]) -> Generator[None, None, None]:
+    """この中で use_db_connection() を使う処理が、テーブルをまず schema から探すようにする
+
+    schema にないテーブル（feedback, data_generation, crawl_state など）は public のものを使う。
+    None の場合は何もしない。
+    """
+    global _write_schema
+    previous = _write_schema
+    _write_schema = schema
+    try:
+        yield
+    finally:
+        _write_schema = previous
+
+
+def _set_search_path(conn: psycopg2.extensions.connection, schema: str) -> None:
+    # SET をコミットしておき、呼び出し側のロールバックで元に戻らないようにする
+    with conn.cursor() as c:
+        c.execute(sql.SQL("SET search_path TO {}, public").format(sql.Identifier(schema)))
+    conn.commit()
+
+
+def _reset_search_path(conn: psycopg2.extensions.connection) -> None:
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        with conn.cursor() as c:
+            c.execute("RESET search_path")
+        conn.commit()
+    except psycopg2.Error as e:
+        # search_path が残った接続をプールに戻さないよう閉じる
+        logger.error("Error while resetting search_path; closing connection: %s", e)
+        conn.close()
 
 # def get_db_connection():
 #     """データベース接続を取得"""
@@ -117,7 +328,7 @@ def use_db_connection() -> Generator[psycopg2.extensions.connection, None, None]
 def delete_table(tbl_name: str) -> None:
     """テーブルを削除して、データを削除"""
     # セキュリティ: テーブル名のホワイトリスト検証
-    allowed_tables = {'cid', 'contents', 'category', 'feedback'}
+    allowed_tables = {'cid', 'contents', 'category', 'feedback', 'crawl_state'}
     if tbl_name not in allowed_tables:
         logger.error(f"Invalid table name: {tbl_name}")
         raise ValueError(f"Invalid table name: {tbl_name}")
@@ -171,10 +382,12 @@ def create_contents_table() -> None:
         CREATE TABLE IF NOT EXISTS contents (
             ID TEXT PRIMARY KEY,
             title TEXT,
-            upload_date TEXT,
+            upload_date TIMESTAMPTZ,
+            upload_date_display TEXT,
             video_url TEXT,
-            view_count INTEGER,
-            like_count INTEGER,
+            embed_url TEXT,
+            view_count BIGINT,
+            like_count BIGINT,
             duration TEXT,
             channel_category INTEGER
         )
@@ -182,6 +395,66 @@ def create_contents_table() -> None:
     create_table(query)
 
 
+def migrate_contents_table() -> None:
+    """既存の `contents` テーブルを現行スキーマに移行する（何度実行しても安全）
+
+    - upload_date: TEXT -> TIMESTAMPTZ（ISO 8601 / 日本語形式の両方を変換）
+    - view_count / like_count: INTEGER -> BIGINT
+    - upload_date_display / embed_url: 表示用カラムを追加して埋める
+    """
+    logger.info("Migrating 'contents' table...")
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    SELECT column_name, data_type
+                    FROM information_schema.columns
+                    WHERE table_schema = 'public' AND table_name = 'contents'
+                """)
+                column_types = dict(c.fetchall())
+                if not column_types:
+                    logger.info("'contents' table does not exist, nothing to migrate.")
+                    return
+
+                if column_types.get('upload_date') == 'text':
+                    # 日本語形式はUTCの表示文字列として保存されていたため、UTCとして解釈する
+                    c.execute("""
+                        ALTER TABLE contents ALTER COLUMN upload_date TYPE TIMESTAMPTZ
+                        USING (
+                            CASE
+                                WHEN upload_date LIKE '%年%'
+                                THEN to_timestamp(upload_date, 'YYYY"年"MM"月"DD"日"HH24"時"MI"分"')::timestamp
+                                     AT TIME ZONE 'UTC'
+                                ELSE NULLIF(upload_date, '')::timestamptz
+                            END
+                        )
+                    """)
+                for column in ('view_count', 'like_count'):
+                    if column_types.get(column) == 'integer':
+                        # セキュリティ: 固定のカラム名のみ使用
+                        c.execute(f"ALTER TABLE contents ALTER COLUMN {column} TYPE BIGINT")
+
+                c.execute("ALTER TABLE contents ADD COLUMN IF NOT EXISTS upload_date_display TEXT")
+                c.execute("ALTER TABLE contents ADD COLUMN IF NOT EXISTS embed_url TEXT")
+                c.execute("""
+                    UPDATE contents SET
+                        upload_date_display = to_char(
+                            upload_date AT TIME ZONE 'UTC', 'YYYY"年"MM"月"DD"日"HH24"時"MI"分"'
+                        ),
+                        embed_url = CASE
+                            WHEN video_url LIKE '%watch?v=%'
+                            THEN 'https://www.youtube.com/embed/' || split_part(video_url, 'watch?v=', 2)
+                            ELSE video_url
+                        END
+                    WHERE upload_date_display IS NULL OR embed_url IS NULL
+                """)
+                conn.commit()
+                logger.info("'contents' table migrated successfully (%d rows backfilled).", c.rowcount)
+            except psycopg2.Error as e:
+                logger.error("Error while migrating 'contents' table: %s", e)
+                conn.rollback()
+
+
 def create_category_table() -> None:
     """`category`テーブルを作成"""
     logger.info("Creating 'category' table...")
@@ -192,12 +465,29 @@ def create_category_table() -> None:
             players TEXT,
             level TEXT,
             channel_brand_category INTEGER,
+            classifier_version TEXT,
             FOREIGN KEY (channel_brand_category) REFERENCES cid(id) ON DELETE CASCADE            
         )
     '''
     create_table(query)
 
 
+def migrate_category_table() -> None:
+    """既存の `category` テーブルに classifier_version カラムを追加する（何度実行しても安全）
+
+    既存の行は NULL のままなので、次回の分類で一度だけ分類し直される。
+    """
+    logger.info("Migrating 'category' table...")
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("ALTER TABLE category ADD COLUMN IF NOT EXISTS classifier_version TEXT")
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while migrating 'category' table: %s", e)
+                conn.rollback()
+
+
 def create_feedback_table() -> None:
     """`feedback`テーブルを作成"""
     logger.info("Creating 'feedback' table...")
@@ -215,8 +505,377 @@ def create_feedback_table() -> None:
     # id INTEGER PRIMARY KEY AUTOINCREMENT, < for sqlite
 
 
+def create_data_generation_table() -> None:
+    """`data_generation`テーブルを作成（取り込みのたびに世代番号を進め、キャッシュ無効化に使う）"""
+    logger.info("Creating 'data_generation' table...")
+    query = '''
+        CREATE TABLE IF NOT EXISTS data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO data_generation (id, generation) VALUES (1, 0)
+        ON CONFLICT (id) DO NOTHING
+    '''
+    create_table(query)
+
+
+def create_crawl_state_table() -> None:
+    """`crawl_state`テーブルを作成（チャンネルごとの前回取り込み位置。差分取り込みで使う）"""
+    logger.info("Creating 'crawl_state' table...")
+    query = '''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            channel_id TEXT PRIMARY KEY,
+            uploads_playlist_id TEXT,
+            last_video_id TEXT,
+            last_published_at TIMESTAMPTZ,
+            etag TEXT,
+            last_run_at TIMESTAMPTZ,
+            videos_added INTEGER NOT NULL DEFAULT 0
+        )
+    '''
+    create_table(query)
+
+
+def get_crawl_state(channel_id: str) -> Dict[str, Any]:
+    """チャンネルの前回取り込み位置を取得（未取り込みなら空の辞書）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    SELECT uploads_playlist_id, last_video_id, last_published_at, etag, last_run_at
+                    FROM crawl_state WHERE channel_id = %s
+                """, (channel_id,))
+                row = c.fetchone()
+            except psycopg2.Error as e:
+                logger.error("Error while reading crawl state: %s", e)
+                conn.rollback()
+                return {}
+    if row is None:
+        return {}
+    keys = ('uploads_playlist_id', 'last_video_id', 'last_published_at', 'etag', 'last_run_at')
+    return dict(zip(keys, row))
+
+
+def save_crawl_state(channel_id: str, state: Dict[str, Any], videos_added: int) -> None:
+    """チャンネルの取り込み位置を保存する（取り込んだ動画をコミットした後に呼ぶ）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    INSERT INTO crawl_state (channel_id, uploads_playlist_id, last_video_id,
+                        last_published_at, etag, last_run_at, videos_added)
+                    VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, %s)
+                    ON CONFLICT (channel_id) DO UPDATE SET
+                        uploads_playlist_id = EXCLUDED.uploads_playlist_id,
+                        last_video_id = EXCLUDED.last_video_id,
+                        last_published_at = EXCLUDED.last_published_at,
+                        etag = EXCLUDED.etag,
+                        last_run_at = EXCLUDED.last_run_at,
+                        videos_added = EXCLUDED.videos_added
+                """, (
+                    channel_id, state.get('uploads_playlist_id'), state.get('last_video_id'),
+                    state.get('last_published_at'), state.get('etag'), videos_added
+                ))
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while saving crawl state: %s", e)
+                conn.rollback()
+
+
+def get_known_video_ids() -> set:
+    """取り込み済みの動画IDの集合（差分取り込みでページ送りを止める目印）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("SELECT id FROM contents")
+                return {row[0] for row in c.fetchall()}
+            except psycopg2.Error as e:
+                logger.error("Error while reading video IDs: %s", e)
+                conn.rollback()
+                return set()
+
+
+def get_channel_number(channel_id: str) -> Optional[int]:
+    """YouTubeのチャンネルIDから cid.id（contents.channel_category の値）を取得"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute("SELECT id FROM cid WHERE cid = %s", (channel_id,))
+            row = c.fetchone()
+    return row[0] if row else None
+
+
+# データ世代のプロセス内キャッシュ: (世代番号, 更新日時, 取得時刻)
+DATA_GENERATION_TTL_SECONDS = 5.0
+_data_generation: Optional[tuple] = None
+_data_generation_lock = threading.Lock()
+
+
+def get_data_version(max_age: Optional[float] = None) -> tuple:
+    """現在のデータ世代 (世代番号, 更新日時) を取得
+
+    別プロセス（main.py など）での取り込みも検知できるようDBに保存しているが、
+    リクエストごとにDBへ問い合わせないよう max_age 秒（既定 DATA_GENERATION_TTL）はキャッシュする。
+    """
+    global _data_generation
+    if max_age is None:
+        max_age = float(os.getenv('DATA_GENERATION_TTL', DATA_GENERATION_TTL_SECONDS))
+    with _data_generation_lock:
+        cached = _data_generation
+    if cached is not None and time.monotonic() - cached[2] < max_age:
+        return cached[0], cached[1]
+
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("SELECT generation, updated_at FROM data_generation WHERE id = 1")
+                row = c.fetchone()
+            except psycopg2.Error as e:
+                logger.error("Error while reading data generation: %s", e)
+                conn.rollback()
+                # 取得できない場合は最後に分かっている世代を使い続ける
+                return (cached[0], cached[1]) if cached else (0, None)
+
+    generation, updated_at = row if row else (0, None)
+    with _data_generation_lock:
+        _data_generation = (generation, updated_at, time.monotonic())
+    return generation, updated_at
+
+
+def get_data_generation(max_age: Optional[float] = None) -> int:
+    """現在のデータ世代番号を取得"""
+    return get_data_version(max_age)[0]
+
+
+def bump_data_generation() -> int:
+    """データ世代番号を進める（取り込み・チャンネル名更新の完了後に呼ぶ）"""
+    global _data_generation
+    create_data_generation_table()
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    UPDATE data_generation
+                    SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = 1
+                    RETURNING generation, updated_at
+                """)
+                generation, updated_at = c.fetchone()
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while bumping data generation: %s", e)
+                conn.rollback()
+                raise
+    with _data_generation_lock:
+        _data_generation = (generation, updated_at, time.monotonic())
+    logger.info("Data generation bumped to %d", generation)
+    return generation
+
+
+# /search 用の非正規化ビュー（contents / category / cid を取り込み時に1回だけ結合しておく）
+# 列の並びは utilities/search_query.RESULT_COLUMNS と utilities/memory_search.LOAD_QUERY の前提
+# popularity は sort=relevance の事前スコア（再生回数・いいね数の対数。取り込み時に計算される）
+# 定義を変えたら SEARCH_VIEW_VERSION を上げること（refresh_search_view が作り直す）
+SEARCH_VIEW_VERSION = 'search_view v3'
+SEARCH_VIEW_QUERY = '''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS search_view AS
+    SELECT
+        c.id, c.title, c.upload_date_display, c.embed_url, c.view_count,
+        c.like_count, c.duration, c.channel_category, ch.cname,
+        c.upload_date, cat.category_title, cat.players, cat.level,
+        cat.channel_brand_category, cat_ch.id IS NOT NULL AS in_category,
+        ln(1 + GREATEST(COALESCE(c.view_count, 0), 0)::double precision)
+            + 2 * ln(1 + GREATEST(COALESCE(c.like_count, 0), 0)::double precision) AS popularity
+    FROM contents c
+    LEFT JOIN cid ch ON c.channel_category = ch.id
+    LEFT JOIN category cat ON c.id = cat.id
+    LEFT JOIN cid cat_ch ON cat.channel_brand_category = cat_ch.id
+'''
+
+# search_view のインデックス（並び替えは search_query.SORT_EXPRESSIONS と一致させる）
+# REFRESH ... CONCURRENTLY には id のユニークインデックスが必要
+SEARCH_VIEW_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_search_view_id ON search_view (id)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_upload_date_id "
+    "ON search_view ((COALESCE(upload_date, '-infinity'::timestamptz)) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_view_count_id "
+    "ON search_view ((COALESCE(view_count, -1)) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_like_count_id "
+    "ON search_view ((COALESCE(like_count, -1)) DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_popularity_id ON search_view (popularity DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_category_popularity "
+    "ON search_view (category_title, popularity DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_filters "
+    "ON search_view (category_title, level, players) WHERE in_category",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_players ON search_view (players) WHERE in_category",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_level ON search_view (level) WHERE in_category",
+    "CREATE INDEX IF NOT EXISTS idx_search_view_channel ON search_view (channel_brand_category) WHERE in_category",
+]
+
+# タイトルの部分一致（ILIKE）用。pg_trgm 拡張がある場合のみ作成する
+SEARCH_VIEW_TITLE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_search_view_title_gin ON search_view USING gin (title gin_trgm_ops)"
+)
+
+
+def create_search_view() -> None:
+    """`search_view` マテリアライズドビューとインデックスを作成（作成時にデータも入る）"""
+    logger.info("Creating 'search_view' materialized view...")
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute(SEARCH_VIEW_QUERY)
+                c.execute(f"COMMENT ON MATERIALIZED VIEW search_view IS '{SEARCH_VIEW_VERSION}'")
+                for query in SEARCH_VIEW_INDEXES:
+                    c.execute(query)
+                c.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                if c.fetchone():
+                    c.execute(SEARCH_VIEW_TITLE_INDEX)
+                else:
+                    logger.warning("pg_trgm is not installed; search_view.title is not indexed")
+                conn.commit()
+                logger.info("'search_view' created successfully.")
+            except psycopg2.Error as e:
+                logger.error("Error while creating search_view: %s", e)
+                conn.rollback()
+                raise
+
+
+def refresh_search_view() -> None:
+    """取り込み後に `search_view` を更新する
+
+    ビューがなければ作成する（テーブルの DROP ... CASCADE で消えている場合を含む）。
+    定義が古い（SEARCH_VIEW_VERSION と異なる）ビューは作り直す。
+    既存のビューは CONCURRENTLY で更新するため、更新中も /search は古い内容を読み続けられる。
+    """
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute("SELECT obj_description(to_regclass('search_view'), 'pg_class'), "
+                      "to_regclass('search_view') IS NOT NULL")
+            version, exists = c.fetchone()
+            if exists and version != SEARCH_VIEW_VERSION:
+                logger.info("Recreating 'search_view' (%s -> %s)", version, SEARCH_VIEW_VERSION)
+                c.execute("DROP MATERIALIZED VIEW search_view")
+                conn.commit()
+                exists = False
+        conn.rollback()
+    if not exists:
+        create_search_view()
+        return
+
+    logger.info("Refreshing 'search_view'...")
+    started = time.perf_counter()
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY search_view")
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while refreshing search_view: %s", e)
+                conn.rollback()
+                raise
+    logger.info("'search_view' refreshed in %.2fs", time.perf_counter() - started)
+
+
+# シャドウテーブルによる再構築: 取り込みは SHADOW_SCHEMA に作った空のテーブルに対して行い、
+# インデックス作成・ANALYZE・search_view の作成まで終えてから1トランザクションで public と入れ替える。
+# 入れ替えまで読み手は古いテーブルを読み続け、feedback などの他のテーブルには触れない。
+SHADOW_SCHEMA = 'ingest_shadow'
+RETIRED_SCHEMA = 'ingest_retired'
+REBUILD_TABLES = ('cid', 'contents', 'category')
+SWAP_LOCK_TIMEOUT = '10s'
+
+
+def prepare_shadow_tables() -> None:
+    """SHADOW_SCHEMA に空の cid / contents / category を作る（前回の残りは削除）"""
+    logger.info("Preparing shadow tables in '%s'...", SHADOW_SCHEMA)
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            # セキュリティ: スキーマ名は固定値のみ
+            c.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+            c.execute(f"CREATE SCHEMA {SHADOW_SCHEMA}")
+        conn.commit()
+    with use_write_schema(SHADOW_SCHEMA):
+        create_cid_table()
+        create_contents_table()
+        create_category_table()
+    # 作成に失敗したまま進むと public のテーブルに書き込んでしまうため確認する
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", (SHADOW_SCHEMA,))
+            created = {row[0] for row in c.fetchall()}
+        conn.rollback()
+    missing = set(REBUILD_TABLES) - created
+    if missing:
+        raise RuntimeError(f"Failed to create shadow tables: {sorted(missing)}")
+
+
+def build_shadow_indexes() -> None:
+    """シャドウテーブルのインデックス・統計情報・search_view を作る（入れ替え前に呼ぶ）"""
+    from utilities.create_indexes import create_indexes
+
+    logger.info("Building indexes on shadow tables...")
+    with use_write_schema(SHADOW_SCHEMA):
+        with use_db_connection() as conn:
+            create_indexes(conn, schema=SHADOW_SCHEMA)
+            with conn.cursor() as c:
+                for table in REBUILD_TABLES:
+                    c.execute(f"ANALYZE {SHADOW_SCHEMA}.{table}")
+            conn.commit()
+        # search_view は SHADOW_SCHEMA に作られ、シャドウテーブルを参照する
+        # （refresh_search_view は public の既存ビューを見つけてしまうため使わない）
+        create_search_view()
+        with use_db_connection() as conn:
+            with conn.cursor() as c:
+                c.execute(f"ANALYZE {SHADOW_SCHEMA}.search_view")
+            conn.commit()
+
+
+def swap_shadow_tables() -> None:
+    """シャドウテーブルと search_view を1トランザクションで public に入れ替え、古いものを削除する
+
+    作り直したデータに合わせてクロール状態も消す（取り込み後に保存し直す）。
+    読み手は入れ替えの直前か直後のどちらかのデータだけを見る。
+    """
+    logger.info("Swapping shadow tables into 'public'...")
+    started = time.perf_counter()
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                # 長いクエリのロック待ちで読み手を止め続けないよう、待ち時間に上限を付ける
+                c.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+                c.execute(f"DROP SCHEMA IF EXISTS {RETIRED_SCHEMA} CASCADE")
+                c.execute(f"CREATE SCHEMA {RETIRED_SCHEMA}")
+                c.execute(f"ALTER MATERIALIZED VIEW IF EXISTS public.search_view SET SCHEMA {RETIRED_SCHEMA}")
+                for table in REBUILD_TABLES:
+                    c.execute(f"ALTER TABLE IF EXISTS public.{table} SET SCHEMA {RETIRED_SCHEMA}")
+                for table in REBUILD_TABLES:
+                    c.execute(f"ALTER TABLE {SHADOW_SCHEMA}.{table} SET SCHEMA public")
+                c.execute(f"ALTER MATERIALIZED VIEW {SHADOW_SCHEMA}.search_view SET SCHEMA public")
+                c.execute("SELECT to_regclass('public.crawl_state')")
+                if c.fetchone()[0] is not None:
+                    c.execute("DELETE FROM public.crawl_state")
+                c.execute(f"DROP SCHEMA {RETIRED_SCHEMA} CASCADE")
+                c.execute(f"DROP SCHEMA {SHADOW_SCHEMA}")
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while swapping shadow tables: %s", e)
+                conn.rollback()
+                raise
+    invalidate_channel_directory()
+    logger.info("Shadow tables swapped in %.3fs", time.perf_counter() - started)
+
+
+def drop_shadow_tables() -> None:
+    """入れ替えずに終える場合にシャドウテーブルを削除する（public はそのまま）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+        conn.commit()
+
+
 def insert_cid_data(cid: str, cname: str, clink: str) -> None:
-    """`cid`テーブルにデータを挿入"""
+    """`cid`テーブルにデータを挿入（失敗したらロールバックして例外を投げる）"""
     logger.info("Inserting data into 'cid' table...")
     with use_db_connection() as conn:
         with conn.cursor() as c:
@@ -227,90 +886,35 @@ def insert_cid_data(cid: str, cname: str, clink: str) -> None:
                     ON CONFLICT (cid) DO NOTHING
                 ''', (cid, cname, clink))
                 conn.commit()
+                invalidate_channel_directory()
                 logger.info("Data inserted into 'cid' table successfully.")
             except psycopg2.Error as e:
                 logger.error("Error while inserting data into 'cid' table: %s", e)
                 conn.rollback()
+                raise
 
 
 def insert_category_data(contents_data: List[Dict[str, Any]], channel_category: int) -> None:
-    """`category`テーブルにデータを挿入"""
-    logger.info("Inserting data into 'category' table...")
+    """`category`テーブルにデータを挿入（1トランザクションで一括書き込み）
+
+    失敗した場合は load_batch がログ出力・ロールバックした上で psycopg2.Error を投げる
+    （呼び出し側は、書き込みが成功したときだけクロール状態などを保存すること）。
+    """
+    logger.info("Inserting %d rows into 'category' table...", len(contents_data))
     with use_db_connection() as conn:
-        with conn.cursor() as c:
-            try:
-                for data in contents_data:
-                    c.execute('''
-                        INSERT INTO category (ID, category_title, players, level, channel_brand_category)
-                        VALUES (%s, %s, %s, %s, %s) ON CONFLICT (ID) DO NOTHING
-                    ''', (data["id"], data["category"], data["nop"], data["level"], channel_category))
-                    conn.commit()
-                logger.info("Data inserted into 'category' table successfully.")
-            except psycopg2.Error as e:
-                logger.error("Error while inserting data into 'category' table: %s", e)
-                conn.rollback()
+        load_batch(conn, [], [category_record(data, channel_category) for data in contents_data])
+    logger.info("Data inserted into 'category' table successfully.")
 
 
 def insert_contents_data(video_data: List[Dict[str, Any]], channel_category: int) -> None:
-    """CSVファイルからデータをデータベースに挿入"""
-    logger.info("Inserting data from CSV into 'contents' table...")
-    #df = pd.read_csv(file_path)
-    #duplicates = find_duplicates(df)
-
-    # if duplicates:
-    #     r = input(f"Duplicate IDs found: {duplicates}. Do you want to delete them? (y/n): ")
-    #     if r.lower() == "y":
-    #         df = df.drop_duplicates(subset="ID", keep="first")
-    #         df.to_csv(file_path, index=False)
-    #         logger.info("Duplicates removed and CSV file updated.")
-    #     else:
-    #         logger.info("Processing stopped due to duplicate IDs.")
-    #         return
-    with use_db_connection() as conn:  # データベース接続
-        with conn.cursor() as c:  # カーソルのクローズを自動管理
-            try:
-                for data in video_data:
-                    # like_count の変換処理
-                    like_count = data.get('like_count')
-                    if like_count in ('N/A', None):
-                        like_count = None
-                    else:
-                        try:
-                            like_count = int(like_count)
-                        except ValueError:
-                            logger.warning("Invalid like_count value for ID %s: %s", data['id'], like_count)
-                            like_count = None  # 数値変換できない場合は None にする
-
-                    # channel_category の存在チェック
-                    #channel_category = data.get('channel_category', None)  # デフォルト値を None に
-
-                    logger.info(
-                        "INSERTするデータ: %s, %s, %s, %s, %s, %s, %s, %s",
-                        data['id'], data['title'], data['upload_date'], data['url'],
-                        data['view_count'], like_count, data['duration'], channel_category
-                    )
+    """取得した動画データを`contents`テーブルに挿入（1トランザクションで一括書き込み）
 
-                    # データ挿入
-                    try:
-                        c.execute('''
-                            INSERT INTO contents (id, title, upload_date, video_url, 
-                            view_count, like_count, duration, channel_category)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) 
-                            ON CONFLICT (id) DO NOTHING
-                        ''', (
-                            data['id'], data['title'], data['upload_date'], data['url'],
-                            data['view_count'], like_count, data['duration'], channel_category
-                        ))
-                    except psycopg2.Error as e:
-                        logger.error("Error while inserting data for ID %s: %s", data['id'], e)
-                        conn.rollback()  # エラー発生時にロールバック
-
-                conn.commit()  # すべての処理が成功したらコミット
-                logger.info("All data inserted successfully into 'contents' table.")
-
-            except Exception as e:
-                conn.rollback()  # 致命的なエラーが発生した場合にロールバック
-                logger.error("Unexpected error: %s", e)
+    失敗した場合は load_batch がログ出力・ロールバックした上で psycopg2.Error を投げる。
+    """
+    logger.info("Inserting %d rows into 'contents' table...", len(video_data))
+    with use_db_connection() as conn:
+        load_batch(conn, [contents_record(data, channel_category) for data in video_data], [])
+    logger.info("All data inserted successfully into 'contents' table.")
 
 
 def search_content_table() -> List[tuple]:
@@ -318,14 +922,77 @@ def search_content_table() -> List[tuple]:
     logger.info("Searching data in 'contents' table...")
     with use_db_connection() as conn:
         c = conn.cursor()
-        query = 'SELECT * FROM contents'
+        # update_category が想定する8列（表示用に追加したカラムは含めない）
+        query = '''
+            SELECT id, title, upload_date, video_url, view_count, like_count, duration, channel_category
+            FROM contents
+        '''
         c.execute(query)
         #c.execute("SELECT * FROM contents WHERE id = %s;", ('B-uDfqk20ac',))
         results = c.fetchall()
         logger.info("Search completed. Found %d records.", len(results))
-        print(results)
         return results
 
+
+# 分類が必要な動画（category の行がない、または判定ルールのバージョンが違う）
+# 列は search_content_table と同じ（update_category が想定する8列）
+UNCLASSIFIED_CONTENTS_QUERY = '''
+    SELECT c.id, c.title, c.upload_date, c.video_url, c.view_count, c.like_count,
+           c.duration, c.channel_category
+    FROM contents c
+    LEFT JOIN category cat ON cat.id = c.id
+    WHERE cat.id IS NULL OR cat.classifier_version IS DISTINCT FROM %s
+'''
+
+DEFAULT_STREAM_BATCH_SIZE = 5000
+
+
+def search_unclassified_contents(classifier_version: str) -> List[tuple]:
+    """分類が必要な動画を一度に取得（件数が多い場合は iter_unclassified_contents を使う）"""
+    logger.info("Searching contents to classify (classifier %s)...", classifier_version)
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute(UNCLASSIFIED_CONTENTS_QUERY, (classifier_version,))
+            results = c.fetchall()
+        conn.rollback()
+    logger.info("Found %d contents to classify.", len(results))
+    return results
+
+
+def stream_rows(query: str, params: tuple = (), batch_size: Optional[int] = None,
+                name: str = 'stream_rows') -> Generator[List[tuple], None, None]:
+    """名前付き（サーバーサイド）カーソルで結果を batch_size 行ずつ返す
+
+    結果全体をクライアントに読み込まないため、メモリ使用量は件数によらず batch_size 行分で済む。
+    読み終わるまで接続を1本借りたままにし、トランザクションを開いておく
+    （途中で書き込む場合は別の接続で行うこと。この接続でコミットするとカーソルが閉じる）。
+    """
+    if batch_size is None:
+        batch_size = int(os.getenv('STREAM_BATCH_SIZE', DEFAULT_STREAM_BATCH_SIZE))
+    with use_db_connection() as conn:
+        try:
+            with conn.cursor(name=name) as c:
+                c.itersize = batch_size
+                c.execute(query, params)
+                while True:
+                    rows = c.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+        except psycopg2.Error as e:
+            logger.error("Error while streaming rows: %s", e)
+            raise
+        finally:
+            conn.rollback()
+
+
+def iter_unclassified_contents(classifier_version: str,
+                               batch_size: Optional[int] = None) -> Generator[List[tuple], None, None]:
+    """分類が必要な動画を batch_size 行ずつ返す（列は search_unclassified_contents と同じ）"""
+    return stream_rows(UNCLASSIFIED_CONTENTS_QUERY, (classifier_version,), batch_size,
+                       name='unclassified_contents')
+
+
 # def search_table(search_term: str = None):
 #     """`contents`テーブルからデータを検索"""
 #     logger.info("Searching data in 'contents' table...")
@@ -344,18 +1011,55 @@ def search_content_table() -> List[tuple]:
 #         return [[result[0], result[1]] for result in results]
 
 
-def get_channel_name_from_id(id: int) -> str:
-    """チャンネルIDからチャンネル名を取得"""
-    logger.info(f"Getting channel name for ID: {id}")
+# チャンネル一覧のプロセス内キャッシュ（cid テーブルが変わったら invalidate_channel_directory() で破棄）
+_channel_directory: Optional[Dict[int, Dict[str, Any]]] = None
+_channel_directory_lock = threading.Lock()
+
+
+def get_channel_directory() -> Dict[int, Dict[str, Any]]:
+    """チャンネル一覧（id -> {id, channel_name, channel_link}）を取得（プロセス内キャッシュ）"""
+    global _channel_directory
+    with _channel_directory_lock:
+        if _channel_directory is not None:
+            return _channel_directory
+    logger.info("Loading channel directory from 'cid' table...")
+    directory: Dict[int, Dict[str, Any]] = {}
     with use_db_connection() as conn:
         with conn.cursor() as c:
             try:
-                c.execute("SELECT cname FROM cid WHERE id = %s", (id,))
-                result = c.fetchone()
-                return result[0] if result else "Unknown Channel"
+                c.execute("""
+                    SELECT id, cname, clink
+                    FROM cid
+                    WHERE cname IS NOT NULL AND cname != ''
+                    ORDER BY id
+                """)
+                for channel_id, cname, clink in c.fetchall():
+                    directory[channel_id] = {
+                        "id": channel_id,
+                        "channel_name": cname,
+                        "channel_link": clink,
+                    }
             except psycopg2.Error as e:
-                logger.error("Error while getting channel name: %s", e)
-                return "Unknown Channel"
+                logger.error("Error while loading channel directory: %s", e)
+                # 失敗した結果はキャッシュしない
+                return directory
+    with _channel_directory_lock:
+        _channel_directory = directory
+    return directory
+
+
+def invalidate_channel_directory() -> None:
+    """チャンネル一覧キャッシュを破棄する（cid テーブル更新後に呼ぶ）"""
+    global _channel_directory
+    with _channel_directory_lock:
+        _channel_directory = None
+    logger.info("Channel directory cache invalidated")
+
+
+def get_channel_name_from_id(id: int) -> str:
+    """チャンネルIDからチャンネル名を取得"""
+    channel = get_channel_directory().get(id)
+    return channel["channel_name"] if channel else "Unknown Channel"
 
 
 def search_db() -> List[str]:
@@ -0,0 +1,169 @@
+"""
+絞り込みの選択肢（カテゴリ・人数・レベル・チャンネル）の事前計算
+
+選択肢は取り込み時にしか変わらないため、取り込み完了後に1回だけ DISTINCT を実行して
+JSONファイルに保存し、Webアプリはそれをメモリに読み込んで /bootstrap などから返します。
+ファイルは一時ファイルに書いてから os.replace で差し替えるため、読み手が書きかけを見ることはない。
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILTER_OPTIONS_PATH = './data/filter_options.json'
+
+# レベルの表示順（ここにないレベルは末尾に名前順で並べる）
+LEVEL_SORT_ORDER = {'小学生以上': 1, '中学生': 2, '高校生': 3, 'ユース': 4}
+
+# 選択肢が空の場合の既定値
+DEFAULT_CATEGORY_TITLES = ['対人', 'その他']
+DEFAULT_LEVELS = list(LEVEL_SORT_ORDER)
+
+
+def get_filter_options_path() -> str:
+    """選択肢ファイルのパス（FILTER_OPTIONS_PATH 環境変数で変更可能）"""
+    return os.getenv('FILTER_OPTIONS_PATH', DEFAULT_FILTER_OPTIONS_PATH)
+
+
+def sort_players(values: List[str]) -> List[str]:
+    """人数の選択肢を「n対n」→「n人」→ その他 の順に数値で並べる"""
+    def key(value: str):
+        match = re.match(r'^(\d+)対(\d+)$', value)
+        if match:
+            return (0, int(match.group(1)), int(match.group(2)), value)
+        match = re.match(r'^(\d+)人$', value)
+        if match:
+            return (1, int(match.group(1)), 0, value)
+        return (2, 0, 0, value)
+    return sorted(values, key=key)
+
+
+def sort_category_titles(values: List[str]) -> List[str]:
+    """カテゴリの選択肢を名前順に並べ、「その他」を最後にする"""
+    return sorted(values, key=lambda value: (value == 'その他', value))
+
+
+def sort_levels(values: List[str]) -> List[str]:
+    """レベルの選択肢を LEVEL_SORT_ORDER の順に並べる"""
+    return sorted(values, key=lambda value: (LEVEL_SORT_ORDER.get(value, len(LEVEL_SORT_ORDER) + 1), value))
+
+
+def build_filter_options(conn: psycopg2.extensions.connection) -> Dict[str, Any]:
+    """category / cid テーブルから絞り込みの選択肢を作る"""
+    options: Dict[str, Any] = {}
+    with conn.cursor() as c:
+        # セキュリティ: カラム名は固定値のみ
+        distinct_values = {}
+        for column in ('category_title', 'players', 'level'):
+            c.execute(f"""
+                SELECT DISTINCT {column}
+                FROM category
+                WHERE {column} IS NOT NULL AND {column} != ''
+            """)
+            distinct_values[column] = [row[0] for row in c.fetchall()]
+
+        c.execute("""
+            SELECT id, cname, clink
+            FROM cid
+            WHERE cname IS NOT NULL AND cname != ''
+            ORDER BY id
+        """)
+        channels = [
+            {"id": channel_id, "channel_name": cname, "channel_link": clink}
+            for channel_id, cname, clink in c.fetchall()
+        ]
+    conn.rollback()
+
+    options['category_title'] = sort_category_titles(distinct_values['category_title'])
+    options['players'] = sort_players(distinct_values['players'])
+    options['levels'] = [{"level": level} for level in sort_levels(distinct_values['level'])]
+    options['channels'] = channels
+    return options
+
+
+def save_filter_options(options: Dict[str, Any], path: Optional[str] = None) -> None:
+    """選択肢をJSONファイルに保存する（アトミックに差し替え）"""
+    path = path or get_filter_options_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.filter_options.')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(options, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info("Filter options written to %s", path)
+
+
+def load_filter_options(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """JSONファイルから選択肢を読み込む（ない・壊れている場合は None）"""
+    path = path or get_filter_options_path()
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error("Failed to load filter options from %s: %s", path, e)
+        return None
+
+
+def build_filter_options_from_db(path: Optional[str] = None) -> Dict[str, Any]:
+    """DBから選択肢を作ってファイルに保存する（取り込み完了後、データ世代を進める前に呼ぶ）"""
+    from utilities.db_access import use_db_connection
+
+    with use_db_connection() as conn:
+        options = build_filter_options(conn)
+    save_filter_options(options, path)
+    return options
+
+
+class FilterOptionsStore:
+    """データ世代ごとに選択肢をメモリに保持する
+
+    世代が変わったときだけファイルを読み直す。ファイルがない場合は DB から作って保存する。
+    """
+
+    def __init__(self):
+        self._options: Optional[Dict[str, Any]] = None
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self, generation: int) -> Dict[str, Any]:
+        with self._lock:
+            if self._options is not None and self._generation == generation:
+                return self._options
+            options = load_filter_options()
+            if options is None:
+                logger.info("Filter options file not found; building from database")
+                options = build_filter_options_from_db()
+            self._options = options
+            self._generation = generation
+            return options
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._options = None
+            self._generation = None
+
+
+# プロセス内で共有するストア
+filter_options_store = FilterOptionsStore()
@@ -1,17 +1,15 @@
-import requests
 import os
 from dotenv import load_dotenv
 
+from utilities.youtube_client import QuotaExceededError, get_youtube_client
+
 load_dotenv()
 
 def get_channel_id(channel_link):
     """YouTubeチャンネルリンクからチャンネルIDを取得"""
     try:
-        response = requests.get(channel_link)
-        response.raise_for_status()
-        
         # HTMLからチャンネルIDを抽出
-        content = response.text
+        content = get_youtube_client().get_page(channel_link)
         if 'channel_id=' in content:
             start = content.find('channel_id=') + 12
             end = content.find('&', start)
@@ -34,16 +32,15 @@ def get_channel_details(channel_id, api_key=None):
     if not api_key:
         return 'N/A'
     
-    url = f"https://www.googleapis.com/youtube/v3/channels?part=snippet&id={channel_id}&key={api_key}"
-    
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = get_youtube_client().get('channels', {'part': 'snippet', 'id': channel_id, 'key': api_key})
         
-        if data['items']:
+        if data.get('items'):
             return data['items'][0]['snippet']['title']
         return 'N/A'
+    except QuotaExceededError:
+        # クォータ超過は呼び出し側で取り込みごと打ち切る
+        raise
     except Exception as e:
         print(f"Error getting channel details: {e}")
         return 'N/A'
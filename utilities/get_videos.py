@@ -1,10 +1,12 @@
-import requests
-import time
 import isodate
 import logging
-from typing import Optional, List, Dict
+from concurrent.futures import Executor
+from typing import Optional, List, Dict, Iterator, Set, Tuple
 import csv
 import os
+from datetime import datetime, timezone
+
+from utilities.youtube_client import get_youtube_client
 
 # ロガーの設定
 logging.basicConfig(
@@ -27,31 +29,89 @@ def convert_duration(duration: str) -> str:
         return "N/A"
 
 
-def fetch_video_details(video_ids: List[str], api_key: str) -> List[Dict]:
-    """動画IDリストから詳細情報を取得"""
-    video_details_url = f"https://www.googleapis.com/youtube/v3/videos?key={api_key}&id={','.join(video_ids)}&part=statistics,contentDetails"
+def convert_to_embed_url(video_url: str) -> str:
+    """YouTubeの通常リンクからVIDEO_IDを抽出し、埋め込みリンクを生成する"""
+    if "watch?v=" in video_url:
+        video_id = video_url.split("watch?v=")[-1]
+        return f"https://www.youtube.com/embed/{video_id}"
+    return video_url  # 他のリンク形式の場合そのまま返す
+
+
+def format_upload_date(upload_date: str) -> Optional[str]:
+    """投稿日時（ISO 8601, UTC）を表示用の日本語形式に変換（取り込み時に一度だけ計算する）"""
+    dt = upload_date.rstrip("Z")
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y年%m月%d日%H時%M分"):
+        try:
+            return datetime.strptime(dt, fmt).strftime("%Y年%m月%d日%H時%M分")
+        except ValueError:
+            continue
+    logger.error("Unsupported date format: %s", upload_date)
+    return None
+
+
+def parse_count(value) -> Optional[int]:
+    """APIの再生数・高評価数（文字列 / 'N/A'）を整数に変換"""
+    if value in ('N/A', None, ''):
+        return None
     try:
-        response = requests.get(video_details_url)
-        response.raise_for_status()
-        logger.info("Fetched video details for %d videos", len(video_ids))
-        return response.json().get('items', [])
-    except requests.exceptions.RequestException as e:
-        logger.error("Failed to fetch video details: %s", e)
-        return []
+        return int(value)
+    except (TypeError, ValueError):
+        logger.warning("Invalid count value: %s", value)
+        return None
+
+
+def fetch_video_details(video_ids: List[str], api_key: str) -> List[Dict]:
+    """動画IDリストから詳細情報を取得（videos.list: 1ユニット、最大50件）"""
+    data = get_youtube_client().get('videos', {
+        'key': api_key, 'id': ','.join(video_ids), 'part': 'statistics,contentDetails',
+    })
+    logger.info("Fetched video details for %d videos", len(video_ids))
+    return data.get('items', [])
 
 
 def fetch_videos_from_channel(channel_id: str, api_key: str, next_page_token: Optional[str] = None) -> Dict:
-    """チャンネルから動画一覧を取得"""
-    base_url = f"https://www.googleapis.com/youtube/v3/search?key={api_key}&channelId={channel_id}&part=snippet&type=video&maxResults=100"
-    url = f"{base_url}&pageToken={next_page_token}" if next_page_token else base_url
+    """チャンネルから動画一覧を新しい順に取得（search.list: 1ページ100ユニット、最大50件）"""
+    params = {
+        'key': api_key, 'channelId': channel_id, 'part': 'snippet', 'type': 'video',
+        'order': 'date', 'maxResults': 50,
+    }
+    if next_page_token:
+        params['pageToken'] = next_page_token
+    data = get_youtube_client().get('search', params)
+    logger.info("Fetched video list for channel: %s", channel_id)
+    return data
+
+
+def fetch_uploads_playlist_id(channel_id: str, api_key: str) -> Optional[str]:
+    """チャンネルのアップロード動画プレイリストIDを取得（channels.list: 1ユニット）"""
+    data = get_youtube_client().get('channels', {'key': api_key, 'id': channel_id, 'part': 'contentDetails'})
+    items = data.get('items', [])
+    if not items:
+        logger.warning("Channel not found: %s", channel_id)
+        return None
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        logger.info("Fetched video list for channel: %s", channel_id)
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error("Failed to fetch videos from channel: %s. Error: %s", channel_id, e)
-        return {}
+        return items[0]['contentDetails']['relatedPlaylists']['uploads']
+    except KeyError:
+        logger.error("Uploads playlist missing in channel response: %s", channel_id)
+        return None
+
+
+def fetch_playlist_items(playlist_id: str, api_key: str, next_page_token: Optional[str] = None,
+                         etag: Optional[str] = None) -> Dict:
+    """プレイリストの動画一覧を取得（playlistItems.list: 1ページ1ユニット、最大50件）
+
+    etag を渡すと条件付きリクエスト（If-None-Match）になり、変更がなければ
+    {'items': [], 'notModified': True} を返す。
+    """
+    params = {'key': api_key, 'playlistId': playlist_id, 'part': 'snippet,contentDetails', 'maxResults': 50}
+    if next_page_token:
+        params['pageToken'] = next_page_token
+    data = get_youtube_client().get('playlistItems', params, etag=etag)
+    if data is None:
+        logger.info("Playlist not modified: %s", playlist_id)
+        return {'items': [], 'notModified': True, 'etag': etag}
+    logger.info("Fetched playlist items: %s", playlist_id)
+    return data
 
 
 # def save_video_data_to_csv(output_file: str, video_data: List[Dict]):
@@ -89,63 +149,204 @@ def fetch_videos_from_channel(channel_id: str, api_key: str, next_page_token: Op
 #         logger.error("Failed to save video data to CSV: %s", e)
 
 
-def get_youtube_video_data(channel_id: str, api_key: str) -> List:
-    """指定したチャンネルIDから動画データを取得しCSVに保存"""
-    video_data = []
-    next_page_token = None
-    page_count = 0
-    max_pages = 10  # 最大10ページまで取得（1000件）に削減
-    max_videos = 500  # 最大500件まで取得
+# 動画一覧の取得方法（YOUTUBE_VIDEO_SOURCE 環境変数）
+VIDEO_SOURCE_UPLOADS = 'uploads'  # アップロード動画プレイリスト（全件取得、1ページ1ユニット）
+VIDEO_SOURCE_SEARCH = 'search'    # search.list（最大500件、1ページ100ユニット）
+
+# 1件あたり (動画ID, タイトル, 投稿日時)
+VideoEntry = Tuple[str, str, str]
+
+
+def get_video_source() -> str:
+    """動画一覧の取得方法（既定はアップロード動画プレイリスト）"""
+    source = os.getenv('YOUTUBE_VIDEO_SOURCE', VIDEO_SOURCE_UPLOADS).lower()
+    return source if source in (VIDEO_SOURCE_UPLOADS, VIDEO_SOURCE_SEARCH) else VIDEO_SOURCE_UPLOADS
+
 
-    while page_count < max_pages and len(video_data) < max_videos:
+def iter_search_pages(channel_id: str, api_key: str) -> Iterator[List[VideoEntry]]:
+    """search.list のページごとに動画を返す（最大10ページ）"""
+    next_page_token = None
+    max_pages = 10
+    for _ in range(max_pages):
         channel_data = fetch_videos_from_channel(channel_id, api_key, next_page_token)
         if not channel_data:
             logger.warning("No data returned for channel ID: %s", channel_id)
-            break
+            return
+        yield [
+            (item['id']['videoId'], item['snippet']['title'], item['snippet']['publishedAt'])
+            for item in channel_data.get('items', [])
+        ]
+        next_page_token = channel_data.get('nextPageToken')
+        if not next_page_token:
+            return
 
-        video_ids = [item['id']['videoId'] for item in channel_data.get('items', [])]
-        
-        # 動画数制限をチェック
-        remaining_slots = max_videos - len(video_data)
-        if len(video_ids) > remaining_slots:
-            video_ids = video_ids[:remaining_slots]
-        
-        details = fetch_video_details(video_ids, api_key)
-
-        for item in channel_data.get('items', []):
-            if len(video_data) >= max_videos:
+
+def iter_upload_pages(channel_id: str, api_key: str,
+                      crawl_state: Optional[Dict] = None) -> Iterator[List[VideoEntry]]:
+    """アップロード動画プレイリストのページごとに動画を新しい順に返す（全件）
+
+    投稿日時はプレイリストへの追加日時（snippet.publishedAt）ではなく動画の公開日時を使う。
+    非公開・削除済みの動画（videoPublishedAt がない）は除く。
+    crawl_state を渡すと、保存済みのプレイリストIDと先頭ページの ETag を使い
+    （先頭ページが変わっていなければ何も返さない）、新しい値を crawl_state に書き戻す。
+    """
+    crawl_state = crawl_state if crawl_state is not None else {}
+    playlist_id = crawl_state.get('uploads_playlist_id') or fetch_uploads_playlist_id(channel_id, api_key)
+    if not playlist_id:
+        return
+    crawl_state['uploads_playlist_id'] = playlist_id
+    next_page_token = None
+    while True:
+        etag = crawl_state.get('etag') if next_page_token is None else None
+        playlist_data = fetch_playlist_items(playlist_id, api_key, next_page_token, etag)
+        if not playlist_data:
+            logger.warning("No data returned for playlist: %s", playlist_id)
+            return
+        if next_page_token is None:
+            crawl_state['etag'] = playlist_data.get('etag')
+        if playlist_data.get('notModified'):
+            return
+        yield [
+            (item['contentDetails']['videoId'], item['snippet']['title'],
+             item['contentDetails']['videoPublishedAt'])
+            for item in playlist_data.get('items', [])
+            if item.get('contentDetails', {}).get('videoPublishedAt')
+        ]
+        next_page_token = playlist_data.get('nextPageToken')
+        if not next_page_token:
+            return
+
+
+def parse_published_at(value) -> Optional[datetime]:
+    """公開日時（API の ISO 8601 文字列 / DB の datetime）を UTC の datetime にする（不明なら None）"""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def iter_youtube_video_pages(channel_id: str, api_key: str, executor: Optional[Executor] = None,
+                             source: Optional[str] = None, crawl_state: Optional[Dict] = None,
+                             known_ids: Optional[Set[str]] = None) -> Iterator[List[Dict]]:
+    """指定したチャンネルIDから動画データを新しい順に、ページ（最大50件）ごとに返す
+
+    source（既定は YOUTUBE_VIDEO_SOURCE）が uploads の場合はアップロード動画プレイリストを
+    50件ずつ全件たどり、search の場合は従来どおり search.list で最大500件取得する。
+    uploads の件数上限は YOUTUBE_MAX_VIDEOS（0 または未設定で上限なし）。
+    executor を渡すと、各ページの動画詳細（videos.list）の取得を次ページの取得と並行して行う
+    （ページは次のページの一覧を取得し終えてから返す）。
+    リクエストの間隔は固定の待ち時間ではなく、共有のレートリミッターで制御する。
+    API の失敗は再試行しても回復しなければ YouTubeAPIError として送出する（それまでのページは返した後）。
+
+    差分取り込み: known_ids（取り込み済みの動画ID）に含まれる動画に到達した時点で
+    ページ送りを止め、それより新しい動画だけを返す。crawl_state を渡すと前回の位置
+    （プレイリストID・ETag）を使い、今回の位置（最新の動画ID・公開日時など）を書き戻す。
+    前回の公開日時（last_published_at）より新しい取り込み済みの動画では止めない
+    （途中で失敗した取り込みが書き込んだページより古い動画を取りこぼさないため）。
+    """
+    source = source or get_video_source()
+    known_ids = known_ids or set()
+    if source == VIDEO_SOURCE_SEARCH:
+        page_iter = iter_search_pages(channel_id, api_key)
+        max_videos = 500  # 最大500件まで取得
+    else:
+        page_iter = iter_upload_pages(channel_id, api_key, crawl_state)
+        max_videos = int(os.getenv('YOUTUBE_MAX_VIDEOS', 0)) or None
+    boundary = parse_published_at((crawl_state or {}).get('last_published_at'))
+
+    def is_stored(video_id: str, published_at: str) -> bool:
+        if video_id not in known_ids:
+            return False
+        published = parse_published_at(published_at)
+        return boundary is None or published is None or published <= boundary
+
+    pending = None  # 前のページ (動画, 詳細 or 詳細の Future)
+    collected = 0
+    reached_known = False
+    for page_count, entries in enumerate(page_iter, start=1):
+        # 取り込み済みの動画より後ろ（古い動画）は取得しない
+        for position, (video_id, _, published_at) in enumerate(entries):
+            if is_stored(video_id, published_at):
+                entries = entries[:position]
+                reached_known = True
                 break
-                
-            video_id = item['id']['videoId']
-            video_title = item['snippet']['title']
-            ch_id = item['snippet']['channelId']
-            upload_date = item['snippet']['publishedAt']
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-
-            # 詳細情報を検索
-            detail = next((d for d in details if d['id'] == video_id), {})
-            view_count = detail.get('statistics', {}).get('viewCount', 'N/A')
-            like_count = detail.get('statistics', {}).get('likeCount', 'N/A')
-            duration = convert_duration(detail.get('contentDetails', {}).get('duration', ''))
-
-            video_data.append({
-                'id': video_id,
-                'title': video_title,
-                'upload_date': upload_date,
-                'url': video_url,
-                'view_count': view_count,
-                'like_count': like_count,
-                'duration': duration
-            })
-
-        page_count += 1
-        logger.info(f"Processed page {page_count} for channel {channel_id}, total videos so far: {len(video_data)}")
-        
-        next_page_token = channel_data.get('nextPageToken')
-        if not next_page_token or len(video_data) >= max_videos:
+        # 動画数制限をチェック
+        if max_videos is not None:
+            entries = entries[:max_videos - collected]
+        # 1ページ最大50件 = videos.list の1回で取得できる件数
+        video_ids = [video_id for video_id, _, _ in entries]
+
+        if not video_ids:
+            details = []
+        elif executor is not None:
+            details = executor.submit(fetch_video_details, video_ids, api_key)
+        else:
+            details = fetch_video_details(video_ids, api_key)
+
+        if page_count == 1 and crawl_state is not None and entries:
+            newest_id, _, newest_published_at = entries[0]
+            crawl_state['last_video_id'] = newest_id
+            crawl_state['last_published_at'] = newest_published_at
+
+        # このページの詳細を取得している間に、前のページを返す
+        if pending is not None:
+            yield build_video_data(*pending)
+        pending = (entries, details)
+        collected += len(entries)
+
+        logger.info(f"Processed page {page_count} for channel {channel_id}, total videos so far: {collected}")
+        if reached_known:
+            logger.info("Reached already stored videos for channel %s; stopping pagination", channel_id)
             break
+        if max_videos is not None and collected >= max_videos:
+            break
+
+    if pending is not None:
+        yield build_video_data(*pending)
+    logger.info("Video data collection completed for channel: %s (%s, %d videos)",
+                channel_id, source, collected)
+
 
-        time.sleep(2)  # API制限によりウェイトを増加
+def build_video_data(entries: List[VideoEntry], details) -> List[Dict]:
+    """ページの動画一覧と詳細（videos.list の結果 or その Future）を動画データにする"""
+    if not isinstance(details, list):
+        details = details.result()
+    details_by_id = {d['id']: d for d in details}
 
-    logger.info("Video data collection completed for channel: %s", channel_id)
+    video_data = []
+    for video_id, video_title, upload_date in entries:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+
+        # 詳細情報を検索
+        detail = details_by_id.get(video_id, {})
+        view_count = detail.get('statistics', {}).get('viewCount', 'N/A')
+        like_count = detail.get('statistics', {}).get('likeCount', 'N/A')
+        duration = convert_duration(detail.get('contentDetails', {}).get('duration', ''))
+
+        video_data.append({
+            'id': video_id,
+            'title': video_title,
+            'upload_date': upload_date,
+            'url': video_url,
+            'view_count': view_count,
+            'like_count': like_count,
+            'duration': duration
+        })
     return video_data
+
+
+def get_youtube_video_data(channel_id: str, api_key: str, executor: Optional[Executor] = None,
+                           source: Optional[str] = None, crawl_state: Optional[Dict] = None,
+                           known_ids: Optional[Set[str]] = None) -> List:
+    """指定したチャンネルIDから動画データを新しい順に、まとめて取得（引数は iter_youtube_video_pages と同じ）
+
+    API の失敗は YouTubeAPIError として送出する（途中までの結果は返さない）。
+    """
+    return [video for page in iter_youtube_video_pages(channel_id, api_key, executor, source,
+                                                       crawl_state, known_ids)
+            for video in page]
@@ -0,0 +1,43 @@
+"""
+読み取り系エンドポイントの HTTP 条件付きリクエスト（ETag / Last-Modified / 304）
+
+データは取り込み時にしか変わらないため、レスポンスは「データ世代 + リクエストパラメータ」で決まります。
+ETag はこの2つから計算するので、304 を返すかどうかはDBに問い合わせる前に判定できます。
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+# エンドポイントごとの Cache-Control
+# 絞り込みの選択肢は取り込み時にしか変わらないため長めに、検索結果は短めにキャッシュさせる
+CACHE_CONTROL_OPTIONS = 'public, max-age=300, stale-while-revalidate=3600'
+CACHE_CONTROL_SEARCH = 'public, max-age=60, stale-while-revalidate=300'
+
+
+def make_etag(endpoint: str, generation: int, params: Iterable[Tuple[str, str]]) -> str:
+    """エンドポイント名・データ世代・パラメータから強い ETag（引用符なし）を計算する
+
+    パラメータは並び順に依存しないようソートしてからハッシュする。
+    """
+    payload = json.dumps(
+        [endpoint, generation, sorted(params)], ensure_ascii=False, separators=(',', ':')
+    )
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+    return f"g{generation}-{digest}"
+
+
+def is_not_modified(etag: str, last_modified: Optional[datetime],
+                    if_none_match, if_modified_since: Optional[datetime]) -> bool:
+    """条件付きリクエストに 304 を返せるか判定する
+
+    if_none_match は werkzeug の ETags。If-None-Match がある場合は If-Modified-Since を見ない（RFC 9110）。
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if if_modified_since is None or last_modified is None:
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP日付は秒単位のため、ミリ秒以下を切り捨てて比較する
+    return last_modified.replace(microsecond=0) <= if_modified_since
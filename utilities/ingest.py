@@ -0,0 +1,383 @@
+"""
+YouTube からの並行取り込み
+
+チャンネルごとの取得（channels.list + search.list のページ送り）をスレッドプールで並行に行い、
+各ページの動画詳細（videos.list）は別のスレッドプールで次ページの取得と並行して取得します。
+API への送信間隔は utilities.rate_limiter の共有トークンバケットで制御するため、
+スレッド数を増やしても設定したリクエストレートを超えることはありません。
+
+- INGEST_CHANNEL_WORKERS: 同時に取得するチャンネル数（既定 4）
+- INGEST_DETAIL_WORKERS: 同時に取得する動画詳細のバッチ数（既定 4）
+
+差分取り込みでは、チャンネルごとのクロール状態（crawl_state テーブル）と取り込み済みの
+動画IDを渡すと、取り込み済みの動画に到達した時点でそのチャンネルの取得を打ち切ります。
+
+API のクォータを使い切った場合（QuotaExceededError）は、まだ始まっていないチャンネルの取得を
+行わずにエラーとして返します。
+
+結果はチャンネルの指定順に返すため、DBへの書き込み順（cid の連番）は従来と変わりません。
+
+ingest_channels は取得 → 分類 → 書き込みをページ単位のパイプラインで行います
+（チャンネルごとに取得済みのページを INGEST_QUEUE_PAGES（既定 4）ページまでキューにためて
+取得側を待たせるため、メモリ使用量はチャンネル数・動画数によらない）。
+SearchPublisher を使うと、取り込み中も INGEST_PUBLISH_INTERVAL（既定 60）秒ごとに
+search_view を更新し、書き込み済みの動画を検索に出します。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from utilities.get_channel_id import get_channel_details
+from utilities.get_videos import get_youtube_video_data, iter_youtube_video_pages
+from utilities.rate_limiter import get_youtube_rate_limiter
+from utilities.youtube_client import QuotaExceededError, get_youtube_client
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL_WORKERS = 4
+DEFAULT_DETAIL_WORKERS = 4
+DEFAULT_QUEUE_PAGES = 4
+QUEUE_POLL_SECONDS = 0.5
+# 取り込み中に search_view を更新する最短間隔（秒。INGEST_PUBLISH_INTERVAL で変更可能）
+DEFAULT_PUBLISH_INTERVAL = 60.0
+
+
+def fetch_channel(channel_id: str, api_key: str, detail_executor: Optional[Executor] = None,
+                  crawl_state: Optional[Dict[str, Any]] = None,
+                  known_ids: Optional[Set[str]] = None,
+                  quota_exhausted: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """1チャンネル分のチャンネル名と動画データを取得する（失敗しても例外は投げない）
+
+    crawl_state は取得後の状態に更新され、結果の "crawl_state" として返る。
+    quota_exhausted がセット済みなら API を呼ばずにエラーを返し、クォータ超過時はセットする。
+    """
+    started = time.perf_counter()
+    crawl_state = dict(crawl_state or {})
+    result: Dict[str, Any] = {"channel_id": channel_id, "channel_name": "N/A", "videos": [], "error": None,
+                              "crawl_state": crawl_state}
+    try:
+        if quota_exhausted is not None and quota_exhausted.is_set():
+            raise QuotaExceededError("skipped: API quota exceeded")
+        result["channel_name"] = get_channel_details(channel_id, api_key)
+        result["videos"] = get_youtube_video_data(channel_id, api_key, detail_executor,
+                                                  crawl_state=crawl_state, known_ids=known_ids)
+    except QuotaExceededError as e:
+        logger.error(f"API quota exceeded while fetching channel {channel_id}: {e}")
+        result["error"] = str(e)
+        if quota_exhausted is not None:
+            quota_exhausted.set()
+    except Exception as e:
+        logger.error(f"Error fetching channel {channel_id}: {e}")
+        result["error"] = str(e)
+    result["video_count"] = len(result["videos"])
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    logger.info("Fetched channel %s: %d videos in %.2fs",
+                channel_id, result["video_count"], result["elapsed"])
+    return result
+
+
+def fetch_channels(channel_ids: List[str], api_key: str,
+                   channel_workers: Optional[int] = None,
+                   detail_workers: Optional[int] = None,
+                   crawl_states: Optional[Dict[str, Dict[str, Any]]] = None,
+                   known_ids: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+    """複数チャンネルを並行して取得し、結果を指定順に返す
+
+    先頭のチャンネルの取得が終わった時点で返し始めるため、呼び出し側の書き込みと
+    残りのチャンネルの取得は重なって進む。
+    crawl_states（チャンネルID → クロール状態）と known_ids を渡すと差分取得になる。
+    """
+    crawl_states = crawl_states or {}
+    quota_exhausted = threading.Event()
+    channel_workers = channel_workers or int(os.getenv('INGEST_CHANNEL_WORKERS', DEFAULT_CHANNEL_WORKERS))
+    detail_workers = detail_workers or int(os.getenv('INGEST_DETAIL_WORKERS', DEFAULT_DETAIL_WORKERS))
+    logger.info("Fetching %d channels (channel workers=%d, detail workers=%d)",
+                len(channel_ids), channel_workers, detail_workers)
+
+    with ThreadPoolExecutor(max_workers=detail_workers, thread_name_prefix='yt-details') as detail_pool, \
+            ThreadPoolExecutor(max_workers=channel_workers, thread_name_prefix='yt-channel') as channel_pool:
+        futures = [
+            channel_pool.submit(fetch_channel, channel_id, api_key, detail_pool,
+                                crawl_states.get(channel_id), known_ids, quota_exhausted)
+            for channel_id in channel_ids
+        ]
+        for future in futures:
+            yield future.result()
+
+
+class _Cancelled(Exception):
+    """読み手（stream_channels の呼び出し側）が途中でやめた"""
+
+
+def _put(pages: queue.Queue, item: tuple, cancelled: threading.Event) -> None:
+    # キューが一杯なら空くまで待つ（読み手がやめた場合は取得を打ち切る）
+    while True:
+        if cancelled.is_set():
+            raise _Cancelled()
+        try:
+            pages.put(item, timeout=QUEUE_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def stream_channel(channel_id: str, api_key: str, pages: queue.Queue, cancelled: threading.Event,
+                   detail_executor: Optional[Executor] = None,
+                   crawl_state: Optional[Dict[str, Any]] = None,
+                   known_ids: Optional[Set[str]] = None,
+                   quota_exhausted: Optional[threading.Event] = None) -> None:
+    """1チャンネル分を取得し、ページごとに ('page', 動画のリスト) を pages に入れる
+
+    最後に必ず ('done', 結果) を入れる（結果は fetch_channel と同じ形で、"videos" は空）。
+    途中で失敗した場合も、それまでのページは入れたまま結果の "error" に理由を入れる。
+    """
+    started = time.perf_counter()
+    crawl_state = dict(crawl_state or {})
+    result: Dict[str, Any] = {"channel_id": channel_id, "channel_name": "N/A", "videos": [], "video_count": 0,
+                              "error": None, "crawl_state": crawl_state}
+    try:
+        if cancelled.is_set():
+            raise _Cancelled()
+        if quota_exhausted is not None and quota_exhausted.is_set():
+            raise QuotaExceededError("skipped: API quota exceeded")
+        result["channel_name"] = get_channel_details(channel_id, api_key)
+        _put(pages, ('channel', result["channel_name"]), cancelled)
+        for videos in iter_youtube_video_pages(channel_id, api_key, detail_executor,
+                                               crawl_state=crawl_state, known_ids=known_ids):
+            if videos:
+                _put(pages, ('page', videos), cancelled)
+                result["video_count"] += len(videos)
+    except _Cancelled:
+        result["error"] = "cancelled"
+        return
+    except QuotaExceededError as e:
+        logger.error(f"API quota exceeded while fetching channel {channel_id}: {e}")
+        result["error"] = str(e)
+        if quota_exhausted is not None:
+            quota_exhausted.set()
+    except Exception as e:
+        logger.error(f"Error fetching channel {channel_id}: {e}")
+        result["error"] = str(e)
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    logger.info("Fetched channel %s: %d videos in %.2fs",
+                channel_id, result["video_count"], result["elapsed"])
+    try:
+        _put(pages, ('done', result), cancelled)
+    except _Cancelled:
+        pass
+
+
+def stream_channels(channel_ids: List[str], api_key: str,
+                    channel_workers: Optional[int] = None,
+                    detail_workers: Optional[int] = None,
+                    crawl_states: Optional[Dict[str, Dict[str, Any]]] = None,
+                    known_ids: Optional[Set[str]] = None,
+                    queue_pages: Optional[int] = None) -> Iterator[Tuple[str, str, Any]]:
+    """複数チャンネルを並行して取得し、(チャンネルID, 種類, 値) をチャンネルの指定順に返す
+
+    種類は 'channel'（値はチャンネル名）、'page'（値は1ページ分の動画のリスト）、
+    'done'（値は fetch_channel と同じ形の結果。"videos" は空で、件数は "video_count"）。
+    'channel' はチャンネル名を取得できた場合だけ返る。
+
+    各チャンネルは最大 queue_pages ページ先まで取得して待つため、取得済みで書き込み待ちの
+    動画は (チャンネルの並行数 × queue_pages) ページ分を超えない。呼び出し側がページを
+    書き込んでいる間も、次のページの取得は進む。
+    """
+    crawl_states = crawl_states or {}
+    quota_exhausted = threading.Event()
+    cancelled = threading.Event()
+    channel_workers = channel_workers or int(os.getenv('INGEST_CHANNEL_WORKERS', DEFAULT_CHANNEL_WORKERS))
+    detail_workers = detail_workers or int(os.getenv('INGEST_DETAIL_WORKERS', DEFAULT_DETAIL_WORKERS))
+    queue_pages = queue_pages or int(os.getenv('INGEST_QUEUE_PAGES', DEFAULT_QUEUE_PAGES))
+    logger.info("Streaming %d channels (channel workers=%d, detail workers=%d, queued pages=%d)",
+                len(channel_ids), channel_workers, detail_workers, queue_pages)
+
+    queues = [queue.Queue(maxsize=queue_pages) for _ in channel_ids]
+    with ThreadPoolExecutor(max_workers=detail_workers, thread_name_prefix='yt-details') as detail_pool, \
+            ThreadPoolExecutor(max_workers=channel_workers, thread_name_prefix='yt-channel') as channel_pool:
+        futures = [
+            channel_pool.submit(stream_channel, channel_id, api_key, pages, cancelled, detail_pool,
+                                crawl_states.get(channel_id), known_ids, quota_exhausted)
+            for channel_id, pages in zip(channel_ids, queues)
+        ]
+        try:
+            for channel_id, pages, future in zip(channel_ids, queues, futures):
+                while True:
+                    try:
+                        kind, value = pages.get(timeout=QUEUE_POLL_SECONDS)
+                    except queue.Empty:
+                        if not future.done():
+                            continue
+                        # 待ち時間が切れた直後に最後のページや 'done' を入れて終わった場合があるため、
+                        # 終了を確認してからもう一度キューを見る（空なら本当に結果を返さずに終わっている）
+                        try:
+                            kind, value = pages.get_nowait()
+                        except queue.Empty:
+                            future.result()  # stream_channel の想定外の例外をここで送出する
+                            raise RuntimeError(f"channel {channel_id} stopped without a result")
+                    yield channel_id, kind, value
+                    if kind == 'done':
+                        break
+        finally:
+            # 途中でやめた場合は、待っている取得スレッドを止めてから終了する
+            cancelled.set()
+
+
+class SearchPublisher:
+    """取り込み中に、書き込み済みの動画を /search に出す（ingest_channels の on_channel に渡す）
+
+    /search は search_view だけを読むため、テーブルへのコミットだけでは検索に出ない。チャンネルの
+    取り込みが終わるたびに search_view を CONCURRENTLY で更新してデータ世代を進める（各ワーカーの
+    検索キャッシュが無効になる）。更新はビュー全体の再計算のため、前回から min_interval 秒以上
+    たっている場合だけ行う。取り込みの最後の公開（選択肢・タイトルインデックスを含む）は呼び出し側で行う。
+    シャドウテーブルに書き込む再構築では使わないこと（入れ替えるまで読み手に見せない）。
+    """
+
+    def __init__(self, min_interval: Optional[float] = None):
+        self.min_interval = (min_interval if min_interval is not None
+                             else float(os.getenv('INGEST_PUBLISH_INTERVAL', DEFAULT_PUBLISH_INTERVAL)))
+        self.pending = 0
+        self.publishes = 0
+        self._last_published: Optional[float] = None
+
+    def __call__(self, result: Dict[str, Any]) -> None:
+        self.pending += result.get("written", 0)
+        if not self.pending:
+            return
+        now = time.monotonic()
+        if self._last_published is not None and now - self._last_published < self.min_interval:
+            return
+        from utilities.db_access import bump_data_generation, refresh_search_view
+
+        try:
+            refresh_search_view()
+            bump_data_generation()
+        except Exception as e:
+            logger.error(f"Error publishing partial ingest results: {e}")
+            return
+        logger.info("Published %d newly written videos to search", self.pending)
+        self._last_published = now
+        self.pending = 0
+        self.publishes += 1
+
+
+def ingest_channels(channel_ids: List[str], api_key: str, loader,
+                    crawl_states: Optional[Dict[str, Dict[str, Any]]] = None,
+                    known_ids: Optional[Set[str]] = None,
+                    channel_links: Optional[List[str]] = None,
+                    fallback_names: bool = False,
+                    on_page: Optional[Callable[[int], None]] = None,
+                    on_channel: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """取得 → 分類 → 書き込みをページごとに行い、チャンネルごとの結果を指定順に返す
+
+    各ページは取得できた時点で分類し、loader（BulkLoader）でコミットするため、次のページの取得と
+    重なって進む。チャンネルは最初のページの前に cid に登録し、番号は登録済みのものを使う
+    （cid の連番はチャンネルの指定順）。コミットした行を途中で検索に出すには、on_channel に
+    SearchPublisher を渡す（チャンネルごとの結果を受け取る）。
+
+    チャンネル名を取得できない場合は、fallback_names なら仮の名前で登録し、そうでなければ
+    そのチャンネルを書き込まずにエラーにする。書き込みに失敗したページがあるチャンネルもエラーになる
+    （クロール状態は "error" のない結果だけ保存すること）。結果の "written" は書き込んだ動画数、
+    on_page はページごとに書き込んだ件数を受け取る。
+    """
+    from utilities.db_access import get_channel_number, insert_cid_data
+    from utilities.update_category_db import update_category
+
+    positions = {channel_id: number for number, channel_id in enumerate(channel_ids, start=1)}
+    results = []
+    channel_number = None
+    write_error = None
+    written = 0
+    for channel_id, kind, value in stream_channels(channel_ids, api_key, crawl_states=crawl_states,
+                                                   known_ids=known_ids):
+        position = positions[channel_id]
+        if kind == 'channel':
+            channel_name = value
+            if channel_name == "N/A" and fallback_names:
+                channel_name = f"サッカーチャンネル{position}"
+            if channel_name == "N/A":
+                write_error = "channel name unavailable"
+                logger.error(f"Failed to retrieve channel name for {channel_id}")
+                continue
+            link = channel_links[position - 1] if channel_links else f"https://www.youtube.com/channel/{channel_id}"
+            try:
+                insert_cid_data(channel_id, channel_name, link)
+                # 既存のチャンネルは登録済みの番号を使う（差分取り込みで順番が変わっても崩れない）
+                channel_number = get_channel_number(channel_id) or position
+            except Exception as e:
+                write_error = f"failed to register channel: {e}"
+                logger.error(f"Error registering channel {channel_id}: {e}")
+        elif kind == 'page':
+            if channel_number is None:
+                continue
+            try:
+                loader.add_contents(value, channel_number)
+                loader.add_categories(update_category(contents_rows(value, channel_number)))
+                loader.flush()
+            except Exception as e:
+                write_error = f"failed to write videos: {e}"
+                logger.error(f"Error writing videos for channel {channel_id}: {e}")
+                continue
+            written += len(value)
+            if on_page is not None:
+                on_page(len(value))
+        else:
+            result = value
+            if result["error"] is None and write_error is not None:
+                result["error"] = write_error
+            result["channel_number"] = channel_number
+            result["written"] = written
+            results.append(result)
+            if on_channel is not None:
+                on_channel(result)
+            channel_number, write_error, written = None, None, 0
+    return results
+
+
+def contents_rows(videos: List[Dict[str, Any]], channel_number: int) -> List[tuple]:
+    """取得した動画を update_category が受け取る形（contents テーブルの8列）にする"""
+    return [
+        (v['id'], v['title'], v['upload_date'], v['url'], v.get('view_count'),
+         v.get('like_count'), v.get('duration'), channel_number)
+        for v in videos
+    ]
+
+
+def channel_timings(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """チャンネルごとの所要時間と件数（レスポンスやログ用）"""
+    return [
+        {
+            "channel_id": result["channel_id"],
+            "videos": result["video_count"],
+            "seconds": result["elapsed"],
+            "error": result["error"],
+        }
+        for result in results
+    ]
+
+
+def log_channel_timings(results: List[Dict[str, Any]], total_seconds: float) -> None:
+    """チャンネルごとの所要時間をまとめてログに出す"""
+    for timing in channel_timings(results):
+        logger.info("  %-26s %5d videos %7.2fs%s", timing["channel_id"], timing["videos"],
+                    timing["seconds"], f" (error: {timing['error']})" if timing["error"] else "")
+    logger.info("Fetched %d channels in %.2fs (sum of channel times %.2fs), rate limiter: %s",
+                len(results), total_seconds, sum(r["elapsed"] for r in results),
+                get_youtube_rate_limiter().stats())
+    for resource, metrics in get_youtube_client().stats().items():
+        logger.info("  API %-14s %s", resource, metrics)
+    store = get_youtube_client().store
+    if store is not None:
+        logger.info("  Recorded responses: %s", store.stats())
@@ -0,0 +1,236 @@
+"""
+バックグラウンドジョブの処理本体（utilities.jobs が子プロセスで実行する）
+
+各処理は (params, progress) を受け取り、結果を JSON にできる辞書で返します。
+progress.stage() で段階を、progress.add_rows() で処理件数を報告します（/jobs/<id> で見える）。
+失敗は例外で知らせます（ジョブは failed になり、メッセージが error に入る）。
+
+子プロセスは Web ワーカーとメモリを共有しないため、データを更新した処理は publish_data_update() で
+search_view・絞り込みの選択肢を作り直してからデータ世代を進めます。各ワーカーは世代の変化を見て、
+チャンネル一覧・検索結果キャッシュ・インメモリ検索エンジンを読み直す。
+"""
+import logging
+import os
+import time
+from typing import Any, Callable, Dict
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+def publish_data_update() -> int:
+    """取り込み・更新の結果を公開する（search_view・選択肢を作り直してからデータ世代を進め、その世代を返す）"""
+    from utilities.db_access import bump_data_generation, refresh_search_view
+    from utilities.filter_options import build_filter_options_from_db
+
+    try:
+        refresh_search_view()
+    except Exception as e:
+        logger.error(f"Failed to refresh search view: {e}")
+    try:
+        build_filter_options_from_db()
+    except Exception as e:
+        logger.error(f"Failed to build filter options: {e}")
+    # 世代が進まないと各ワーカーが古いデータを返し続けるため、ここは失敗を呼び出し側に伝える
+    return bump_data_generation()
+
+
+def get_api_keys() -> list:
+    """API キー（API_KEYS のカンマ区切り、なければ API_KEY）"""
+    api_keys = [key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()]
+    if not api_keys and os.getenv('API_KEY'):
+        api_keys = [os.getenv('API_KEY')]
+    return api_keys
+
+
+def fetch_youtube_data(params: Dict[str, Any], progress) -> Dict[str, Any]:
+    """YouTubeデータを取得してデータベースに挿入する（mode=incremental なら新しい動画だけ）"""
+    from utilities.bulk_loader import BulkLoader
+    from utilities.ingest import SearchPublisher, ingest_channels, channel_timings, log_channel_timings
+    from utilities.youtube_client import get_youtube_client
+    from utilities.db_access import (create_crawl_state_table, get_crawl_state, save_crawl_state,
+                                     get_known_video_ids, create_category_table, migrate_category_table)
+    from utilities.update_category_db import classify_contents
+
+    channel_ids_str = os.getenv('CHANNEL_ID')
+    if not channel_ids_str:
+        raise ValueError("CHANNEL_ID not set")
+    channel_ids = [cid.strip() for cid in channel_ids_str.split(',')]
+    logger.info(f"Parsed channel IDs: {channel_ids}")
+
+    api_keys = get_api_keys()
+    if not api_keys:
+        raise ValueError("No API keys available")
+
+    # mode=incremental の場合は前回の位置より新しい動画だけを取得・分類する
+    incremental = params.get('mode') == 'incremental'
+    progress.stage('prepare')
+    create_crawl_state_table()
+    create_category_table()
+    migrate_category_table()
+    if incremental:
+        crawl_states = {cid: get_crawl_state(cid) for cid in channel_ids}
+        known_ids = get_known_video_ids()
+    else:
+        crawl_states, known_ids = {}, set()
+    logger.info("Ingest mode: %s", "incremental" if incremental else "full")
+
+    # チャンネル・ページ単位で並行に取得し（レートリミッターで制御）、取得できたページから順に
+    # 分類して書き込む。ジョブは公開中のテーブルに直接書き込むため、チャンネルの取り込みが終わるたびに
+    # （INGEST_PUBLISH_INTERVAL 秒に1回まで）search_view を更新して途中までの結果も検索に出す
+    progress.stage('fetch')
+    fetch_started = time.perf_counter()
+    loader = BulkLoader()
+    fetch_results = ingest_channels(channel_ids, api_keys[0], loader, crawl_states=crawl_states,
+                                    known_ids=known_ids, fallback_names=True, on_page=progress.add_rows,
+                                    on_channel=SearchPublisher())
+    total_videos = sum(result["written"] for result in fetch_results)
+    processed_channels = sum(1 for result in fetch_results if result["written"])
+    for result in fetch_results:
+        if not result["error"] and (incremental or result["written"]):
+            save_crawl_state(result["channel_id"], result["crawl_state"], result["video_count"])
+
+    log_channel_timings(fetch_results, time.perf_counter() - fetch_started)
+
+    # 残り（分類前の取り込みで入った動画・判定ルールが変わった動画）を、少しずつ読みながら分類する
+    progress.stage('classify')
+    classified = 0
+    try:
+        classified = classify_contents(on_batch=progress.add_rows)
+    except Exception as e:
+        logger.error(f"Error during category classification: {e}")
+
+    if processed_channels or classified:
+        # データ世代を進めて検索キャッシュ等を無効化
+        progress.stage('publish')
+        generation = publish_data_update()
+
+        # タイトル検索インデックスを公開した世代で作り直す（ファイルを差し替えると各ワーカーが再マップする。
+        # 作り終えるまでは世代が合わないため、短いキーワードも ILIKE で検索される）
+        progress.stage('title_index')
+        try:
+            from utilities.title_index import build_title_index_from_db
+            build_title_index_from_db(generation=generation)
+        except Exception as e:
+            logger.error(f"Error building title index: {e}")
+
+    if not total_videos and not incremental:
+        raise RuntimeError("No videos found")
+
+    logger.info(f"Processing completed. Processed {processed_channels} channels with {total_videos} total videos")
+    message = (f"Successfully processed {processed_channels} channels with {total_videos} videos"
+               if total_videos else "No new videos")
+    return {
+        "message": message,
+        "count": total_videos,
+        "channels_processed": processed_channels,
+        "classified": classified,
+        "channel_timings": channel_timings(fetch_results),
+        "api_metrics": get_youtube_client().stats(),
+    }
+
+
+def create_indexes(params: Dict[str, Any], progress) -> Dict[str, Any]:
+    """検索パフォーマンス向上のためのインデックスを作成する"""
+    from utilities.db_access import use_db_connection
+    from utilities.create_indexes import (
+        check_pg_trgm_extension, check_existing_indexes, create_indexes as create_search_indexes
+    )
+
+    with use_db_connection() as conn:
+        # 既存インデックスの確認
+        progress.stage('check')
+        existing_indexes = check_existing_indexes(conn)
+
+        # pg_trgm拡張機能の確認・作成
+        pg_trgm_available = check_pg_trgm_extension(conn)
+
+        # インデックスの作成
+        progress.stage('create')
+        created, skipped, errors = create_search_indexes(conn)
+        progress.add_rows(len(created))
+
+        # 作成後のインデックス確認
+        final_indexes = check_existing_indexes(conn)
+
+    return {
+        "message": "Index creation completed",
+        "pg_trgm_available": pg_trgm_available,
+        "created": created,
+        "skipped": skipped,
+        "errors": errors,
+        "existing_indexes_count": len(existing_indexes),
+        "final_indexes_count": len(final_indexes),
+    }
+
+
+def update_channel_names(params: Dict[str, Any], progress) -> Dict[str, Any]:
+    """既存のチャンネル名を実際のYouTubeチャンネル名で更新"""
+    from utilities.db_access import use_db_connection
+    from utilities.get_channel_id import get_channel_details
+
+    api_key = os.getenv('API_KEY')
+    if not api_key:
+        raise ValueError("API key not set")
+
+    updated_count = 0
+    errors = []
+    with use_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # 現在のチャンネル情報を取得
+            cursor.execute("SELECT cid FROM cid")
+            channels = cursor.fetchall()
+            conn.rollback()
+            progress.stage(f"update ({len(channels)} channels)")
+
+            # API の呼び出し中は cid の行ロックを持たないよう、1チャンネルずつコミットする
+            for (channel_id,) in channels:
+                try:
+                    # 実際のチャンネル名を取得
+                    channel_name = get_channel_details(channel_id, api_key)
+
+                    if channel_name != "N/A":
+                        # チャンネル名を更新（cnameカラムを使用）
+                        cursor.execute(
+                            "UPDATE cid SET cname = %s WHERE cid = %s",
+                            (channel_name, channel_id)
+                        )
+                        conn.commit()
+                        updated_count += 1
+                        progress.add_rows(1)
+                        logger.info(f"Updated channel {channel_id} to: {channel_name}")
+                    else:
+                        errors.append(f"Could not get name for channel {channel_id}")
+
+                except Exception as e:
+                    conn.rollback()
+                    errors.append(f"Error updating {channel_id}: {str(e)}")
+
+    progress.stage('publish')
+    generation = publish_data_update()
+    # タイトルは変わらないため、タイトル検索インデックスは世代だけ付け替える
+    try:
+        from utilities.title_index import restamp_title_index
+        restamp_title_index(generation - 1, generation)
+    except Exception as e:
+        logger.error(f"Error restamping title index: {e}")
+    return {
+        "success": True,
+        "updated_count": updated_count,
+        "errors": errors,
+    }
+
+
+# ジョブの種類 -> 処理（ロックは utilities.jobs.JOB_LOCKS）
+JOB_TASKS: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]] = {
+    'fetch_youtube_data': fetch_youtube_data,
+    'create_indexes': create_indexes,
+    'update_channel_names': update_channel_names,
+}
@@ -0,0 +1,348 @@
+"""
+バックグラウンドジョブ（取り込み・インデックス作成などの時間のかかる処理）
+
+/fetch-youtube-data などの処理を Web ワーカーの中で同期的に実行すると、
+唯一の gunicorn ワーカー（--workers 1）が数分間ふさがり検索が止まるため、別プロセスで実行します。
+
+- submit_job() は jobs テーブルに行を作り、切り離した子プロセス（python -m utilities.jobs）で
+  utilities.job_tasks の処理を実行してすぐにジョブIDを返す（子プロセスは Web ワーカーのメモリ・
+  接続プールを引き継がない。Web ワーカーが再起動・終了しても、子プロセスの終了を待たない）
+- 子プロセスは段階（stage）・処理件数（rows_processed）を jobs テーブルに書き込み、
+  get_job() で経過時間と一緒に読める（どのワーカー・プロセスからでも同じ状態が見える）
+- 同じロック名のジョブは同時に1つだけ（投入時は jobs の部分ユニークインデックス、
+  実行中は Postgres のアドバイザリロックで排他する。main.py の取り込みも同じロックを取る）
+- 子プロセスが異常終了した場合に備え、実行中は一定間隔で updated_at を更新し（ハートビート）、
+  JOB_STALE_SECONDS 以上更新のないジョブは失敗扱いにする
+
+- JOB_HEARTBEAT_SECONDS: ハートビートの間隔（既定 15）
+- JOB_STALE_SECONDS: この秒数ハートビートがなければ失敗扱いにする（既定 120）
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import traceback
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+
+from utilities.db_access import create_table, get_db_connection, use_db_connection
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+INGEST_LOCK = 'ingest'
+INDEX_LOCK = 'indexes'
+
+# ジョブの種類 -> ロック名（同じロック名のジョブは同時に1つしか実行しない）
+# 処理本体は utilities.job_tasks.JOB_TASKS
+JOB_LOCKS = {
+    'fetch_youtube_data': INGEST_LOCK,
+    'update_channel_names': INGEST_LOCK,
+    'create_indexes': INDEX_LOCK,
+}
+
+DEFAULT_HEARTBEAT_SECONDS = 15.0
+DEFAULT_STALE_SECONDS = 120.0
+
+JOB_COLUMNS = ('id', 'kind', 'status', 'stage', 'rows_processed', 'params', 'result', 'error',
+               'created_at', 'started_at', 'finished_at', 'elapsed_seconds')
+
+# セキュリティ: カラム名は固定値のみ
+JOB_SELECT = '''
+    SELECT id, kind, status, stage, rows_processed, params, result, error,
+           created_at, started_at, finished_at,
+           EXTRACT(EPOCH FROM COALESCE(finished_at, CURRENT_TIMESTAMP) - started_at) AS elapsed_seconds
+    FROM jobs
+'''
+
+
+class JobConflictError(Exception):
+    """同じロックを使うジョブがすでに実行中（または待機中）"""
+
+    def __init__(self, message: str, job_id: Optional[str] = None):
+        super().__init__(message)
+        self.job_id = job_id
+
+
+def create_jobs_table() -> None:
+    """`jobs`テーブルを作成（実行中のジョブはロック名ごとに1件まで）"""
+    query = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            lock_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT,
+            rows_processed BIGINT NOT NULL DEFAULT 0,
+            params JSONB,
+            result JSONB,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_lock
+            ON jobs (lock_name) WHERE status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at DESC)
+    '''
+    create_table(query)
+
+
+def lock_key(lock_name: str) -> int:
+    """アドバイザリロックのキー（ロック名から決まる固定値）"""
+    return zlib.crc32(f"soccer-jobs:{lock_name}".encode('utf-8'))
+
+
+def try_job_lock(lock_name: str) -> Optional[psycopg2.extensions.connection]:
+    """アドバイザリロックを取る（取れなければ None）
+
+    ロックは返した接続に結びつくため、処理が終わるまで接続を開いたままにし、close() で解放する。
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT pg_try_advisory_lock(%s)", (lock_key(lock_name),))
+            acquired = c.fetchone()[0]
+        conn.commit()
+    except psycopg2.Error:
+        conn.close()
+        raise
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+
+def expire_stale_jobs(stale_seconds: Optional[float] = None) -> int:
+    """ハートビートが途絶えたジョブ（子プロセスが異常終了したもの）を失敗扱いにする"""
+    if stale_seconds is None:
+        stale_seconds = float(os.getenv('JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS))
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    UPDATE jobs
+                    SET status = %s, error = 'worker stopped responding', finished_at = CURRENT_TIMESTAMP
+                    WHERE status IN %s AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """, (STATUS_FAILED, ACTIVE_STATUSES, stale_seconds))
+                expired = c.rowcount
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while expiring stale jobs: %s", e)
+                conn.rollback()
+                return 0
+    if expired:
+        logger.warning("Marked %d stale job(s) as failed", expired)
+    return expired
+
+
+def create_job(kind: str, params: Dict[str, Any]) -> str:
+    """ジョブの行を作る（同じロックのジョブが実行中なら JobConflictError）"""
+    job_id = uuid.uuid4().hex
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute("""
+                    INSERT INTO jobs (id, kind, lock_name, status, stage, params)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (job_id, kind, JOB_LOCKS[kind], STATUS_QUEUED, STATUS_QUEUED, json.dumps(params)))
+                conn.commit()
+                return job_id
+            except psycopg2.errors.UniqueViolation:
+                conn.rollback()
+                c.execute("SELECT id FROM jobs WHERE lock_name = %s AND status IN %s",
+                          (JOB_LOCKS[kind], ACTIVE_STATUSES))
+                row = c.fetchone()
+                conn.rollback()
+                raise JobConflictError(f"A {JOB_LOCKS[kind]} job is already running", row[0] if row else None)
+            except psycopg2.Error as e:
+                logger.error("Error while creating job: %s", e)
+                conn.rollback()
+                raise
+
+
+def update_job(job_id: str, **fields: Any) -> None:
+    """ジョブの状態を更新する（updated_at はハートビートを兼ねる）"""
+    # セキュリティ: カラム名はホワイトリストのもののみ
+    allowed = {'status', 'stage', 'rows_processed', 'result', 'error'}
+    assignments = ['updated_at = CURRENT_TIMESTAMP']
+    values = []
+    for name, value in fields.items():
+        if name not in allowed:
+            raise ValueError(f"unknown job field: {name}")
+        assignments.append(f"{name} = %s")
+        values.append(json.dumps(value, default=str) if name == 'result' else value)
+    if fields.get('status') == STATUS_RUNNING:
+        assignments.append("started_at = CURRENT_TIMESTAMP")
+    if fields.get('status') in (STATUS_SUCCEEDED, STATUS_FAILED):
+        assignments.append("finished_at = CURRENT_TIMESTAMP")
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = %s", (*values, job_id))
+                conn.commit()
+            except psycopg2.Error as e:
+                logger.error("Error while updating job %s: %s", job_id, e)
+                conn.rollback()
+
+
+def job_row_to_dict(row: tuple) -> Dict[str, Any]:
+    job = dict(zip(JOB_COLUMNS, row))
+    for name in ('created_at', 'started_at', 'finished_at'):
+        if job[name] is not None:
+            job[name] = job[name].isoformat()
+    if job['elapsed_seconds'] is not None:
+        job['elapsed_seconds'] = round(float(job['elapsed_seconds']), 1)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """ジョブの状態（段階・処理件数・経過秒数・結果）を取得（なければ None）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute(JOB_SELECT + " WHERE id = %s", (job_id,))
+                row = c.fetchone()
+            except psycopg2.Error as e:
+                logger.error("Error while reading job %s: %s", job_id, e)
+                conn.rollback()
+                raise
+    return job_row_to_dict(row) if row else None
+
+
+def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    """最近のジョブ（新しい順）"""
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            try:
+                c.execute(JOB_SELECT + " ORDER BY created_at DESC LIMIT %s", (limit,))
+                rows = c.fetchall()
+            except psycopg2.Error as e:
+                logger.error("Error while listing jobs: %s", e)
+                conn.rollback()
+                raise
+    return [job_row_to_dict(row) for row in rows]
+
+
+class JobProgress:
+    """処理から段階と処理件数を jobs テーブルに書き込む"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.rows_processed = 0
+
+    def stage(self, name: str) -> None:
+        logger.info("Job %s: %s", self.job_id, name)
+        update_job(self.job_id, stage=name, rows_processed=self.rows_processed)
+
+    def add_rows(self, count: int) -> None:
+        if count:
+            self.rows_processed += count
+            update_job(self.job_id, rows_processed=self.rows_processed)
+
+
+def _heartbeat(job_id: str, interval: float, stopped: threading.Event) -> None:
+    while not stopped.wait(interval):
+        update_job(job_id)
+
+
+def run_job(job_id: str, kind: str, params: Dict[str, Any]) -> None:
+    """ジョブを実行する（子プロセスのエントリポイント。結果・エラーは jobs テーブルに書く）"""
+    from utilities.job_tasks import JOB_TASKS
+
+    lock_conn = None
+    stopped = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, name=f"job-heartbeat-{job_id}", daemon=True,
+        args=(job_id, float(os.getenv('JOB_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)), stopped),
+    )
+    try:
+        # main.py など、jobs テーブルを通さない取り込みとも排他する
+        lock_conn = try_job_lock(JOB_LOCKS[kind])
+        if lock_conn is None:
+            update_job(job_id, status=STATUS_FAILED, stage='locked',
+                       error=f"Another {JOB_LOCKS[kind]} process holds the lock")
+            return
+        update_job(job_id, status=STATUS_RUNNING, stage='starting')
+        heartbeat.start()
+        progress = JobProgress(job_id)
+        result = JOB_TASKS[kind](params, progress)
+        update_job(job_id, status=STATUS_SUCCEEDED, stage='done',
+                   rows_processed=progress.rows_processed, result=result)
+        logger.info("Job %s (%s) finished", job_id, kind)
+    except Exception as e:
+        logger.error("Job %s (%s) failed: %s\n%s", job_id, kind, e, traceback.format_exc())
+        update_job(job_id, status=STATUS_FAILED, error=str(e))
+    finally:
+        stopped.set()
+        if lock_conn is not None:
+            lock_conn.close()
+
+
+# 起動した子プロセス（終了したものは submit_job のたびに回収する）
+_processes: List[subprocess.Popen] = []
+
+
+def _reap_finished() -> None:
+    _processes[:] = [process for process in _processes if process.poll() is None]
+
+
+def submit_job(kind: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """ジョブを登録して別プロセスで開始し、ジョブIDを返す（完了は待たない）
+
+    multiprocessing の子プロセスは終了時（atexit）に join されるため、gunicorn がワーカーを
+    入れ替える・止めるときにジョブが終わるまでワーカーが残ってしまう。subprocess で新しい
+    セッションとして起動し、Web ワーカーの終了やシグナルと切り離す（強制停止された場合は
+    ハートビートが途切れ、expire_stale_jobs が失敗扱いにする）。
+    """
+    if kind not in JOB_LOCKS:
+        raise ValueError(f"unknown job kind: {kind}")
+    params = params or {}
+    _reap_finished()
+    create_jobs_table()
+    expire_stale_jobs()
+    job_id = create_job(kind, params)
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [project_root, env.get('PYTHONPATH')]))
+    try:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'utilities.jobs', job_id, kind, json.dumps(params)],
+            env=env, stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+    except Exception as e:
+        update_job(job_id, status=STATUS_FAILED, error=f"Failed to start worker: {e}")
+        raise
+    _processes.append(process)
+    logger.info("Started job %s (%s) in process %s", job_id, kind, process.pid)
+    return job_id
+
+
+def main() -> None:
+    """子プロセスのエントリポイント（python -m utilities.jobs <job_id> <kind> <params_json>）"""
+    job_id, kind, params = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+    run_job(job_id, kind, params)
+
+
+if __name__ == "__main__":
+    main()
+
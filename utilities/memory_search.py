@@ -0,0 +1,388 @@
+"""
+インメモリ検索エンジン（NumPy）
+
+search_view（contents / category / cid を結合済み）をプロセス内の列配列に読み込み、/search の絞り込み・件数・並び替えを
+DBに問い合わせずにベクトル演算で処理します。
+
+- ファセット（category_title / players / level / channel）は値ごとのブールマスクで保持
+- 並び順（upload_date / view_count / like_count）は読み込み時にソート済みの行番号配列を作っておき、
+  検索時はマスクで間引くだけ（リクエストごとのソートなし）
+- 再読み込みは新しいスナップショットを別スレッドで組み立ててから参照を差し替えるため、検索中の読み手は
+  常に一貫したデータを見て、読み込みを待たない（待つのは起動後の最初の読み込みだけ）
+
+SEARCH_BACKEND=memory のときに /search で使われます（既定は db）。
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from utilities.search_query import (
+    RELEVANCE_SORT, decode_cursor, encode_cursor, has_filters, normalize_query,
+    relevance_category, validate_sort
+)
+from utilities.title_index import normalize_title
+
+try:
+    import numpy as np
+except ImportError:  # numpy がない環境では DB バックエンドのみ使用可能
+    np = None
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND_DB = 'db'
+SEARCH_BACKEND_MEMORY = 'memory'
+
+# フィルタキー -> ファセット名
+FILTER_FACETS = {
+    'type_filter': 'category_title',
+    'players_filter': 'players',
+    'level_filter': 'level',
+    'channel_filter': 'channel',
+}
+
+# 検索結果の列は utilities/search_query.RESULT_COLUMNS と同じ並び（search_view から読み込む）
+LOAD_QUERY = """
+    SELECT
+        id, title, upload_date_display, embed_url, view_count,
+        like_count, duration, channel_category, cname,
+        upload_date, category_title, players, level,
+        channel_brand_category, in_category, popularity
+    FROM search_view
+"""
+
+# 数値がNULLの行のソートキー（search_query.SORT_EXPRESSIONS の COALESCE(..., -1) と一致させる）
+NULL_COUNT_KEY = -1
+NULL_DATE_KEY = np.iinfo(np.int64).min if np is not None else None
+
+
+def get_search_backend() -> str:
+    """設定された検索バックエンド（SEARCH_BACKEND 環境変数）を返す"""
+    backend = os.getenv('SEARCH_BACKEND', SEARCH_BACKEND_DB).lower()
+    return backend if backend in (SEARCH_BACKEND_DB, SEARCH_BACKEND_MEMORY) else SEARCH_BACKEND_DB
+
+
+def _date_key(value: Optional[datetime]) -> int:
+    """日時をソートキー（エポックからのマイクロ秒）に変換"""
+    if value is None:
+        return NULL_DATE_KEY
+    return int(value.timestamp() * 1_000_000)
+
+
+def _count_value(key: int) -> Optional[int]:
+    """数値のソートキーを再生数・いいね数に戻す（NULL_COUNT_KEY は NULL）"""
+    return None if key == NULL_COUNT_KEY else int(key)
+
+
+class SearchSnapshot:
+    """ある時点のカタログを列配列として保持する（作成後は変更しない）"""
+
+    def __init__(self, records: List[tuple]):
+        self.size = len(records)
+        self.loaded_at = time.time()
+        # /search のレスポンス行（RESULT_COLUMNS と同じ形）は行ごとのタプルで持たず、列ごとに保持して
+        # ページに出す行だけ row() で組み立てる。id・再生数・いいね数は下の配列と共用する
+        self.ids = np.array([record[0] for record in records], dtype=str)
+        self.display_titles: List[str] = [record[1] for record in records]
+        self.upload_date_displays: List[Optional[str]] = [record[2] for record in records]
+        self.embed_urls: List[Optional[str]] = [record[3] for record in records]
+        self.durations: List[Optional[str]] = [record[6] for record in records]
+        self.channel_categories: List[Optional[int]] = [record[7] for record in records]
+        self.cnames: List[Optional[str]] = [record[8] for record in records]
+        self.titles = np.array([normalize_title(record[1]) for record in records], dtype=str)
+        self.upload_dates: List[Optional[datetime]] = [record[9] for record in records]
+        self.in_category = np.array([bool(record[14]) for record in records], dtype=bool)
+        self.category_titles = np.array(['' if r[10] is None else r[10] for r in records], dtype=str)
+        self.popularity = np.array([r[15] or 0.0 for r in records], dtype=np.float64)
+
+        self.sort_keys = {
+            'upload_date': np.array([_date_key(d) for d in self.upload_dates], dtype=np.int64),
+            'view_count': np.array(
+                [NULL_COUNT_KEY if r[4] is None else r[4] for r in records], dtype=np.int64),
+            'like_count': np.array(
+                [NULL_COUNT_KEY if r[5] is None else r[5] for r in records], dtype=np.int64),
+        }
+
+        # 値ごとのブールマスク（リクエストのパラメータは文字列なので、値も文字列で持つ）
+        # category / cid と結合できない行はどのファセット値にも属さない
+        facet_columns = {'category_title': 10, 'players': 11, 'level': 12, 'channel': 13}
+        self.facet_masks: Dict[str, Dict[str, Any]] = {}
+        for facet, index in facet_columns.items():
+            values = np.array(
+                ['' if r[index] is None or not r[14] else str(r[index]) for r in records], dtype=str
+            )
+            self.facet_masks[facet] = {
+                str(value): values == value for value in np.unique(values) if value != ''
+            }
+
+        # 並び替え済みの行番号（ソートキー降順、同値は id 降順）
+        self.orders: Dict[str, Any] = {}
+        for sort, keys in self.sort_keys.items():
+            self.orders[sort] = np.lexsort((self.ids, keys))[::-1]
+        self.orders[RELEVANCE_SORT] = np.lexsort((self.ids, self.popularity))[::-1]
+
+    def row(self, index: int) -> tuple:
+        """index 行目のレスポンス行（RESULT_COLUMNS と同じ形）"""
+        index = int(index)
+        return (
+            str(self.ids[index]), self.display_titles[index], self.upload_date_displays[index],
+            self.embed_urls[index], _count_value(self.sort_keys['view_count'][index]),
+            _count_value(self.sort_keys['like_count'][index]), self.durations[index],
+            self.channel_categories[index], self.cnames[index],
+        )
+
+    def match_mask(self, q: str, filters: Dict[str, str]) -> Any:
+        """検索条件に一致する行のマスクを作る"""
+        # キーワードのみの検索は category の有無を問わない（DBバックエンドと同じ挙動）
+        if q and not has_filters(filters):
+            mask = np.ones(self.size, dtype=bool)
+        else:
+            mask = self.in_category.copy()
+
+        if q:
+            mask &= np.char.find(self.titles, q.lower()) >= 0
+
+        for key, facet in FILTER_FACETS.items():
+            value = filters.get(key)
+            if value:
+                facet_mask = self.facet_masks[facet].get(str(value))
+                if facet_mask is None:
+                    return np.zeros(self.size, dtype=bool)
+                mask &= facet_mask
+        return mask
+
+    def facet_counts(self, q: str, filters: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+        """ファセットごとの件数（各ファセットは自分以外のフィルタで絞る。DBバックエンドと同じ形）"""
+        q = normalize_query(q)
+        base = self.in_category.copy()
+        if q:
+            base &= np.char.find(self.titles, q.lower()) >= 0
+
+        selected = {}
+        for key, facet in FILTER_FACETS.items():
+            value = filters.get(key)
+            if value:
+                selected[facet] = self.facet_masks[facet].get(str(value), np.zeros(self.size, dtype=bool))
+
+        facets: Dict[str, List[Dict[str, Any]]] = {}
+        for facet, masks in self.facet_masks.items():
+            scope = base.copy()
+            for other, other_mask in selected.items():
+                if other != facet:
+                    scope &= other_mask
+            facets[facet] = [
+                {"value": int(value) if facet == 'channel' else value, "count": int((scope & mask).sum())}
+                for value, mask in masks.items()
+            ]
+            facets[facet].sort(key=lambda item: str(item["value"]))
+        return facets
+
+    def sort_value(self, sort: str, index: int) -> Any:
+        """カーソルに埋め込むソート値（DBバックエンドと同じ表現）"""
+        if sort == 'upload_date':
+            return self.upload_dates[index]
+        return int(self.sort_keys[sort][index])
+
+    def seek_mask(self, sort: str, after: Tuple[Any, str]) -> Any:
+        """カーソル (ソート値, ID) より後ろ（降順で次）の行のマスク"""
+        sort_value, last_id = after
+        if sort == 'upload_date':
+            key = _date_key(datetime.fromisoformat(sort_value)) if sort_value else NULL_DATE_KEY
+        else:
+            key = int(sort_value)
+        keys = self.sort_keys[sort]
+        return (keys < key) | ((keys == key) & (self.ids < last_id))
+
+    def search(self, q: str, filters: Dict[str, str], sort: str, limit: int, offset: int,
+               cursor: Optional[str] = None) -> Tuple[int, List[tuple], Optional[str]]:
+        """検索を実行し、(総件数, 結果行, 次ページのカーソル) を返す"""
+        q = normalize_query(q)
+        sort = validate_sort(sort)
+        if sort == RELEVANCE_SORT:
+            return self.search_relevance(q, filters, limit, offset)
+        after = decode_cursor(cursor, sort) if cursor else None
+
+        mask = self.match_mask(q, filters)
+        total = int(mask.sum())
+
+        order = self.orders[sort]
+        if after is not None:
+            selected = order[(mask & self.seek_mask(sort, after))[order]]
+            page = selected[:limit]
+        else:
+            selected = order[mask[order]]
+            page = selected[offset:offset + limit]
+
+        rows = [self.row(i) for i in page]
+        next_cursor = None
+        if len(page) == limit:
+            last = int(page[-1])
+            next_cursor = encode_cursor(sort, self.sort_value(sort, last), str(self.ids[last]))
+        return total, rows, next_cursor
+
+    def search_relevance(self, q: str, filters: Dict[str, str], limit: int,
+                         offset: int) -> Tuple[int, List[tuple], None]:
+        """関連度順で検索する（DBバックエンドの build_relevance_query と同じ順序）"""
+        mask = self.match_mask(q, filters)
+        order = self.orders[RELEVANCE_SORT]
+        selected = order[mask[order]]
+        category = relevance_category(q)
+        if category is not None:
+            # キーワードのカテゴリに分類された行を先に（各段の中は popularity 順のまま）
+            first_tier = self.category_titles[selected] == category
+            selected = np.concatenate([selected[first_tier], selected[~first_tier]])
+        page = selected[offset:offset + limit]
+        return int(mask.sum()), [self.row(i) for i in page], None
+
+
+class MemorySearchEngine:
+    """スナップショットの読み込みと差し替えを管理する
+
+    データ世代が変わったら mark_stale() でスナップショットを「古い」とし、別スレッドで新しい
+    スナップショットを組み立ててから参照を差し替える。組み立て中も検索は古いスナップショットで答え、
+    リクエストが読み込みを待つのは、まだ1度も読み込んでいないときだけ。
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[SearchSnapshot] = None
+        self._reload_lock = threading.Lock()
+        self._stale = False
+        self._reload_requested = False
+        self._reload_thread: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        """numpy が使えるか（使えない場合は DB バックエンドにフォールバックする）"""
+        return np is not None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def stale(self) -> bool:
+        return self._stale
+
+    def load(self, conn: psycopg2.extensions.connection) -> SearchSnapshot:
+        """DBから全件を読み込み、新しいスナップショットに差し替える（読み込み中も検索は古いものを使う）"""
+        if np is None:
+            raise RuntimeError("numpy is not installed; the memory search backend is unavailable")
+        with self._reload_lock:
+            return self._load_locked(conn)
+
+    def snapshot(self, connect: Callable[[], psycopg2.extensions.connection]) -> SearchSnapshot:
+        """現在のスナップショット
+
+        未読み込みのときだけ connect() で接続を取得して読み込む（同時に来たリクエストは、ロックを待った後に
+        読み込み済みかを確かめ直し、最初の1件が読み込んだものを使う）。古いと印が付いていれば、
+        そのまま返しつつ別スレッドでの読み直しを始める。
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if self._stale:
+                self.refresh_in_background()
+            return snapshot
+        if np is None:
+            raise RuntimeError("numpy is not installed; the memory search backend is unavailable")
+        with self._reload_lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                return snapshot
+            return self._load_locked(connect())
+
+    def _load_locked(self, conn: psycopg2.extensions.connection) -> SearchSnapshot:
+        """全件を読み込んで差し替える（_reload_lock を持った状態で呼ぶ）"""
+        started = time.perf_counter()
+        self._reload_requested = False
+        with conn.cursor() as c:
+            c.execute(LOAD_QUERY)
+            records = c.fetchall()
+        conn.rollback()
+        snapshot = SearchSnapshot(records)
+        # 参照の代入はアトミックなので、読み手は古いか新しいかのどちらかを見る
+        self._snapshot = snapshot
+        # 読み込み中に世代が変わっていれば古いままにしておく（もう1度読み直す）
+        self._stale = self._reload_requested
+        logger.info("Memory search snapshot loaded: %d rows in %.3fs",
+                    snapshot.size, time.perf_counter() - started)
+        return snapshot
+
+    def mark_stale(self) -> None:
+        """データが更新されたことを記録し、別スレッドで読み直す（それまでは古いスナップショットで答える）"""
+        if self._snapshot is None:
+            return  # 未読み込みなら次の検索で読み込まれる
+        self._stale = True
+        self._reload_requested = True
+        self.refresh_in_background()
+
+    def refresh_in_background(self) -> bool:
+        """読み直しのスレッドを開始する（すでに読み込み中なら何もしない。開始したら True）"""
+        if np is None or not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._reload_thread = threading.Thread(
+                target=self._reload_worker, name='memory-search-reload', daemon=True
+            )
+            self._reload_thread.start()
+        except Exception:
+            self._reload_lock.release()
+            raise
+        return True
+
+    def _reload_worker(self) -> None:
+        """_reload_lock を持った状態で、専用の接続から読み直して差し替える"""
+        from utilities.db_access import use_db_connection
+
+        try:
+            with use_db_connection() as conn:
+                self._load_locked(conn)
+        except Exception as e:
+            # 失敗した場合は古いスナップショットを使い続け、次の検索で読み直しを再試行する
+            logger.error("Failed to reload memory search snapshot: %s", e)
+            self._reload_requested = False
+            return
+        finally:
+            self._reload_lock.release()
+        if self._reload_requested:
+            # 読み込み中にさらに世代が変わった
+            self.refresh_in_background()
+
+    def search(self, connect: Callable[[], psycopg2.extensions.connection], q: str,
+               filters: Dict[str, str], sort: str, limit: int, offset: int,
+               cursor: Optional[str] = None) -> Tuple[int, List[tuple], Optional[str]]:
+        """検索を実行する（connect は未読み込みのときだけ呼ばれる）"""
+        return self.snapshot(connect).search(q, filters, sort, limit, offset, cursor)
+
+    def facet_counts(self, connect: Callable[[], psycopg2.extensions.connection], q: str,
+                     filters: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+        """ファセットごとの件数を返す（connect は未読み込みのときだけ呼ばれる）"""
+        return self.snapshot(connect).facet_counts(q, filters)
+
+    def stats(self) -> Dict[str, Any]:
+        """読み込み状況を返す"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "stale": self._stale,
+            "rows": snapshot.size,
+            "loaded_at": datetime.fromtimestamp(snapshot.loaded_at).isoformat(),
+            "facet_values": {facet: len(masks) for facet, masks in snapshot.facet_masks.items()},
+        }
+
+
+# プロセス内で共有するエンジン
+memory_search_engine = MemorySearchEngine()
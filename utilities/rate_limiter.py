@@ -0,0 +1,94 @@
+"""
+YouTube Data API へのリクエスト間隔を制御するトークンバケット
+
+取り込みは複数スレッドから並行して API を呼ぶため、固定の time.sleep ではなく
+プロセス全体で共有する1つのバケットで秒間リクエスト数を制限します。
+
+- YOUTUBE_RATE_LIMIT: 1秒あたりに補充されるトークン数（既定 5）
+- YOUTUBE_RATE_BURST: バケットの容量（一度に連続して送れるリクエスト数、既定 10）
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 10
+
+
+class RateLimiter:
+    """スレッドセーフなトークンバケット
+
+    トークンが足りない場合は予約（残量をマイナスにする）してからロックの外で待つため、
+    待っているスレッドが他のスレッドの取得を妨げることはなく、到着順に送信時刻が割り当てられる。
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """tokens 個のトークンを取得する（必要なら待つ）。待った秒数を返す"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.acquired += 1
+            if wait > 0:
+                self.waits += 1
+                self.waited_seconds += wait
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """取得回数と待ち時間の合計"""
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.capacity,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+_youtube_rate_limiter: Optional[RateLimiter] = None
+_youtube_rate_limiter_lock = threading.Lock()
+
+
+def get_youtube_rate_limiter() -> RateLimiter:
+    """YouTube API 用の共有リミッターを取得（初回呼び出し時に環境変数から作成）"""
+    global _youtube_rate_limiter
+    with _youtube_rate_limiter_lock:
+        if _youtube_rate_limiter is None:
+            rate = float(os.getenv('YOUTUBE_RATE_LIMIT', DEFAULT_RATE))
+            burst = float(os.getenv('YOUTUBE_RATE_BURST', DEFAULT_BURST))
+            _youtube_rate_limiter = RateLimiter(rate, burst)
+            logger.info("YouTube rate limiter: %.1f req/s (burst %d)", rate, burst)
+        return _youtube_rate_limiter
@@ -0,0 +1,137 @@
+"""
+YouTube API レスポンスの記録・再生
+
+分類ロジックやスキーマを変えるたびに本番 API を叩き直してクォータを消費しないよう、
+YouTube クライアントのレスポンスをディスクに保存し、後から同じ取り込みをオフラインで再現します。
+
+- YOUTUBE_RESPONSE_MODE:
+    passthrough（既定）: 保存も再生もしない
+    record: API のレスポンスを保存する（API は通常どおり呼ぶ）
+    replay: 保存済みのレスポンスだけを返す（API は呼ばない。未保存ならエラー）
+- YOUTUBE_RESPONSE_STORE: 保存先ディレクトリ（既定 ./data/youtube_responses）
+
+キーはリソース名とパラメータ（API キーは除く）の SHA-256 で、同じリクエストは同じファイルになります。
+ファイルは {先頭2文字}/{キー}.json に一時ファイル経由で書き込みます（os.replace で差し替え）。
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MODE_PASSTHROUGH = 'passthrough'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+RESPONSE_MODES = (MODE_PASSTHROUGH, MODE_RECORD, MODE_REPLAY)
+
+DEFAULT_RESPONSE_STORE_PATH = './data/youtube_responses'
+
+# キーに含めないパラメータ（API キーが変わっても同じレスポンスとして扱う）
+IGNORED_PARAMS = {'key'}
+
+
+def make_response_key(resource: str, params: Optional[Dict[str, Any]]) -> str:
+    """リソース名とパラメータからキーを作る（パラメータの順序に依存しない）"""
+    normalized = sorted(
+        (name, str(value)) for name, value in (params or {}).items() if name not in IGNORED_PARAMS
+    )
+    payload = json.dumps([resource, normalized], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseStore:
+    """リクエストごとのレスポンス本文をファイルに保存・読み込みする（スレッドセーフ）"""
+
+    def __init__(self, directory: str, mode: str = MODE_RECORD):
+        if mode not in RESPONSE_MODES:
+            raise ValueError(f"unknown response mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == MODE_RECORD
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, resource: str, params: Optional[Dict[str, Any]]) -> Optional[Any]:
+        """保存済みのレスポンス本文を返す（ない・壊れている場合は None）"""
+        path = self.path_for(make_response_key(resource, params))
+        try:
+            with open(path, encoding='utf-8') as f:
+                body = json.load(f)['body']
+        except FileNotFoundError:
+            body = None
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Failed to load recorded response %s: %s", path, e)
+            body = None
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def save(self, resource: str, params: Optional[Dict[str, Any]], body: Any) -> None:
+        """レスポンス本文を保存する（アトミックに差し替え）"""
+        key = make_response_key(resource, params)
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        record = {
+            'resource': resource,
+            'params': {name: value for name, value in (params or {}).items() if name not in IGNORED_PARAMS},
+            'body': body,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.response.')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.writes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+def get_response_mode() -> str:
+    """記録・再生のモード（不明な値は passthrough）"""
+    mode = os.getenv('YOUTUBE_RESPONSE_MODE', MODE_PASSTHROUGH).lower()
+    return mode if mode in RESPONSE_MODES else MODE_PASSTHROUGH
+
+
+def get_response_store() -> Optional[ResponseStore]:
+    """環境変数に応じたストア（passthrough なら None）"""
+    mode = get_response_mode()
+    if mode == MODE_PASSTHROUGH:
+        return None
+    directory = os.getenv('YOUTUBE_RESPONSE_STORE', DEFAULT_RESPONSE_STORE_PATH)
+    logger.info("YouTube responses: %s (%s)", mode, directory)
+    return ResponseStore(directory, mode)
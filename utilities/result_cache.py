@@ -0,0 +1,123 @@
+"""
+/search の結果キャッシュ
+
+検索はカテゴリボタン・並び替え・1ページ目の組み合わせが大半で、同じ条件が繰り返し来ます。
+正規化した検索条件をキーにレスポンスを保持し、LRU で件数とおおよそのサイズを制限します。
+データ世代（utilities.db_access.get_data_generation）が変わったら丸ごと破棄します。
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utilities.search_query import FILTER_CONDITIONS, normalize_query
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def make_search_cache_key(q: str, filters: Dict[str, str], sort: str, limit: int, offset: int,
+                          cursor: Optional[str] = None, facets: bool = False,
+                          backend: str = 'db') -> Tuple:
+    """検索条件を正規化してキャッシュキーにする
+
+    キーワードは NFKC 正規化 + 小文字化（ILIKE は大文字小文字を区別しないため結果は同じ）。
+    """
+    return (
+        normalize_query(q).lower(),
+        tuple((key, str(filters.get(key) or '')) for key in FILTER_CONDITIONS),
+        sort,
+        limit,
+        offset,
+        cursor or '',
+        bool(facets),
+        backend,
+    )
+
+
+class SearchResultCache:
+    """データ世代で無効化される LRU キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation: int) -> None:
+        if self._generation != generation:
+            if self._entries:
+                self.invalidations += 1
+                logger.info("Search cache invalidated (generation %s -> %s, %d entries dropped)",
+                            self._generation, generation, len(self._entries))
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, key: Tuple, generation: int) -> Optional[Any]:
+        """キャッシュ済みの値を返す（なければ None）"""
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple, generation: int, value: Any) -> None:
+        """値を保存し、上限を超えたら古いものから捨てる"""
+        size = len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率などの統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,395 @@
+"""
+/search 用の検索クエリ構築・実行モジュール
+
+件数（COUNT(*) OVER()）と表示ページを1本のSQLでまとめて取得します。
+IDリストをPython側に展開して IN (...) に渡すことはしません。
+検索は取り込み時に contents / category / cid を結合済みの search_view だけを読みます
+（utilities/db_access.SEARCH_VIEW_QUERY）。
+"""
+import base64
+import json
+import logging
+import os
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from utilities.db_access import get_data_generation
+from utilities.title_index import get_title_index
+from utilities.update_category_db import assign_category
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# セキュリティ: ORDER BY に使用できるカラムのホワイトリスト
+ALLOWED_SORT_COLUMNS = ['upload_date', 'view_count', 'like_count', 'relevance']
+DEFAULT_SORT = 'upload_date'
+
+# 関連度順（キーセットのカーソルには対応せず、offset でページングする）
+RELEVANCE_SORT = 'relevance'
+
+# ソートキーの式（NULLを最小値として扱い、キーセットの比較が欠けないようにする）
+# db_access.SEARCH_VIEW_INDEXES の (式 DESC, id DESC) インデックスと一致させること
+# memory_search の NULL_DATE_KEY / NULL_COUNT_KEY とも同じ順序になる（NULL は降順の最後）
+NULL_DATE_SORT_KEY = "'-infinity'::timestamptz"
+SORT_EXPRESSIONS = {
+    'upload_date': f"COALESCE(c.upload_date, {NULL_DATE_SORT_KEY})",
+    'view_count': "COALESCE(c.view_count, -1)",
+    'like_count': "COALESCE(c.like_count, -1)",
+}
+
+# カーソルに入れるソート値の式（-infinity は Python の datetime で表せないため、日付は NULL のまま返す）
+CURSOR_VALUE_EXPRESSIONS = {
+    'upload_date': "c.upload_date",
+}
+
+# キーセットの比較でカーソルの値を受けるプレースホルダ（NULL をソート式と同じ最小値に置き換える）
+SEEK_PLACEHOLDERS = {
+    'upload_date': f"COALESCE(%s::timestamptz, {NULL_DATE_SORT_KEY})",
+}
+
+# /search が返すカラム（convert_activities と順番を合わせる）
+# 表示用の日付・埋め込みURLは取り込み時に計算済みのカラムをそのまま返す
+RESULT_COLUMNS = """
+    c.id, c.title, c.upload_date_display, c.embed_url, c.view_count,
+    c.like_count, c.duration, c.channel_category, c.cname
+"""
+
+# ファセット名 -> (カラム, 対応するフィルタキー)
+FACET_COLUMNS = {
+    'category_title': ('c.category_title', 'type_filter'),
+    'players': ('c.players', 'players_filter'),
+    'level': ('c.level', 'level_filter'),
+    'channel': ('c.channel_brand_category', 'channel_filter'),
+}
+
+# pg_trgm のインデックスが効く最短のキーワード長（これより短い場合はタイトルインデックスを使う）
+TRIGRAM_MIN_QUERY_LENGTH = 3
+
+# タイトルインデックスの一致IDを SQL に渡す上限（超える場合は ILIKE。TITLE_INDEX_MAX_IDS で変更可能）
+TITLE_INDEX_MAX_IDS = 2000
+
+# フィルタキー -> 条件式
+FILTER_CONDITIONS = {
+    'type_filter': "c.category_title = %s",
+    'players_filter': "c.players = %s",
+    'level_filter': "c.level = %s",
+    'channel_filter': "c.channel_brand_category = %s",
+}
+
+
+def normalize_query(q: Optional[str]) -> str:
+    """検索キーワードを正規化する（全角/半角の揺れを吸収）"""
+    if not q:
+        return ""
+    return unicodedata.normalize('NFKC', q.strip())
+
+
+def validate_sort(sort: Optional[str]) -> str:
+    """sortパラメータをホワイトリストで検証する"""
+    return sort if sort in ALLOWED_SORT_COLUMNS else DEFAULT_SORT
+
+
+def encode_cursor(sort: str, sort_value: Any, last_id: str) -> str:
+    """最後の行の (ソート値, ID) を不透明なカーソル文字列にする"""
+    if isinstance(sort_value, datetime):
+        # TIMESTAMPTZ はISO 8601文字列で保持し、比較時にPostgreSQL側で型解決させる
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort, sort_value, last_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, str]:
+    """カーソル文字列を (ソート値, ID) に戻す。不正な場合は ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if cursor_sort != sort or not isinstance(last_id, str):
+        raise ValueError("Cursor does not match the requested sort")
+    return sort_value, last_id
+
+
+def has_filters(filters: Dict[str, str]) -> bool:
+    """いずれかのフィルタが指定されているか"""
+    return any(filters.get(key) for key in FILTER_CONDITIONS)
+
+
+def build_where_clause(q: str, filters: Dict[str, str],
+                       title_ids: Optional[List[str]] = None,
+                       category_only: Optional[bool] = None) -> Tuple[str, str, List]:
+    """FROM句とWHERE句、パラメータを構築する
+
+    title_ids が指定された場合は、タイトルの部分一致を ILIKE ではなく
+    タイトルインデックスで求めたIDの配列（1つの配列パラメータ）で絞り込む。
+    category_only が None の場合は、キーワードのみの検索だけ分類済みの行に限定しない。
+    """
+    params: List = []
+    conditions = ["1=1"]
+
+    if category_only is None:
+        category_only = not q or has_filters(filters)
+
+    # キーワードのみの検索は未分類の動画も対象にする（従来の category を結合しない検索と同じ母集団）
+    from_clause = "FROM search_view c"
+    if category_only:
+        conditions.append("c.in_category")
+
+    if q and title_ids is not None:
+        conditions.append("c.id = ANY(%s)")
+        params.append(title_ids)
+    elif q:
+        conditions.append("c.title ILIKE %s")
+        params.append(f"%{q}%")
+
+    for key, condition in FILTER_CONDITIONS.items():
+        if filters.get(key):
+            conditions.append(condition)
+            params.append(filters[key])
+
+    return from_clause, "WHERE " + " AND ".join(conditions), params
+
+
+def build_search_query(q: str, filters: Dict[str, str], sort: str, limit: int, offset: int,
+                       after: Optional[Tuple[Any, str]] = None,
+                       title_ids: Optional[List[str]] = None) -> Tuple[str, List]:
+    """件数とページを同時に取得するSQLを構築する
+
+    after に (ソート値, ID) を渡すとキーセット方式（OFFSETなし）でその次の行から取得する。
+    """
+    sort = validate_sort(sort)
+    sort_expr = SORT_EXPRESSIONS[sort]
+    from_clause, where_clause, params = build_where_clause(q, filters, title_ids)
+
+    if after is None:
+        total_expr = "COUNT(*) OVER()"
+        seek_clause = ""
+        page_clause = "LIMIT %s OFFSET %s"
+        page_params = [limit, offset]
+    else:
+        # シーク条件を付けるとウィンドウ件数は残り件数になるため、総件数はサブクエリで取る
+        total_expr = f"(SELECT count(*) {from_clause} {where_clause})"
+        params = params + params
+        seek_clause = f"AND ({sort_expr}, c.id) < ({SEEK_PLACEHOLDERS.get(sort, '%s')}, %s)"
+        params.extend(after)
+        page_clause = "LIMIT %s"
+        page_params = [limit]
+
+    # セキュリティ: ホワイトリスト検証済みのsort式のみ使用
+    query = f"""
+        SELECT {RESULT_COLUMNS}, {CURSOR_VALUE_EXPRESSIONS.get(sort, sort_expr)} AS sort_value,
+            {total_expr} AS total
+        {from_clause}
+        {where_clause}
+        {seek_clause}
+        ORDER BY {sort_expr} DESC, c.id DESC
+        {page_clause}
+    """
+    params.extend(page_params)
+    return query, params
+
+
+def relevance_category(q: str) -> Optional[str]:
+    """キーワードが表すカテゴリ（取り込み時の分類と同じ規則。該当なしは None）"""
+    if not q:
+        return None
+    category = assign_category(q)
+    return None if category == 'その他' else category
+
+
+def build_relevance_query(q: str, filters: Dict[str, str], limit: int, offset: int,
+                          title_ids: Optional[List[str]] = None) -> Tuple[str, List]:
+    """関連度順のページを取得するSQLを構築する
+
+    キーワードが表すカテゴリに分類された動画（例: 「ドリブル」ならドリブル練習）を第1段、
+    タイトルに偶然含まれるだけの動画を第2段とし、各段の中は取り込み時に計算した
+    popularity の降順に並べる。各段は (popularity DESC, id DESC) インデックスを使って
+    先頭 offset + limit 件だけを取り出し、一致した全行をリクエストごとに並べ替えることはしない。
+    """
+    from_clause, where_clause, where_params = build_where_clause(q, filters, title_ids)
+    category = relevance_category(q)
+    top_k = offset + limit
+
+    def tier_query(tier: int, condition: str) -> str:
+        return f"""
+            (SELECT {RESULT_COLUMNS}, {tier} AS tier, c.popularity
+            {from_clause}
+            {where_clause} {condition}
+            ORDER BY c.popularity DESC, c.id DESC
+            LIMIT %s)
+        """
+
+    if category is None:
+        tiers = tier_query(0, "")
+        params = where_params + [top_k]
+    else:
+        tiers = (tier_query(0, "AND c.category_title = %s") + " UNION ALL "
+                 + tier_query(1, "AND c.category_title IS DISTINCT FROM %s"))
+        params = where_params + [category, top_k] + where_params + [category, top_k]
+
+    query = f"""
+        SELECT * FROM ({tiers}) ranked
+        ORDER BY tier, popularity DESC, id DESC
+        LIMIT %s OFFSET %s
+    """
+    return query, params + [limit, offset]
+
+
+def build_count_query(q: str, filters: Dict[str, str],
+                      title_ids: Optional[List[str]] = None) -> Tuple[str, List]:
+    """総件数のみを取得するSQLを構築する"""
+    from_clause, where_clause, params = build_where_clause(q, filters, title_ids)
+    return f"SELECT count(*) {from_clause} {where_clause}", params
+
+
+def build_facet_query(q: str, filters: Dict[str, str],
+                      title_ids: Optional[List[str]] = None) -> Tuple[str, List]:
+    """ファセットごとの件数を1回のスキャンで求めるSQLを構築する
+
+    各ファセットの件数は「キーワード + そのファセット以外のフィルタ」に一致する行で数える
+    （選択中の値を変えた場合に何件になるかが分かるように）。
+    GROUPING SETS で4つのファセットをまとめて集計し、ファセットごとの条件は FILTER 句で与える。
+    """
+    # ファセットは分類済みの行で数える（フィルタ付き検索と同じ母集団）
+    # フィルタ条件は各ファセットの FILTER 句で与えるため、WHERE句はキーワードのみ
+    from_clause, where_clause, where_params = build_where_clause(
+        q, {}, title_ids, category_only=True
+    )
+
+    select_parts = []
+    params: List = []
+    for column, _ in FACET_COLUMNS.values():
+        select_parts.append(f"{column}, GROUPING({column})")
+    for column, own_filter in FACET_COLUMNS.values():
+        others = []
+        for key, condition in FILTER_CONDITIONS.items():
+            if key != own_filter and filters.get(key):
+                others.append(condition)
+                params.append(filters[key])
+        select_parts.append(f"count(*) FILTER (WHERE {' AND '.join(others) or 'TRUE'})")
+
+    grouping_sets = ", ".join(f"({column})" for column, _ in FACET_COLUMNS.values())
+    query = f"""
+        SELECT {', '.join(select_parts)}
+        {from_clause}
+        {where_clause}
+        GROUP BY GROUPING SETS ({grouping_sets})
+    """
+    return query, params + where_params
+
+
+def execute_facet_counts(conn: psycopg2.extensions.connection, q: str,
+                         filters: Dict[str, str]) -> Dict[str, List[Dict[str, Any]]]:
+    """ファセットごとの件数を {ファセット名: [{value, count}, ...]} で返す"""
+    q = normalize_query(q)
+    query, params = build_facet_query(q, filters, lookup_title_ids(q))
+    with conn.cursor() as c:
+        c.execute(query, params)
+        rows = c.fetchall()
+
+    facet_names = list(FACET_COLUMNS)
+    n = len(facet_names)
+    facets: Dict[str, List[Dict[str, Any]]] = {facet: [] for facet in facet_names}
+    for row in rows:
+        for i, facet in enumerate(facet_names):
+            value, grouping = row[2 * i], row[2 * i + 1]
+            if grouping == 0:
+                if value is not None and value != '':
+                    facets[facet].append({"value": value, "count": row[2 * n + i]})
+                break
+    for values in facets.values():
+        values.sort(key=lambda item: str(item["value"]))
+    return facets
+
+
+def lookup_title_ids(q: str) -> Optional[List[str]]:
+    """pg_trgm が使えない短いキーワードは、タイトルインデックスで一致IDを求める
+
+    次の場合は None（ILIKE で検索）:
+    - 長いキーワード、インデックスファイルがない場合
+    - インデックスの世代が現在のデータ世代と違う場合（search_view と内容がずれている可能性がある）
+    - 一致件数が TITLE_INDEX_MAX_IDS を超える場合。よく出る語（「パス」など）は ID の配列を SQL に
+      渡すより、ソート順のインデックスを先頭から ILIKE で絞るほうが LIMIT 件で早く止まる
+    """
+    if not q or len(q) >= TRIGRAM_MIN_QUERY_LENGTH:
+        return None
+    index = get_title_index()
+    if index is None:
+        return None
+    try:
+        generation = get_data_generation()
+    except Exception as e:
+        logger.error("Failed to read data generation for title index: %s", e)
+        return None
+    if index.generation != generation:
+        logger.info("Title index generation %d does not match data generation %d; using ILIKE",
+                    index.generation, generation)
+        return None
+    doc_numbers = index.search_doc_numbers(q)
+    if len(doc_numbers) > int(os.getenv('TITLE_INDEX_MAX_IDS', TITLE_INDEX_MAX_IDS)):
+        return None
+    return index.doc_ids(doc_numbers)
+
+
+def execute_search(conn: psycopg2.extensions.connection, q: str, filters: Dict[str, str],
+                   sort: str, limit: int, offset: int,
+                   cursor: Optional[str] = None) -> Tuple[int, List[tuple], Optional[str]]:
+    """検索を実行し、(総件数, 結果行, 次ページのカーソル) を返す
+
+    cursor が指定された場合は offset を無視してキーセット方式で取得する。
+    不正なカーソルは ValueError。関連度順はカーソルを使わず offset でページングする。
+    """
+    q = normalize_query(q)
+    sort = validate_sort(sort)
+    if sort == RELEVANCE_SORT:
+        return execute_relevance_search(conn, q, filters, limit, offset)
+    after = decode_cursor(cursor, sort) if cursor else None
+    title_ids = lookup_title_ids(q)
+    query, params = build_search_query(q, filters, sort, limit, offset, after, title_ids)
+
+    with conn.cursor() as c:
+        c.execute(query, params)
+        rows = c.fetchall()
+
+        if rows:
+            total = rows[-1][-1]
+        elif offset > 0 or after is not None:
+            # 範囲外のページではウィンドウ件数が取れないため、件数だけ別途取得する
+            count_query, count_params = build_count_query(q, filters, title_ids)
+            c.execute(count_query, count_params)
+            total = c.fetchone()[0]
+        else:
+            total = 0
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, last[-2], last[0])
+
+    return total, [row[:-2] for row in rows], next_cursor
+
+
+def execute_relevance_search(conn: psycopg2.extensions.connection, q: str, filters: Dict[str, str],
+                             limit: int, offset: int) -> Tuple[int, List[tuple], Optional[str]]:
+    """関連度順で検索を実行し、(総件数, 結果行, None) を返す"""
+    title_ids = lookup_title_ids(q)
+    query, params = build_relevance_query(q, filters, limit, offset, title_ids)
+    count_query, count_params = build_count_query(q, filters, title_ids)
+
+    with conn.cursor() as c:
+        c.execute(query, params)
+        rows = c.fetchall()
+        c.execute(count_query, count_params)
+        total = c.fetchone()[0]
+
+    return total, [row[:-2] for row in rows], None
@@ -0,0 +1,324 @@
+"""
+タイトル部分一致検索用の n-gram（1文字 + 2文字）転置インデックス
+
+pg_trgm は3文字単位のため、「パス」「守備」のような2文字の日本語キーワードではインデックスが効かず
+シーケンシャルスキャンになります。このモジュールは取り込み時に NFKC 正規化したタイトルから
+1-gram / 2-gram の転置インデックスを作り、メモリマップ可能な1ファイルに保存します。
+
+- 検索: クエリの n-gram ごとのポスティングリストを積集合 → 3文字以上は実タイトルで部分一致を確認
+- 読み込みは np.memmap によるゼロコピーのため、gunicorn の複数ワーカーでもページキャッシュを共有
+- ファイルは一時ファイルに書いてから os.replace で差し替えるため、読み手が壊れたファイルを見ることはない
+- ヘッダーには作成時のデータ世代を持ち、検索側は現在の世代と一致するときだけ使う
+  （data/ はマシンごとのローカルファイルのため、取り込みが失敗して古いまま残ることがある）
+
+ファイル形式（リトルエンディアン、各配列は8バイト境界に配置）:
+    magic(8) | header: uint64 x 6 (n_docs, n_keys, n_postings, id_bytes, title_bytes, generation)
+    keys: uint64[n_keys]            n-gram コード（昇順）
+    key_offsets: uint64[n_keys + 1] postings 内の開始位置
+    postings: uint32[n_postings]    文書番号（各リスト内で昇順）
+    id_offsets: uint64[n_docs + 1]  | id_blob: UTF-8
+    title_offsets: uint64[n_docs + 1] | title_blob: UTF-8（正規化済みタイトル）
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy がない環境ではインデックスを使わず ILIKE で検索する
+    np = None
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SPTIDX02'
+HEADER_FIELDS = 6
+# ヘッダー内のデータ世代の位置
+GENERATION_OFFSET = len(MAGIC) + 5 * 8
+DEFAULT_INDEX_PATH = './data/title_index.bin'
+
+
+def get_title_index_path() -> str:
+    """インデックスファイルのパス（TITLE_INDEX_PATH 環境変数で変更可能）"""
+    return os.getenv('TITLE_INDEX_PATH', DEFAULT_INDEX_PATH)
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """部分一致用にタイトルを正規化（NFKC + 小文字化。ILIKE と同じく大文字小文字を区別しない）"""
+    return unicodedata.normalize('NFKC', title or '').lower()
+
+
+def gram_code(text: str) -> int:
+    """1文字または2文字を64bitのコードにする（1文字の場合は下位32bitが0）"""
+    if len(text) == 1:
+        return ord(text) << 32
+    return (ord(text[0]) << 32) | ord(text[1])
+
+
+def title_grams(title: str) -> set:
+    """タイトルに含まれる 1-gram / 2-gram のコード集合"""
+    codes = {ord(ch) << 32 for ch in title}
+    codes.update((ord(a) << 32) | ord(b) for a, b in zip(title, title[1:]))
+    return codes
+
+
+def query_grams(query: str) -> List[int]:
+    """クエリの検索に必要な n-gram コード（2文字以上なら 2-gram のみ）"""
+    if len(query) == 1:
+        return [gram_code(query)]
+    return sorted({gram_code(query[i:i + 2]) for i in range(len(query) - 1)})
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _blob(values: List[str]) -> Tuple[bytes, List[int]]:
+    """文字列リストを UTF-8 の連結バイト列と開始位置の配列にする"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = [0]
+    for item in encoded:
+        offsets.append(offsets[-1] + len(item))
+    return b''.join(encoded), offsets
+
+
+def build_title_index(documents: Iterable[Tuple[str, str]], path: str, generation: int = 0) -> int:
+    """(video_id, title) の列からインデックスファイルを作成し、文書数を返す
+
+    generation はこのインデックスが表すデータ世代（search_view と同じ内容になっている世代）。
+    """
+    if np is None:
+        raise RuntimeError("numpy is not installed; cannot build the title index")
+
+    ids: List[str] = []
+    titles: List[str] = []
+    postings_by_gram: Dict[int, List[int]] = defaultdict(list)
+    for doc_no, (video_id, title) in enumerate(documents):
+        normalized = normalize_title(title)
+        ids.append(video_id)
+        titles.append(normalized)
+        for code in title_grams(normalized):
+            postings_by_gram[code].append(doc_no)
+
+    keys = np.array(sorted(postings_by_gram), dtype='<u8')
+    key_offsets = np.zeros(len(keys) + 1, dtype='<u8')
+    postings_parts = []
+    for i, code in enumerate(keys.tolist()):
+        doc_list = postings_by_gram[code]
+        key_offsets[i + 1] = key_offsets[i] + len(doc_list)
+        postings_parts.append(np.array(doc_list, dtype='<u4'))
+    postings = np.concatenate(postings_parts) if postings_parts else np.zeros(0, dtype='<u4')
+
+    id_blob, id_offsets = _blob(ids)
+    title_blob, title_offsets = _blob(titles)
+
+    sections = [
+        np.array([len(ids), len(keys), len(postings), len(id_blob), len(title_blob), generation],
+                 dtype='<u8').tobytes(),
+        keys.tobytes(),
+        key_offsets.tobytes(),
+        postings.tobytes(),
+        np.array(id_offsets, dtype='<u8').tobytes(),
+        id_blob,
+        np.array(title_offsets, dtype='<u8').tobytes(),
+        title_blob,
+    ]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.title_index.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            for section in sections:
+                f.write(section)
+                f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        # 読み手は古いファイル（inode）を開いたままでも安全に差し替えられる
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info("Title index written to %s: %d documents, %d grams, %d postings (generation %d)",
+                path, len(ids), len(keys), len(postings), generation)
+    return len(ids)
+
+
+class TitleIndex:
+    """メモリマップしたインデックスファイルを検索する"""
+
+    def __init__(self, path: str):
+        if np is None:
+            raise RuntimeError("numpy is not installed; cannot load the title index")
+        self.path = path
+        stat = os.stat(path)
+        # os.replace で差し替えられたかを (inode, 更新時刻) で判定する
+        self.version = (stat.st_ino, stat.st_mtime_ns)
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Not a title index file: {path}")
+
+        offset = len(MAGIC)
+        header = self._view('<u8', HEADER_FIELDS, offset)
+        n_docs, n_keys, n_postings, id_bytes, title_bytes, generation = (int(v) for v in header)
+        offset = _aligned(offset + HEADER_FIELDS * 8)
+
+        self.size = n_docs
+        self.generation = generation
+        self.keys = self._view('<u8', n_keys, offset)
+        offset = _aligned(offset + n_keys * 8)
+        self.key_offsets = self._view('<u8', n_keys + 1, offset)
+        offset = _aligned(offset + (n_keys + 1) * 8)
+        self.postings = self._view('<u4', n_postings, offset)
+        offset = _aligned(offset + n_postings * 4)
+        self.id_offsets = self._view('<u8', n_docs + 1, offset)
+        offset = _aligned(offset + (n_docs + 1) * 8)
+        self.id_blob = self._data[offset:offset + id_bytes]
+        offset = _aligned(offset + id_bytes)
+        self.title_offsets = self._view('<u8', n_docs + 1, offset)
+        offset = _aligned(offset + (n_docs + 1) * 8)
+        self.title_blob = self._data[offset:offset + title_bytes]
+
+    def _view(self, dtype: str, count: int, offset: int):
+        return np.frombuffer(self._data, dtype=dtype, count=count, offset=offset)
+
+    def _posting_list(self, code: int):
+        i = int(np.searchsorted(self.keys, code))
+        if i >= len(self.keys) or int(self.keys[i]) != code:
+            return None
+        return self.postings[int(self.key_offsets[i]):int(self.key_offsets[i + 1])]
+
+    def _doc_id(self, doc_no: int) -> str:
+        start, end = int(self.id_offsets[doc_no]), int(self.id_offsets[doc_no + 1])
+        return bytes(self.id_blob[start:end]).decode('utf-8')
+
+    def _doc_title(self, doc_no: int) -> str:
+        start, end = int(self.title_offsets[doc_no]), int(self.title_offsets[doc_no + 1])
+        return bytes(self.title_blob[start:end]).decode('utf-8')
+
+    def search_doc_numbers(self, query: str):
+        """クエリを部分一致で含む文書番号の配列（昇順）"""
+        query = normalize_title(query.strip())
+        if not query:
+            return np.arange(self.size, dtype=np.uint32)
+
+        # 短いポスティングリストから積集合を取る
+        lists = []
+        for code in query_grams(query):
+            posting = self._posting_list(code)
+            if posting is None:
+                return np.zeros(0, dtype=np.uint32)
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for posting in lists[1:]:
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+            if len(candidates) == 0:
+                return candidates
+
+        # 3文字以上は 2-gram が全部含まれていても連続しているとは限らないため、実タイトルで確認
+        if len(query) > 2:
+            candidates = np.array(
+                [doc_no for doc_no in candidates.tolist() if query in self._doc_title(doc_no)],
+                dtype=np.uint32,
+            )
+        return candidates
+
+    def doc_ids(self, doc_numbers) -> List[str]:
+        """文書番号の配列を動画IDのリストにする"""
+        return [self._doc_id(doc_no) for doc_no in doc_numbers.tolist()]
+
+    def search(self, query: str) -> List[str]:
+        """クエリを部分一致で含む動画IDのリスト"""
+        return self.doc_ids(self.search_doc_numbers(query))
+
+
+_loaded_index: Optional[TitleIndex] = None
+_loaded_index_lock = threading.Lock()
+
+
+def get_title_index() -> Optional[TitleIndex]:
+    """インデックスファイルを読み込む（ファイルが更新されていれば再マップ、なければ None）"""
+    global _loaded_index
+    path = get_title_index_path()
+    if np is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat.st_ino, stat.st_mtime_ns)
+    with _loaded_index_lock:
+        if _loaded_index is None or _loaded_index.path != path or _loaded_index.version != version:
+            try:
+                _loaded_index = TitleIndex(path)
+                logger.info("Title index loaded from %s (%d documents)", path, _loaded_index.size)
+            except (OSError, ValueError) as e:
+                logger.error("Failed to load title index: %s", e)
+                _loaded_index = None
+        return _loaded_index
+
+
+def build_title_index_from_db(path: Optional[str] = None, generation: Optional[int] = None) -> int:
+    """contents テーブルからインデックスファイルを作成する
+
+    取り込みを公開（search_view の更新 + データ世代を進める）した後に、その世代を渡して呼ぶ。
+    作り終えるまでの間、検索は世代が一致しない古いインデックスを使わず ILIKE で行う。
+    """
+    from utilities.db_access import get_data_generation, use_db_connection
+
+    path = path or get_title_index_path()
+    if generation is None:
+        generation = get_data_generation(max_age=0)
+    with use_db_connection() as conn:
+        with conn.cursor() as c:
+            c.execute("SELECT id, title FROM contents ORDER BY id")
+            documents = c.fetchall()
+    return build_title_index(documents, path, generation)
+
+
+def restamp_title_index(previous_generation: int, generation: int, path: Optional[str] = None) -> bool:
+    """タイトルが変わらない更新（チャンネル名の変更など）で世代だけ進んだときに、インデックスの世代を付け替える
+
+    previous_generation のインデックスだけを付け替える（すでに古いインデックスは古いまま）。
+    コピーを書き換えてから os.replace するため、読み手がマップ中のファイルは変わらない。
+    """
+    path = path or get_title_index_path()
+    try:
+        index = TitleIndex(path)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.info("Title index not restamped: %s", e)
+        return False
+    if index.generation != previous_generation:
+        logger.info("Title index is at generation %d, not %d; not restamped",
+                    index.generation, previous_generation)
+        return False
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.title_index.')
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp_path)
+        with open(tmp_path, 'r+b') as f:
+            f.seek(GENERATION_OFFSET)
+            f.write(np.array([generation], dtype='<u8').tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info("Title index restamped: generation %d -> %d", previous_generation, generation)
+    return True
@@ -1,7 +1,9 @@
+import hashlib
 import re
+import time
 import unicodedata
 import logging
-from typing import List, Tuple
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
 
 
 # ロガーの設定
@@ -15,114 +17,162 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# カテゴリの判定ルール（上から順に最初に一致したものを使う）
+CATEGORY_PATTERNS: List[Tuple[str, str]] = [
+    (r"\d対\d", "対人"),
+    (r"パス", "パス"),
+    (r"ドリブル", "ドリブル"),
+    (r"シュート", "シュート"),
+    (r"キック", "キック"),
+    (r"ビルドアップ", "ビルドアップ"),
+    (r"(GK|キーパー)", "キーパー"),
+    (r"(守備|ディフェンス)", "ディフェンス"),
+    (r"(フィジカル|アジリティ|ストレッチ|ラダー)", "フィジカル"),
+    (r"(考え方|コンセプト|指導)", "コンセプト/考え方"),
+]
 
-def assign_category(title: str) -> str:
-    """タイトルに基づいてカテゴリを割り当てる"""
-    logger.info("Starting category assignment for title: %s", title)
-
-    patterns: List[Tuple[str, str]] = [
-        (r"\d対\d", "対人"),
-        (r"パス", "パス"),
-        (r"ドリブル", "ドリブル"),
-        (r"シュート", "シュート"),
-        (r"キック", "キック"),
-        (r"ビルドアップ", "ビルドアップ"),
-        (r"(GK|キーパー)", "キーパー"),
-        (r"(守備|ディフェンス)", "ディフェンス"),
-        (r"(フィジカル|アジリティ|ストレッチ|ラダー)", "フィジカル"),
-        (r"(考え方|コンセプト|指導)", "コンセプト/考え方"),
-    ]
-    for pattern, category in patterns:
-        if re.search(pattern, title):
-            logger.info("Category '%s' matched for pattern '%s'", category, pattern)
-            return category
+# 人数の判定ルール（「n人」を「n対n」より優先）
+NUMBER_PATTERNS: Tuple[str, str] = (r"(\d+)人", r"(\d+)対(\d+)")
 
-    logger.info("No category matched, returning 'その他'")
-    return "その他"
+# レベルの判定ルール（一致しなければ DEFAULT_LEVEL）
+LEVEL_PATTERNS: List[Tuple[str, str]] = [
+    (r"(高校|高等)", "高校生"),
+    (r"(中学|中等)", "中学生"),
+    (r"ユース", "ユース"),
+]
+DEFAULT_LEVEL = "小学生以上"
 
+# 判定ルールを変えた場合に上げる（ルール以外の判定処理を変えたとき用）
+CLASSIFIER_REVISION = 1
 
-def to_half_width(text: str) -> str:
-    """全角→半角変換（数字・アルファベット・記号）"""
-    text = unicodedata.normalize("NFKC", text)  # Unicode正規化
-    text = re.sub(r"[０-９]", lambda x: chr(ord(x.group(0)) - 0xFEE0), text)  # 全角数字を半角に
-    return text.strip()  # 余分な空白削除
 
+def classifier_version() -> str:
+    """判定ルールのハッシュ（category.classifier_version に保存し、ルールが変わった行だけ分類し直す）"""
+    rules = repr((CLASSIFIER_REVISION, CATEGORY_PATTERNS, NUMBER_PATTERNS, LEVEL_PATTERNS, DEFAULT_LEVEL))
+    return hashlib.sha256(rules.encode('utf-8')).hexdigest()[:16]
 
-def assign_number(title: str) -> str:
-    """タイトルに基づいて必要人数を割り当てる"""
-    title = to_half_width(title)  # 全角→半角変換
-    logger.info("Starting number assignment for title: %s", title)
 
-    if match := re.search(r"(\d+)人", title):
-        logger.info("Number of people found: %s人", match.group(1))
-        return f"{match.group(1)}人"
+CLASSIFIER_VERSION = classifier_version()
 
-    if match := re.search(r"(\d+)対(\d+)", title):
-        num1, num2 = int(match.group(1)), int(match.group(2))  # 数値化
-        bigger, smaller = max(num1, num2), min(num1, num2)  # 大小比較
-        logger.info("Number of people found: %s対%s (normalized to %s対%s)",
-                    num1, num2, bigger, smaller)
-        return f"{bigger}対{smaller}"  # 大きい数を前にする
 
-    logger.info("No number found, returning empty string.")
-    return "人数指定なし"
+# NFKC で「人」「対」になる文字（⼈ U+2F08・㆟ U+319F）。これらも「人」「対」も含まないタイトルは
+# 正規化しても人数のパターンに一致しないため、正規化を省略できる（NUMBER_PATTERNS を変えたら見直すこと）
+NUMBER_MARKERS = re.compile("[人対\u2f08\u319f]")
 
 
-def assign_level(title: str) -> str:
-    """タイトルに基づいてレベルを割り当てる"""
-    logger.info("Starting level assignment for title: %s", title)
+class TitleClassifier:
+    """タイトルからカテゴリ・人数・レベルを判定する（正規表現はインスタンス作成時に1回だけコンパイル）
 
-    levels: List[Tuple[str, str]] = [
-        (r"(高校|高等)", "高校生"),
-        (r"(中学|中等)", "中学生"),
-        (r"ユース", "ユース"),
-    ]
-    for pattern, level in levels:
-        if re.search(pattern, title):
-            logger.info("Level '%s' matched for pattern '%s'", level, pattern)
-            return level
+    判定の優先順位は CATEGORY_PATTERNS などのルールの並び順のまま（上から順に最初に一致したもの）。
+    大量のタイトルを処理するため、判定中はログを出さない。
+    """
+
+    def __init__(self, category_patterns: Sequence[Tuple[str, str]] = CATEGORY_PATTERNS,
+                 number_patterns: Tuple[str, str] = NUMBER_PATTERNS,
+                 level_patterns: Sequence[Tuple[str, str]] = LEVEL_PATTERNS,
+                 default_level: str = DEFAULT_LEVEL):
+        # ルールをまとめた1つの正規表現（先読みの選択）も試したが、re では固定文字列の高速検索が
+        # 効かなくなり、コンパイル済みのパターンを順に search するより遅かった
+        self._categories = [(re.compile(pattern).search, label) for pattern, label in category_patterns]
+        self._levels = [(re.compile(pattern).search, label) for pattern, label in level_patterns]
+        self._players = re.compile(number_patterns[0]).search
+        self._versus = re.compile(number_patterns[1]).search
+        self.default_level = default_level
+
+    def category(self, title: str) -> str:
+        for search, label in self._categories:
+            if search(title):
+                return label
+        return "その他"
+
+    def number(self, title: str) -> str:
+        """人数（全角数字などは NFKC で半角にしてから判定。「n人」を「n対n」より優先）"""
+        if not NUMBER_MARKERS.search(title):
+            return "人数指定なし"
+        if not unicodedata.is_normalized("NFKC", title):
+            title = unicodedata.normalize("NFKC", title)
+        if match := self._players(title):
+            return f"{match.group(1)}人"
+        if match := self._versus(title):
+            num1, num2 = int(match.group(1)), int(match.group(2))
+            return f"{max(num1, num2)}対{min(num1, num2)}"  # 大きい数を前にする
+        return "人数指定なし"
+
+    def level(self, title: str) -> str:
+        for search, label in self._levels:
+            if search(title):
+                return label
+        return self.default_level
+
+    def classify(self, title: str) -> Tuple[str, str, str]:
+        """(カテゴリ, 人数, レベル) を返す"""
+        return self.category(title), self.number(title), self.level(title)
+
+    def classify_many(self, titles: Iterable[str]) -> List[Tuple[str, str, str]]:
+        return [self.classify(title) for title in titles]
+
+
+_title_classifier: Optional[TitleClassifier] = None
+
+
+def get_title_classifier() -> TitleClassifier:
+    """現在の判定ルールでコンパイルした共有の分類器"""
+    global _title_classifier
+    if _title_classifier is None:
+        _title_classifier = TitleClassifier()
+    return _title_classifier
 
-    logger.info("No level matched, returning '小学生以上'")
-    return "小学生以上"
+
+def assign_category(title: str) -> str:
+    """タイトルに基づいてカテゴリを割り当てる"""
+    return get_title_classifier().category(title)
+
+
+def to_half_width(text: str) -> str:
+    """全角→半角変換（数字・アルファベット・記号。NFKC で全角数字も半角になる）"""
+    return unicodedata.normalize("NFKC", text).strip()
+
+
+def assign_number(title: str) -> str:
+    """タイトルに基づいて必要人数を割り当てる（全角数字は半角にしてから判定）"""
+    return get_title_classifier().number(title)
+
+
+def assign_level(title: str) -> str:
+    """タイトルに基づいてレベルを割り当てる"""
+    return get_title_classifier().level(title)
 
 
 def update_category(contents):
     """
     メイン処理: テーブルを作成し、カテゴリデータを更新
     """
+    classifier = get_title_classifier()
+    started = time.perf_counter()
     try:
-        logger.info("Fetching contents from the database...")
         contents_data = []
 
         for content in contents:
             # contentsテーブルの構造に応じてデータを取得
             if len(content) >= 8:  # channel_categoryカラムを含む場合
-                content_id, title, upload_date, video_url, view_count, like_count, duration, channel_category = content
+                content_id, title, channel_category = content[0], content[1], content[7]
             else:  # 古い形式の場合
                 content_id, title, *_ = content
                 channel_category = None
 
-            # カテゴリの予測
-            category = assign_category(title)
-            if category == "その他":
-                category = "その他"  # 冗長なコードを削除
-
-            # プレイヤー数の予測
-            number_of_players = assign_number(title) or ""  # 空文字列をデフォルトに設定
+            # カテゴリ・プレイヤー数・レベルの予測
+            category, number_of_players, level = classifier.classify(title)
 
-            # レベルの予測
-            level = assign_level(title)
-
-            # カテゴリデータをデータベースに挿入
             contents_data.append({
                 "id": content_id,
                 "category": category,
                 "nop": number_of_players,
                 "level": level,
-                "channel_id": channel_category
+                "channel_id": channel_category,
+                "classifier_version": CLASSIFIER_VERSION
             })
 
-        logger.info("Category assignment completed successfully.")
+        logger.info("Classified %d titles in %.3fs", len(contents_data), time.perf_counter() - started)
     #
     except Exception as e:
         logger.error("An error occurred during the main process: %s", e)
@@ -131,6 +181,35 @@ def update_category(contents):
     return contents_data
 
 
+def classify_contents(loader=None, batch_size: Optional[int] = None,
+                      on_batch: Optional[Callable[[int], None]] = None) -> int:
+    """分類が必要な動画を batch_size 行ずつ読み、分類して category テーブルに一括書き込みする
+
+    contents はサーバーサイドカーソルで少しずつ読み、各バッチは BulkLoader で書き込むため、
+    メモリ使用量はカタログ全体の件数によらない。loader を渡すとその BulkLoader に書き込み
+    （失敗したバッチ数などを呼び出し側で確認できる）、最後に flush する。分類した件数を返す。
+    on_batch はバッチごとに分類した件数を受け取る（ジョブの進捗報告用）。
+    """
+    from utilities.bulk_loader import BulkLoader
+    from utilities.db_access import iter_unclassified_contents
+
+    loader = loader or BulkLoader()
+    classified = 0
+    without_channel = 0
+    for batch in iter_unclassified_contents(CLASSIFIER_VERSION, batch_size):
+        contents_data = update_category(batch)
+        without_channel += sum(1 for content in contents_data if not content["channel_id"])
+        loader.add_categories(contents_data)
+        classified += len(contents_data)
+        if on_batch is not None:
+            on_batch(len(contents_data))
+    loader.flush()
+    if without_channel:
+        logger.warning("%d classified contents have no channel", without_channel)
+    logger.info("Classified %d contents", classified)
+    return classified
+
+
 # if __name__ == "__main__":
 #     try:
 #         main()
@@ -0,0 +1,235 @@
+"""
+YouTube Data API クライアント
+
+YouTube へのリクエストはすべてこのモジュールを通して送ります。
+
+- requests.Session を共有して接続を再利用する（Keep-Alive。毎回の TCP/TLS ハンドシェイクをなくす）
+- すべてのリクエストにタイムアウトを付ける
+- 429・5xx・一時的な 403（rateLimitExceeded など）・通信エラーは指数バックオフで再試行する
+  （Retry-After があればそれに従う）
+- クォータ超過（quotaExceeded / dailyLimitExceeded）は再試行せず QuotaExceededError を投げる
+- それ以外の失敗は YouTubeAPIError を投げる（空の結果を返して取り込みが途中で切れるのを防ぐ）
+- リソースごとのリクエスト数・再試行数・エラー数・レイテンシを集計する
+
+送信間隔は utilities.rate_limiter の共有トークンバケットで制御します（再試行も1回として数える）。
+utilities.response_store のストアを渡すと、成功したレスポンスを記録（record）したり、
+API を呼ばずに記録済みのレスポンスを返したり（replay）できます。
+
+- YOUTUBE_TIMEOUT: 1リクエストのタイムアウト秒数（既定 10）
+- YOUTUBE_MAX_RETRIES: 再試行の最大回数（既定 4）
+- YOUTUBE_BACKOFF_BASE: バックオフの基準秒数（既定 0.5。0.5, 1, 2, 4 ... 秒 + ゆらぎ）
+- YOUTUBE_POOL_SIZE: 接続プールの大きさ（既定 16。取り込みの同時スレッド数以上にする）
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utilities.rate_limiter import RateLimiter, get_youtube_rate_limiter
+from utilities.response_store import ResponseStore, get_response_store
+
+# ロガーの設定
+logging.basicConfig(
+    level=logging.INFO,  # ログレベルを INFO に設定
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()  # 標準出力にログを表示
+    ]
+)
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = 'https://www.googleapis.com/youtube/v3'
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_POOL_SIZE = 16
+MAX_BACKOFF_SECONDS = 60.0
+
+# 再試行するステータスコード
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# 403 のうち、クォータ超過（当日中は回復しない）として扱う理由
+QUOTA_ERROR_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+# 403 のうち、時間をおけば回復する理由
+RATE_LIMIT_ERROR_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class YouTubeAPIError(Exception):
+    """YouTube API の呼び出しに失敗した（再試行しても回復しなかった）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, reason: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class QuotaExceededError(YouTubeAPIError):
+    """API キーのクォータを使い切った（再試行しても無駄なので呼び出し側で打ち切る）"""
+
+
+def error_reason(response: requests.Response) -> Optional[str]:
+    """エラーレスポンスの理由（error.errors[0].reason）を取り出す"""
+    try:
+        errors = response.json().get('error', {}).get('errors', [])
+    except ValueError:
+        return None
+    return errors[0].get('reason') if errors else None
+
+
+class YouTubeClient:
+    """接続を再利用し、失敗時に再試行する YouTube API クライアント（スレッドセーフ）"""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, pool_size: int = DEFAULT_POOL_SIZE,
+                 session: Optional[requests.Session] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 store: Optional[ResponseStore] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.rate_limiter = rate_limiter
+        self.store = store
+        self._sleep = sleep
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, resource: str, params: Dict[str, Any], etag: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """API（例: resource='videos'）を呼び出して JSON を返す
+
+        etag を渡すと条件付きリクエストになり、変更がなければ（304）None を返す。
+        replay 中は etag を使わず、記録済みのレスポンスを返す。
+        """
+        if self.store is not None and self.store.replaying:
+            return self._replay(resource, params)
+        headers = {'If-None-Match': etag} if etag else None
+        response = self._send(resource, f"{API_BASE_URL}/{resource}", params, headers)
+        if response.status_code == 304:
+            return None
+        data = response.json()
+        if self.store is not None and self.store.recording:
+            self.store.save(resource, params, data)
+        return data
+
+    def get_page(self, url: str) -> str:
+        """YouTube のページ（HTML）を取得する"""
+        params = {'url': url}
+        if self.store is not None and self.store.replaying:
+            return self._replay('page', params)
+        text = self._send('page', url, None, None).text
+        if self.store is not None and self.store.recording:
+            self.store.save('page', params, text)
+        return text
+
+    def _replay(self, resource: str, params: Dict[str, Any]) -> Any:
+        body = self.store.load(resource, params)
+        if body is None:
+            raise YouTubeAPIError(f"{resource}: response not recorded (replay mode)")
+        return body
+
+    def _send(self, resource: str, url: str, params: Optional[Dict[str, Any]],
+              headers: Optional[Dict[str, str]]) -> requests.Response:
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(resource, time.perf_counter() - started, error=True)
+                # URL には API キーが含まれるため、ログには例外の種類だけを出す
+                message = f"{resource}: {type(e).__name__}"
+                if attempt >= self.max_retries:
+                    raise YouTubeAPIError(message) from e
+                self._backoff(resource, attempt, message, None)
+                attempt += 1
+                continue
+            elapsed = time.perf_counter() - started
+
+            status = response.status_code
+            if status < 400:
+                self._record(resource, elapsed)
+                return response
+
+            self._record(resource, elapsed, error=True)
+            reason = error_reason(response)
+            message = f"{resource}: HTTP {status}" + (f" ({reason})" if reason else "")
+            if status == 403 and reason in QUOTA_ERROR_REASONS:
+                raise QuotaExceededError(message, status, reason)
+            retryable = status in RETRY_STATUS_CODES or (status == 403 and reason in RATE_LIMIT_ERROR_REASONS)
+            if not retryable or attempt >= self.max_retries:
+                raise YouTubeAPIError(message, status, reason)
+            self._backoff(resource, attempt, message, response.headers.get('Retry-After'))
+            attempt += 1
+
+    def _backoff(self, resource: str, attempt: int, message: str, retry_after: Optional[str]) -> None:
+        """再試行前に待つ（Retry-After 優先、なければ指数バックオフ + ゆらぎ）"""
+        try:
+            delay = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            delay = None
+        if delay is None:
+            delay = self.backoff_base * (2 ** attempt) * (1 + random.random() / 2)
+        delay = min(delay, MAX_BACKOFF_SECONDS)
+        with self._lock:
+            self._metrics[resource]['retries'] += 1
+        logger.warning("YouTube API %s; retrying in %.2fs (attempt %d/%d)",
+                       message, delay, attempt + 1, self.max_retries)
+        self._sleep(delay)
+
+    def _record(self, resource: str, elapsed: float, error: bool = False) -> None:
+        with self._lock:
+            metrics = self._metrics.setdefault(resource, {
+                'requests': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            metrics['requests'] += 1
+            metrics['total_seconds'] += elapsed
+            metrics['max_seconds'] = max(metrics['max_seconds'], elapsed)
+            if error:
+                metrics['errors'] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """リソースごとのリクエスト数・エラー数・再試行数・平均/最大レイテンシ（ミリ秒）"""
+        with self._lock:
+            return {
+                resource: {
+                    'requests': m['requests'],
+                    'errors': m['errors'],
+                    'retries': m['retries'],
+                    'avg_ms': round(m['total_seconds'] * 1000 / m['requests'], 1) if m['requests'] else 0.0,
+                    'max_ms': round(m['max_seconds'] * 1000, 1),
+                }
+                for resource, m in self._metrics.items()
+            }
+
+
+_youtube_client: Optional[YouTubeClient] = None
+_youtube_client_lock = threading.Lock()
+
+
+def get_youtube_client() -> YouTubeClient:
+    """共有クライアントを取得（初回呼び出し時に環境変数から作成）"""
+    global _youtube_client
+    with _youtube_client_lock:
+        if _youtube_client is None:
+            _youtube_client = YouTubeClient(
+                timeout=float(os.getenv('YOUTUBE_TIMEOUT', DEFAULT_TIMEOUT)),
+                max_retries=int(os.getenv('YOUTUBE_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+                backoff_base=float(os.getenv('YOUTUBE_BACKOFF_BASE', DEFAULT_BACKOFF_BASE)),
+                pool_size=int(os.getenv('YOUTUBE_POOL_SIZE', DEFAULT_POOL_SIZE)),
+                rate_limiter=get_youtube_rate_limiter(),
+                store=get_response_store(),
+            )
+        return _youtube_client